@@ -14,13 +14,14 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 
 from django.core.asgi import get_asgi_application
 import notifications.routing
+from notifications.dispatch import EventLoopMiddleware
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
-application = ProtocolTypeRouter({
+application = EventLoopMiddleware(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             notifications.routing.websocket_urlpatterns
         )
     ),
-})
+}))
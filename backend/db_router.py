@@ -0,0 +1,113 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+
+class RoutingState:
+    """What the current request allows the router to do."""
+
+    def __init__(self, pinned=False):
+        # A write happened recently in this client's session
+        self.pinned = pinned
+        # The view opted safe reads into the replicas
+        self.replica_reads = False
+        # This request has written to the primary
+        self.wrote = False
+
+    @property
+    def use_replica(self):
+        return self.replica_reads and not (self.pinned or self.wrote)
+
+
+_state = ContextVar("database_routing", default=None)
+
+
+def reads_from_replica():
+    """Whether reads in the current request are routed to a replica."""
+    state = _state.get()
+    return state is not None and state.use_replica and bool(settings.DATABASE_REPLICAS)
+
+
+@contextmanager
+def primary_reads():
+    """Route the reads inside the block to the primary.
+
+    For reads whose result outlives the request, such as entries of a
+    shared cache that every client is served, which must not be filled
+    from a replica that is behind.
+    """
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    replica_reads, state.replica_reads = state.replica_reads, False
+    try:
+        yield
+    finally:
+        state.replica_reads = replica_reads
+
+
+class ReplicaRouter:
+    """Send reads to a replica when the current request allows it.
+
+    Outside a request routed by ReplicaRoutingMiddleware, or with no
+    DATABASE_REPLICAS configured, everything uses ``default``. Any write
+    flags the request so its later reads go to the primary as well.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reads_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Track routing per request and keep clients that wrote on the primary.
+
+    A request that writes, or uses an unsafe method, sets a cookie for
+    DATABASE_REPLICA_PIN_SECONDS; while it is present the client's reads
+    skip the replicas, so it always sees its own writes despite replica lag.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = settings.DATABASE_REPLICA_PIN_COOKIE
+        state = RoutingState(pinned=cookie in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                cookie, "1", max_age=settings.DATABASE_REPLICA_PIN_SECONDS, httponly=True, samesite="Lax"
+            )
+        return response
+
+
+class ReplicaReadsMixin:
+    """Let safe requests to this viewset read from the replicas."""
+
+    def initial(self, request, *args, **kwargs):
+        state = _state.get()
+        if state is not None and request.method in SAFE_METHODS:
+            state.replica_reads = True
+        super().initial(request, *args, **kwargs)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -57,6 +58,17 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Shared tier of the form schema cache (FORM_SCHEMA_CACHE_ALIAS)
+    "schema": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/1",
+    },
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware', 
@@ -66,7 +78,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-   
+    'backend.db_router.ReplicaRoutingMiddleware',
    
 ]
 
@@ -94,12 +106,65 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connections are kept open for CONN_MAX_AGE seconds and checked before
+# reuse. The "replica" alias is a local stand-in for a read replica (same
+# file here, a separate database under test); it only serves reads when
+# listed in DATABASE_REPLICAS.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
 }
+DATABASE_REPLICAS = []
+
+
+def postgres_database(host):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'onboarding'),
+        'USER': os.environ.get('POSTGRES_USER', 'onboarding'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if os.environ.get('POSTGRES_POOL_MAX_SIZE'):
+        # psycopg 3 connection pool (Django 5.1+); replaces persistent connections
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ['POSTGRES_POOL_MAX_SIZE']),
+                'timeout': 10,
+            },
+        }
+    return database
+
+
+# POSTGRES_HOST switches to PostgreSQL; POSTGRES_REPLICA_HOSTS is a
+# comma-separated list of streaming replicas, each becoming replica<n>
+if os.environ.get('POSTGRES_HOST'):
+    DATABASES = {'default': postgres_database(os.environ['POSTGRES_HOST'])}
+    for number, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), 1):
+        DATABASES[f'replica{number}'] = postgres_database(host.strip())
+    DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# Safe requests to views using ReplicaReadsMixin read from a random replica.
+# A request that writes reads the primary from then on, and its client is
+# pinned to the primary for DATABASE_REPLICA_PIN_SECONDS through a cookie.
+DATABASE_ROUTERS = ['backend.db_router.ReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = 10
+DATABASE_REPLICA_PIN_COOKIE = 'db_primary_pin'
 
 
 # Password validation
@@ -175,4 +240,92 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'Africa/Nairobi'
\ No newline at end of file
+CELERY_TIMEZONE = 'Africa/Nairobi'
+
+# Bulk submission import (POST /api/submissions/import/)
+SUBMISSION_IMPORT_CHUNK_SIZE = 500
+SUBMISSION_IMPORT_MAX_CHUNK_SIZE = 5000
+SUBMISSION_IMPORT_MAX_ERRORS = 1000
+
+# Streaming submission export (GET /api/forms/{id}/export/)
+SUBMISSION_EXPORT_CHUNK_SIZE = 2000
+
+# How new submissions store their answers: "rows" (one ClientSubmissionData
+# row per answer, typed and indexed) or "document" (one JSON document on the
+# submission). Both are read alike; convert_submission_storage moves
+# existing submissions between them
+SUBMISSION_STORAGE = 'rows'
+
+# Idempotency-Key on POST /api/submissions/: responses are replayed for
+# IDEMPOTENCY_KEY_TTL seconds; a key held longer than
+# IDEMPOTENCY_LOCK_TIMEOUT by an unfinished request may be taken over.
+# Recent responses are also kept in a per-process LRU of this many entries
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+IDEMPOTENCY_CACHE_SIZE = 1000
+
+# Submission search (GET /api/submissions/search/) over answers to fields
+# marked "searchable" in the form schema
+SUBMISSION_SEARCH_MIN_PREFIX = 3
+SUBMISSION_SEARCH_MAX_RESULTS = 100
+
+# Form schema cache: immutable versions sit in a per-process LRU in front of
+# the shared cache; mutable entries expire after FORM_SCHEMA_CACHE_TIMEOUT.
+FORM_SCHEMA_CACHE_ALIAS = 'schema'
+FORM_SCHEMA_LRU_SIZE = 512
+FORM_SCHEMA_CACHE_TIMEOUT = 300
+
+# Compiled submission validators kept per process, keyed by FormVersion id
+FORM_VALIDATOR_CACHE_SIZE = 512
+
+# Audit log buffer: SystemLogs are bulk-inserted per process when this many
+# are pending or every AUDIT_LOG_FLUSH_INTERVAL seconds (0 disables the timer)
+AUDIT_LOG_BATCH_SIZE = 100
+AUDIT_LOG_FLUSH_INTERVAL = 1.0
+# While the database is failing, flushes back off up to AUDIT_LOG_MAX_BACKOFF
+# seconds and at most AUDIT_LOG_MAX_PENDING entries are kept in memory
+AUDIT_LOG_MAX_BACKOFF = 60
+AUDIT_LOG_MAX_PENDING = 100000
+
+# SystemLogs retention: months older than SYSTEM_LOGS_RETENTION_MONTHS are
+# moved to gzipped NDJSON files by `manage.py archive_system_logs`
+SYSTEM_LOGS_ARCHIVE_DIR = BASE_DIR / 'archive' / 'system_logs'
+SYSTEM_LOGS_RETENTION_MONTHS = 3
+# Rows per gzip member of an archive file; a page read seeks to its member
+SYSTEM_LOGS_ARCHIVE_BLOCK_ROWS = 1000
+SYSTEM_LOGS_PAGE_SIZE = 50
+SYSTEM_LOGS_MAX_PAGE_SIZE = 500
+
+# WebSocket notifications are coalesced per user for this many seconds and
+# sent as one frame with the count and the latest NOTIFICATION_BATCH_LATEST
+NOTIFICATION_COALESCE_WINDOW = 0.5
+NOTIFICATION_BATCH_LATEST = 10
+
+# "auto" publishes notifications straight to the channel layer when running
+# under ASGI (Daphne) and queues them on Celery otherwise; or force
+# "channels" / "celery"
+NOTIFICATION_DISPATCH = 'auto'
+
+# Every notification frame gets a per-user sequence id and is kept in a
+# capped replay buffer; clients reconnect with ?last_seen=<seq> to get the
+# gap. "redis" is shared by all processes, "memory" only covers one process.
+NOTIFICATION_REPLAY_BACKEND = 'redis'
+NOTIFICATION_REPLAY_URL = 'redis://127.0.0.1:6379/2'
+NOTIFICATION_REPLAY_SIZE = 200
+NOTIFICATION_REPLAY_TTL = 60 * 60 * 24
+
+# Sockets may subscribe to topics (form:<id>, action:<ACTION>,
+# object_type:<TYPE>); frames are filtered per subscription before group_send
+# using a registry of open subscriptions ("redis" or per-process "memory")
+NOTIFICATION_SUBSCRIPTION_BACKEND = 'redis'
+NOTIFICATION_SUBSCRIPTION_URL = NOTIFICATION_REPLAY_URL
+
+# Clients may negotiate msgpack notification frames (subprotocol
+# "notifications.msgpack" or ?encoding=msgpack); frames of at least this many
+# bytes are zlib-compressed when that makes them smaller
+NOTIFICATION_COMPRESS_MIN_BYTES = 512
+NOTIFICATION_COMPRESS_LEVEL = 6
+
+# Form versions are stored as diffs against the latest full snapshot; a new
+# snapshot is taken every FORM_VERSION_SNAPSHOT_INTERVAL versions
+FORM_VERSION_SNAPSHOT_INTERVAL = 10
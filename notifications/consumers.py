@@ -1,20 +1,102 @@
 import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from .encoding import ENTRY_FIELDS, encode, negotiate
+from .replay import get_replay_buffer, replay_gap
+from .subscriptions import (
+    filter_event, get_subscription_registry, parse_topics, subscription_group, subscription_spec,
+)
+
+
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.group_name = f"user_{self.scope['user'].id}"
-        
-        # Join group for the user
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
+        self.user_id = self.scope['user'].id
+        self.replayed_until = 0
+        self.subscription = self.group_name = None
+        self.encoding, subprotocol = negotiate(self.scope)
+        try:
+            key = parse_topics(self.get_query_list("topics"))
+        except ValueError:
+            await self.close(code=4400)
+            return
+
+        # Join the group of the socket's subscription; all events by default
+        await self.subscribe(key)
+
+        await self.accept(subprotocol)
 
-        await self.accept()
-        await self.send(text_data=json.dumps({"message": "Connected to notifications"}))
+        # Joined the group first, so nothing published from here on is missed;
+        # live frames already covered by the replay are skipped in send_batch
+        last_seen = self.get_last_seen()
+        events, latest = await get_replay_buffer().since(self.user_id, last_seen)
+        greeting = {"message": "Connected to notifications", "seq": latest, "encoding": self.encoding}
+        if self.encoding == "msgpack":
+            greeting["entry_fields"] = list(ENTRY_FIELDS)
+        await self.send_payload(greeting)
+        if last_seen is None:
+            return
+        if replay_gap(events, last_seen, latest):
+            # The buffer has moved past the client: it must reload its state once
+            await self.send_payload({"type": "reset", "seq": latest})
+        spec = subscription_spec(self.subscription)
+        for event in events:
+            event = filter_event(event, spec)
+            if event is not None:
+                await self.send_batch(event)
+        self.replayed_until = events[-1]["seq"] if events else min(last_seen, latest)
+
+    async def send_payload(self, payload):
+        """Send ``payload`` in the encoding negotiated on connect."""
+        text_data, bytes_data = encode(payload, self.encoding)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    def get_query_list(self, name):
+        """Comma-separated values of ``?name=`` in the connect URL."""
+        values = parse_qs(self.scope.get("query_string", b"").decode()).get(name, [])
+        return [item for value in values for item in value.split(",") if item]
+
+    def get_last_seen(self):
+        """Sequence id from ``?last_seen=``, or None when absent or invalid."""
+        values = self.get_query_list("last_seen")
+        try:
+            return int(values[0]) if values else None
+        except ValueError:
+            return None
+
+    async def subscribe(self, key):
+        """Move this socket to the group of subscription ``key``."""
+        registry = get_subscription_registry()
+        previous_key, previous_group = self.subscription, self.group_name
+        group = subscription_group(self.user_id, key)
+        if group == previous_group:
+            return
+        await self.channel_layer.group_add(group, self.channel_name)
+        await registry.acquire(self.user_id, key)
+        self.subscription, self.group_name = key, group
+        if previous_group is not None:
+            await registry.release(self.user_id, previous_key)
+            await self.channel_layer.group_discard(previous_group, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # {"action": "subscribe", "topics": ["form:3", "action:SUBMIT"]};
+        # an empty list subscribes to everything again
+        try:
+            data = json.loads(text_data or "")
+            if data.get("action") != "subscribe":
+                raise ValueError("Unsupported action.")
+            key = parse_topics(data.get("topics") or [])
+        except (ValueError, AttributeError) as exc:
+            await self.send_payload({"type": "error", "message": str(exc)})
+            return
+        await self.subscribe(key)
+        await self.send_payload({"type": "subscribed", "topics": list(filter(None, key.split(",")))})
 
     async def disconnect(self, close_code):
+        if self.group_name is None:
+            return
+        await get_subscription_registry().release(self.user_id, self.subscription)
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
@@ -22,8 +104,27 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     # Receive message from group
     async def send_notification(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             "message": event["message"],
             "title": event.get("title", ""),
             "created_at": event.get("created_at", "")
-        }))
+        })
+
+    # Legacy single-entry events from onboarding.tasks.send_log_notification
+    async def notify(self, event):
+        await self.send_payload(event["content"])
+
+    # Coalesced frame: how many events happened and the latest few of them
+    async def send_batch(self, event):
+        seq = event.get("seq")
+        # Only frames the replay on connect already sent are skipped. Live
+        # frames may arrive out of seq order (the seq is assigned before
+        # group_send, by concurrent publishers), so no later mark is kept.
+        if seq is not None and seq <= self.replayed_until:
+            return
+        await self.send_payload({
+            "type": "batch",
+            "seq": seq,
+            "count": event["count"],
+            "entries": event["entries"],
+        })
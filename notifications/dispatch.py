@@ -0,0 +1,143 @@
+import asyncio
+import atexit
+import logging
+import threading
+from collections import Counter, deque
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from .tasks import group_send_frames, send_notification_batches
+
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """Delivers coalesced frames via the channel layer or a Celery task.
+
+    NOTIFICATION_DISPATCH picks the route: "channels" publishes from this
+    process, "celery" queues send_notification_batches, and "auto" publishes
+    directly when the process serves backend.asgi.application (Daphne) and
+    falls back to Celery everywhere else. Direct publishes are scheduled on
+    the ASGI server's event loop, so the calling thread never waits on the
+    channel layer.
+    """
+
+    def __init__(self):
+        self.asgi = False
+        self.loop = None
+
+    def bind_loop(self, loop):
+        self.asgi = True
+        self.loop = loop
+
+    def mode(self):
+        mode = settings.NOTIFICATION_DISPATCH
+        if mode == "auto":
+            return "channels" if self.asgi else "celery"
+        return mode
+
+    def dispatch(self, frames):
+        if self.mode() == "channels":
+            self.publish(frames)
+        else:
+            send_notification_batches.delay(frames)
+
+    def publish(self, frames):
+        loop = self.loop
+        if loop is None or not loop.is_running():
+            async_to_sync(group_send_frames)(frames)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            future = loop.create_task(group_send_frames(frames))
+        else:
+            future = asyncio.run_coroutine_threadsafe(group_send_frames(frames), loop)
+        future.add_done_callback(self._report_failure)
+
+    @staticmethod
+    def _report_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Failed to publish notifications", exc_info=future.exception())
+
+
+class EventLoopMiddleware:
+    """ASGI middleware that hands the server's event loop to the dispatcher."""
+
+    def __init__(self, app):
+        self.app = app
+        dispatcher.asgi = True
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        if dispatcher.loop is not loop:
+            dispatcher.bind_loop(loop)
+        return await self.app(scope, receive, send)
+
+
+class NotificationCoalescer:
+    """Coalesces notifications per user over NOTIFICATION_COALESCE_WINDOW seconds.
+
+    The first notification of a window starts a timer; when it fires, every
+    user with pending notifications gets one frame holding the total count
+    and the latest NOTIFICATION_BATCH_LATEST entries, and all frames go to the
+    dispatcher together. A window of 0 sends each call's frames straight away.
+    Counts are also kept per (action, object_type, form_id) so subscription
+    filters can report exact counts.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def add_many(self, notifications):
+        window = settings.NOTIFICATION_COALESCE_WINDOW
+        with self._lock:
+            for notification in notifications:
+                batch = self._pending.get(notification["user_id"])
+                if batch is None:
+                    batch = self._pending[notification["user_id"]] = {
+                        "count": 0,
+                        "latest": deque(maxlen=settings.NOTIFICATION_BATCH_LATEST),
+                        "topics": Counter(),
+                    }
+                batch["count"] += 1
+                batch["latest"].append(notification)
+                batch["topics"][(
+                    notification.get("action"),
+                    notification.get("object_type"),
+                    notification.get("form_id"),
+                )] += 1
+            if window > 0 and self._timer is None:
+                self._timer = threading.Timer(window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if window <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            dispatcher.dispatch([
+                {
+                    "user_id": user_id,
+                    "count": batch["count"],
+                    "entries": list(batch["latest"]),
+                    "topics": [[*topic, count] for topic, count in batch["topics"].items()],
+                }
+                for user_id, batch in pending.items()
+            ])
+
+
+dispatcher = NotificationDispatcher()
+coalescer = NotificationCoalescer()
+atexit.register(coalescer.flush)
@@ -0,0 +1,72 @@
+import json
+import zlib
+from urllib.parse import parse_qs
+
+import msgpack
+from django.conf import settings
+
+
+# WebSocket subprotocol -> encoding; also accepted as ?encoding=<name>
+SUBPROTOCOLS = {
+    "notifications.json": "json",
+    "notifications.msgpack": "msgpack",
+}
+ENCODINGS = set(SUBPROTOCOLS.values())
+
+# msgpack batch entries are arrays in this order instead of repeated keys;
+# the greeting carries the list so clients don't hard-code it
+ENTRY_FIELDS = ("title", "message", "timestamp", "action", "object_type", "object_id", "form_id")
+
+# First byte of every msgpack frame
+RAW = 0
+DEFLATED = 1
+
+
+def negotiate(scope):
+    """Pick ``(encoding, subprotocol to accept)`` for a connecting socket.
+
+    Offered subprotocols win in the client's order of preference; otherwise
+    ``?encoding=`` is used, and JSON is the default.
+    """
+    for subprotocol in scope.get("subprotocols") or []:
+        if subprotocol in SUBPROTOCOLS:
+            return SUBPROTOCOLS[subprotocol], subprotocol
+    encoding = parse_qs(scope.get("query_string", b"").decode()).get("encoding", ["json"])[0]
+    return (encoding if encoding in ENCODINGS else "json"), None
+
+
+def compact(payload):
+    if "entries" not in payload:
+        return payload
+    return {
+        **payload,
+        "entries": [[entry.get(field) for field in ENTRY_FIELDS] for entry in payload["entries"]],
+    }
+
+
+def encode_msgpack(payload):
+    """msgpack frame, deflated when that is smaller for large payloads."""
+    data = msgpack.packb(compact(payload), use_bin_type=True)
+    if len(data) >= settings.NOTIFICATION_COMPRESS_MIN_BYTES:
+        deflated = zlib.compress(data, settings.NOTIFICATION_COMPRESS_LEVEL)
+        if len(deflated) < len(data):
+            return bytes([DEFLATED]) + deflated
+    return bytes([RAW]) + data
+
+
+def decode_msgpack(frame):
+    """Inverse of ``encode_msgpack``, with entries expanded back to dicts."""
+    data = frame[1:]
+    if frame[0] == DEFLATED:
+        data = zlib.decompress(data)
+    payload = msgpack.unpackb(data, raw=False)
+    if "entries" in payload:
+        payload["entries"] = [dict(zip(ENTRY_FIELDS, entry)) for entry in payload["entries"]]
+    return payload
+
+
+def encode(payload, encoding):
+    """``(text_data, bytes_data)`` for ``AsyncWebsocketConsumer.send``."""
+    if encoding == "msgpack":
+        return None, encode_msgpack(payload)
+    return json.dumps(payload), None
@@ -0,0 +1,82 @@
+import json
+import time
+import zlib
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from notifications.encoding import decode_msgpack, encode_msgpack
+
+
+def sample_frame(entries, seq=1):
+    """A batch frame as NotificationConsumer sends it, with ``entries`` entries."""
+    return {
+        "type": "batch",
+        "seq": seq,
+        "count": entries * 3,
+        "entries": [
+            {
+                "title": "New Log Entry",
+                "message": f" Client Submitted: Individual KYC onboarding {n}",
+                "timestamp": f"2026-10-18 09:{n % 60:02d}:12.482913+00:00",
+                "action": "SUBMIT",
+                "object_type": "CLIENTSUBMISSION",
+                "object_id": str(18000 + n),
+                "form_id": 42,
+            }
+            for n in range(entries)
+        ],
+    }
+
+
+def json_deflate(payload):
+    # What permessage-deflate does to a single JSON frame, without context
+    # takeover between messages
+    return zlib.compress(json.dumps(payload).encode(), settings.NOTIFICATION_COMPRESS_LEVEL)
+
+
+# (name, encode, decode, settings to run with)
+CODECS = [
+    ("json", json.dumps, json.loads, {}),
+    ("json + deflate", json_deflate, lambda frame: json.loads(zlib.decompress(frame)), {}),
+    ("msgpack", encode_msgpack, decode_msgpack, {"NOTIFICATION_COMPRESS_MIN_BYTES": float("inf")}),
+    ("msgpack + zlib", encode_msgpack, decode_msgpack, {}),
+]
+
+
+def cpu_per_call(func, arg, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        func(arg)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare notification frame encodings: bytes on the wire and encode / "
+        "decode CPU per message for JSON, deflated JSON and msgpack with and "
+        "without zlib."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, nargs="+", default=[1, 10], help="Entries per batch frame.")
+        parser.add_argument("--iterations", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        for entries in options["entries"]:
+            frame = sample_frame(entries)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n== batch frame with {entries} entries =="))
+            baseline = None
+            for name, encode, decode, overrides in CODECS:
+                with override_settings(**overrides):
+                    encoded = encode(frame)
+                    encode_us = cpu_per_call(encode, frame, options["iterations"])
+                size = len(encoded.encode() if isinstance(encoded, str) else encoded)
+                baseline = baseline or size
+                decode_us = cpu_per_call(decode, encoded, options["iterations"])
+                assert decode(encoded)["entries"] == frame["entries"]
+                self.stdout.write(
+                    f"{name:<15} {size:7d} bytes ({size / baseline:6.1%})   "
+                    f"encode {encode_us:7.2f} us   decode {decode_us:7.2f} us"
+                )
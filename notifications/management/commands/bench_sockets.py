@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import resource
+import statistics
+import time
+
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from notifications.tasks import group_send_frames
+
+
+User = get_user_model()
+
+BENCH_SETTINGS = {
+    "CHANNEL_LAYERS": {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    "NOTIFICATION_REPLAY_BACKEND": "memory",
+    "NOTIFICATION_SUBSCRIPTION_BACKEND": "memory",
+}
+
+
+def rss_bytes():
+    """Current resident set size; the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summarize(samples):
+    """Percentiles in milliseconds for a list of durations in seconds."""
+    ms = sorted(sample * 1000 for sample in samples)
+    if len(ms) < 2:
+        ms = ms * 2 or [0.0, 0.0]
+    centiles = statistics.quantiles(ms, n=100, method="inclusive")
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(centiles[49], 3),
+        "p90_ms": round(centiles[89], 3),
+        "p99_ms": round(centiles[98], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+class Phase:
+    """Wall and CPU time of one benchmark phase."""
+
+    def __enter__(self):
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+
+    def report(self):
+        return {
+            "wall_s": round(self.wall, 3),
+            "cpu_s": round(self.cpu, 3),
+            "cpu_utilisation": round(self.cpu / self.wall, 3) if self.wall else 0.0,
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test NotificationConsumer through backend.asgi.application in "
+        "one process: open N WebSocket connections on the in-memory channel "
+        "layer, push notification frames to every user group and report "
+        "connect and delivery latency, memory per connection and CPU as JSON. "
+        "The in-memory layer sweeps every channel for expiry on each call, so "
+        "its group_send throughput is a lower bound for Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=2000)
+        parser.add_argument("--users", type=int, help="Distinct users; defaults to one per connection.")
+        parser.add_argument("--rounds", type=int, default=5, help="Frames pushed to every user.")
+        parser.add_argument("--concurrency", type=int, default=200, help="Connections opened at once.")
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        # Imported here so the settings overrides are in place first
+        from backend.asgi import application
+
+        users = options["users"] or options["connections"]
+        with override_settings(**BENCH_SETTINGS):
+            report = asyncio.run(self.run(application, users, options))
+        report["parameters"] = {key: options[key] for key in ("connections", "rounds", "concurrency")}
+        report["parameters"]["users"] = users
+        report["channel_layer"] = BENCH_SETTINGS["CHANNEL_LAYERS"]["default"]["BACKEND"]
+
+        encoded = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(encoded + "\n")
+        self.stdout.write(encoded)
+
+    async def run(self, application, users, options):
+        # Unsaved users: the consumer only needs an id, and a preset scope
+        # user is left alone by AuthMiddleware
+        people = [User(id=n + 1, username=f"bench-{n}") for n in range(users)]
+        sockets = []
+        connect_times = []
+        baseline = rss_bytes()
+
+        async def open_socket(n):
+            user = people[n % users]
+            communicator = WebsocketCommunicator(application, f"/ws/notifications/{user.id}/")
+            communicator.scope["user"] = user
+            start = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=30)
+            if not connected:
+                raise RuntimeError(f"Connection {n} was rejected")
+            await communicator.receive_json_from(timeout=30)  # greeting
+            connect_times.append(time.perf_counter() - start)
+            sockets.append((user.id, communicator))
+
+        with Phase() as connect_phase:
+            for offset in range(0, options["connections"], options["concurrency"]):
+                batch = range(offset, min(offset + options["concurrency"], options["connections"]))
+                await asyncio.gather(*(open_socket(n) for n in batch))
+        connected_rss = rss_bytes()
+
+        delivery_times = []
+        group_sends = 0
+
+        async def receive(communicator):
+            frame = await communicator.receive_json_from(timeout=30)
+            delivery_times.append(time.perf_counter() - float(frame["entries"][0]["timestamp"]))
+
+        with Phase() as delivery_phase:
+            for round_number in range(options["rounds"]):
+                receivers = [asyncio.create_task(receive(communicator)) for _, communicator in sockets]
+                await group_send_frames([
+                    {
+                        "user_id": user.id,
+                        "count": 1,
+                        "entries": [{
+                            "title": "New Log Entry",
+                            "message": f"UPDATE round {round_number}",
+                            "timestamp": repr(time.perf_counter()),
+                        }],
+                    }
+                    for user in people
+                ])
+                group_sends += len(people)
+                await asyncio.gather(*receivers)
+
+        with Phase() as disconnect_phase:
+            for offset in range(0, len(sockets), options["concurrency"]):
+                await asyncio.gather(*(
+                    communicator.disconnect() for _, communicator in sockets[offset:offset + options["concurrency"]]
+                ))
+
+        return {
+            "connect": {**summarize(connect_times), **connect_phase.report()},
+            "delivery": {
+                **summarize(delivery_times),
+                **delivery_phase.report(),
+                "group_sends": group_sends,
+                "group_sends_per_s": round(group_sends / delivery_phase.wall, 1),
+                "frames_per_s": round(len(delivery_times) / delivery_phase.wall, 1),
+            },
+            "disconnect": disconnect_phase.report(),
+            "memory": {
+                "baseline_rss_bytes": baseline,
+                "connected_rss_bytes": connected_rss,
+                "bytes_per_connection": round((connected_rss - baseline) / max(len(sockets), 1)),
+            },
+        }
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+import weakref
+from collections import deque
+
+import redis.asyncio as redis
+from django.conf import settings
+
+
+# Bump the user's sequence and append to the capped stream in one step, so a
+# stream entry exists for every sequence id handed out before it.
+APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], seq .. '-0', 'event', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return seq
+"""
+
+
+class MemoryReplayBuffer:
+    """Per-user ring buffers in this process.
+
+    Only complete when the publisher and the WebSocket consumers share a
+    process, e.g. a single Daphne with direct dispatch, and in tests.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._buffers = {}
+        self._sequences = {}
+        self._lock = threading.Lock()
+
+    async def append(self, user_id, event):
+        with self._lock:
+            seq = self._sequences.get(user_id, 0) + 1
+            self._sequences[user_id] = seq
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                buffer = self._buffers[user_id] = deque(maxlen=self.size)
+            buffer.append((seq, {**event, "seq": seq}))
+        return seq
+
+    async def since(self, user_id, last_seen):
+        """Return ``(events after last_seen, latest seq)``; no events for ``None``."""
+        with self._lock:
+            latest = self._sequences.get(user_id, 0)
+            if last_seen is None or last_seen >= latest:
+                return [], latest
+            events = [event for seq, event in self._buffers.get(user_id, ()) if seq > last_seen]
+        return events, latest
+
+
+class RedisReplayBuffer:
+    """Per-user capped Redis streams shared by every process.
+
+    Entry ids are ``<seq>-0``, so a gap is one XRANGE from ``last_seen + 1``.
+    """
+
+    def __init__(self, url, size, ttl):
+        self.url = url
+        self.size = size
+        self.ttl = ttl
+        # redis.asyncio connections belong to the loop that opened them
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            client = redis.from_url(self.url, decode_responses=True)
+            entry = self._clients[loop] = (client, client.register_script(APPEND_SCRIPT))
+        return entry
+
+    @staticmethod
+    def keys(user_id):
+        return f"notifications:seq:{user_id}", f"notifications:replay:{user_id}"
+
+    async def append(self, user_id, event):
+        _, append = self._client()
+        seq = await append(keys=self.keys(user_id), args=[json.dumps(event), self.size, self.ttl])
+        return int(seq)
+
+    async def since(self, user_id, last_seen):
+        client, _ = self._client()
+        seq_key, stream_key = self.keys(user_id)
+        latest = int(await client.get(seq_key) or 0)
+        if last_seen is None or last_seen >= latest:
+            return [], latest
+        entries = await client.xrange(stream_key, min=f"{last_seen + 1}-0")
+        events = [{**json.loads(fields["event"]), "seq": int(entry_id.split("-")[0])} for entry_id, fields in entries]
+        return events, latest
+
+
+_buffers = {}
+
+
+def get_replay_buffer():
+    """The buffer configured by NOTIFICATION_REPLAY_BACKEND, one per process."""
+    backend = settings.NOTIFICATION_REPLAY_BACKEND
+    buffer = _buffers.get(backend)
+    if buffer is None:
+        if backend == "memory":
+            buffer = MemoryReplayBuffer(settings.NOTIFICATION_REPLAY_SIZE)
+        else:
+            buffer = RedisReplayBuffer(
+                settings.NOTIFICATION_REPLAY_URL,
+                settings.NOTIFICATION_REPLAY_SIZE,
+                settings.NOTIFICATION_REPLAY_TTL,
+            )
+        _buffers[backend] = buffer
+    return buffer
+
+
+def replay_gap(events, last_seen, latest):
+    """True when the buffer no longer holds everything after ``last_seen``.
+
+    Sequence ids are contiguous per user, so the gap is intact exactly when
+    the oldest kept event is the one right after ``last_seen``.
+    """
+    if last_seen > latest:
+        # The counter was reset (e.g. the Redis keys expired)
+        return True
+    if last_seen == latest:
+        return False
+    return not events or events[0]["seq"] != last_seen + 1
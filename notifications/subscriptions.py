@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import threading
+import weakref
+
+import redis.asyncio as redis
+from django.conf import settings
+
+
+# Topic prefix -> notification entry field it filters on
+DIMENSIONS = {
+    "form": "form_id",
+    "action": "action",
+    "object_type": "object_type",
+}
+
+# Drop a subscription's field once its last socket is gone
+RELEASE_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+if count <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+
+def parse_topics(topics):
+    """Normalise topics like ``["form:3", "action:submit"]`` into a subscription key.
+
+    The key is the sorted, de-duplicated topic list joined with commas; an
+    empty key means every event. Raises ValueError for unknown topics.
+    """
+    normalised = set()
+    for topic in topics:
+        dimension, _, value = str(topic).strip().partition(":")
+        if dimension not in DIMENSIONS or not value:
+            raise ValueError(f"Unknown topic '{topic}'.")
+        if dimension != "form":
+            value = value.upper()
+        normalised.add(f"{dimension}:{value}")
+    return ",".join(sorted(normalised))
+
+
+def subscription_spec(key):
+    """``{entry field: allowed values}`` for a subscription key."""
+    spec = {}
+    for topic in filter(None, key.split(",")):
+        dimension, _, value = topic.partition(":")
+        spec.setdefault(DIMENSIONS[dimension], set()).add(value)
+    return spec
+
+
+def subscription_group(user_id, key):
+    """Channel-layer group for one user's sockets sharing a subscription."""
+    if not key:
+        return f"user_{user_id}"
+    return f"user_{user_id}.{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+
+def matches(spec, values):
+    """Values of one dimension are alternatives; dimensions must all match."""
+    return all(str(values.get(field)) in allowed for field, allowed in spec.items())
+
+
+def filter_event(event, spec):
+    """The part of a batch event ``spec`` asks for, or None if nothing matches.
+
+    ``count`` is recomputed from the frame's per-topic counts, so it stays
+    exact even when older entries were dropped by the coalescer.
+    """
+    if not spec:
+        return event
+    entries = [entry for entry in event["entries"] if matches(spec, entry)]
+    topics = event.get("topics")
+    if topics:
+        topics = [
+            topic for topic in topics
+            if matches(spec, {"action": topic[0], "object_type": topic[1], "form_id": topic[2]})
+        ]
+        count = sum(topic[3] for topic in topics)
+    else:
+        count = len(entries)
+    if not count:
+        return None
+    return {**event, "count": count, "entries": entries, "topics": topics}
+
+
+class MemorySubscriptionRegistry:
+    """Open sockets per (user, subscription key) in this process."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    async def acquire(self, user_id, key):
+        with self._lock:
+            keys = self._counts.setdefault(user_id, {})
+            keys[key] = keys.get(key, 0) + 1
+
+    async def release(self, user_id, key):
+        with self._lock:
+            keys = self._counts.get(user_id, {})
+            keys[key] = keys.get(key, 0) - 1
+            if keys[key] <= 0:
+                del keys[key]
+
+    async def active(self, user_id):
+        with self._lock:
+            return list(self._counts.get(user_id, ()))
+
+
+class RedisSubscriptionRegistry:
+    """Open sockets per subscription key in one Redis hash per user.
+
+    Counts are not expired, so sockets that outlive any TTL keep receiving;
+    a process that dies without disconnecting leaves a stale key behind,
+    which only costs a group_send to an empty group.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        # redis.asyncio connections belong to the loop that opened them
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            client = redis.from_url(self.url, decode_responses=True)
+            entry = self._clients[loop] = (client, client.register_script(RELEASE_SCRIPT))
+        return entry
+
+    @staticmethod
+    def hash_key(user_id):
+        return f"notifications:subscriptions:{user_id}"
+
+    async def acquire(self, user_id, key):
+        client, _ = self._client()
+        await client.hincrby(self.hash_key(user_id), key, 1)
+
+    async def release(self, user_id, key):
+        _, release = self._client()
+        await release(keys=[self.hash_key(user_id)], args=[key])
+
+    async def active(self, user_id):
+        client, _ = self._client()
+        return await client.hkeys(self.hash_key(user_id))
+
+
+_registries = {}
+
+
+def get_subscription_registry():
+    """The registry configured by NOTIFICATION_SUBSCRIPTION_BACKEND, one per process."""
+    backend = settings.NOTIFICATION_SUBSCRIPTION_BACKEND
+    registry = _registries.get(backend)
+    if registry is None:
+        if backend == "memory":
+            registry = MemorySubscriptionRegistry()
+        else:
+            registry = RedisSubscriptionRegistry(settings.NOTIFICATION_SUBSCRIPTION_URL)
+        _registries[backend] = registry
+    return registry
@@ -0,0 +1,55 @@
+from celery import shared_task
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+from .replay import get_replay_buffer
+from .subscriptions import filter_event, get_subscription_registry, subscription_group, subscription_spec
+
+
+def batch_event(frame):
+    """Channel-layer event for one user's coalesced notifications."""
+    return {
+        "type": "send_batch",
+        "count": frame["count"],
+        "entries": [
+            {
+                "title": entry["title"],
+                "message": entry["message"],
+                "timestamp": entry["timestamp"],
+                "action": entry.get("action"),
+                "object_type": entry.get("object_type"),
+                "object_id": entry.get("object_id"),
+                "form_id": entry.get("form_id"),
+            }
+            for entry in frame["entries"]
+        ],
+        # [[action, object_type, form_id, count], ...]
+        "topics": frame.get("topics", []),
+    }
+
+
+async def group_send_frames(frames):
+    """Send each user's coalesced frame to the subscriptions that want it.
+
+    Every frame is first appended to the user's replay buffer, which stamps
+    it with the next sequence id. It is then filtered once per distinct
+    subscription with open sockets and sent to that subscription's group;
+    nothing is sent for users without sockets or matching subscriptions.
+    """
+    channel_layer = get_channel_layer()
+    replay = get_replay_buffer()
+    registry = get_subscription_registry()
+    for frame in frames:
+        user_id = frame["user_id"]
+        event = batch_event(frame)
+        event["seq"] = await replay.append(user_id, event)
+        for key in await registry.active(user_id):
+            filtered = filter_event(event, subscription_spec(key))
+            if filtered is not None:
+                await channel_layer.group_send(subscription_group(user_id, key), filtered)
+
+
+# Fire and forget: nothing reads the result, so don't write one
+@shared_task(ignore_result=True)
+def send_notification_batches(frames):
+    async_to_sync(group_send_frames)(frames)
@@ -1,3 +1,336 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from notifications.consumers import NotificationConsumer
+from notifications import replay, subscriptions
+from notifications.dispatch import NotificationCoalescer, NotificationDispatcher
+from notifications.encoding import DEFLATED, RAW, decode_msgpack
+from notifications.tasks import send_notification_batches
+
+User = get_user_model()
+
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+LOCAL_NOTIFICATIONS = {
+    "CHANNEL_LAYERS": IN_MEMORY_LAYERS,
+    "NOTIFICATION_REPLAY_BACKEND": "memory",
+    "NOTIFICATION_SUBSCRIPTION_BACKEND": "memory",
+}
+
+
+def make_notification(user_id, n, **meta):
+    return {"user_id": user_id, "title": "New Log Entry", "message": f"event {n}", "timestamp": str(n), **meta}
+
+
+async def connect(user, query=""):
+    communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), f"/ws/notifications/{user.id}/{query}")
+    communicator.scope["user"] = user
+    connected, _ = await communicator.connect()
+    assert connected
+    communicator.greeting = await communicator.receive_json_from()
+    return communicator
+
+
+@override_settings(NOTIFICATION_COALESCE_WINDOW=0.05, NOTIFICATION_BATCH_LATEST=3)
+@mock.patch("notifications.dispatch.send_notification_batches")
+@override_settings(NOTIFICATION_DISPATCH="celery")
+class NotificationCoalescerTestCase(TestCase):
+    def test_burst_is_coalesced_per_user(self, task):
+        coalescer = NotificationCoalescer()
+        for n in range(10000):
+            coalescer.add_many([make_notification(n % 4, n)])
+        for _ in range(100):
+            if not coalescer._pending:
+                break
+            time.sleep(0.01)
+        coalescer.flush()
+
+        frames = [frame for call in task.delay.call_args_list for frame in call.args[0]]
+        self.assertLess(task.delay.call_count, 50)
+        self.assertEqual(sum(frame["count"] for frame in frames), 10000)
+        self.assertEqual(frames[-1]["entries"][-1]["message"], "event 9999")
+        self.assertTrue(all(len(frame["entries"]) <= 3 for frame in frames))
+
+    @override_settings(NOTIFICATION_COALESCE_WINDOW=0)
+    def test_zero_window_sends_immediately(self, task):
+        NotificationCoalescer().add_many([make_notification(1, 1), make_notification(1, 2), make_notification(2, 3)])
+
+        task.delay.assert_called_once()
+        self.assertEqual([(f["user_id"], f["count"]) for f in task.delay.call_args.args[0]], [(1, 2), (2, 1)])
+
+
+@override_settings(**LOCAL_NOTIFICATIONS)
+class NotificationBatchDeliveryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="client", password="Passcode123")
+
+    def test_one_frame_per_user(self):
+        async def scenario():
+            communicator = await connect(self.user)
+            layer = get_channel_layer()
+            with mock.patch.object(layer, "group_send", wraps=layer.group_send) as group_send:
+                await sync_to_async(send_notification_batches)([{
+                    "user_id": self.user.id,
+                    "count": 7,
+                    "entries": [make_notification(self.user.id, 6)],
+                }])
+            frame = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return group_send.call_count, frame
+
+        sends, frame = async_to_sync(scenario)()
+        self.assertEqual(sends, 1)
+        self.assertEqual(frame["type"], "batch")
+        self.assertEqual(frame["count"], 7)
+        self.assertEqual(frame["entries"][0]["message"], "event 6")
+
+
+@override_settings(NOTIFICATION_DISPATCH="auto", **LOCAL_NOTIFICATIONS)
+@mock.patch("notifications.dispatch.send_notification_batches")
+class NotificationDispatcherTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="client", password="Passcode123")
+        self.frames = [{"user_id": self.user.id, "count": 1, "entries": [make_notification(self.user.id, 1)]}]
+
+    def test_falls_back_to_celery_outside_asgi(self, task):
+        NotificationDispatcher().dispatch(self.frames)
+
+        task.delay.assert_called_once_with(self.frames)
+
+    def test_publishes_on_the_asgi_loop(self, task):
+        dispatcher = NotificationDispatcher()
+
+        async def scenario():
+            dispatcher.bind_loop(asyncio.get_running_loop())
+            communicator = await connect(self.user)
+            await sync_to_async(dispatcher.dispatch)(self.frames)
+            frame = await communicator.receive_json_from(timeout=1)
+            await communicator.disconnect()
+            return frame
+
+        frame = async_to_sync(scenario)()
+        task.delay.assert_not_called()
+        self.assertEqual(frame["count"], 1)
+        self.assertEqual(frame["entries"][0]["message"], "event 1")
+
+
+@override_settings(NOTIFICATION_REPLAY_SIZE=5, **LOCAL_NOTIFICATIONS)
+class NotificationReplayTestCase(TestCase):
+    def setUp(self):
+        replay._buffers.clear()
+        subscriptions._registries.clear()
+        self.user = User.objects.create_user(username="client", password="Passcode123")
+
+    def publish(self, *numbers):
+        send_notification_batches([
+            {"user_id": self.user.id, "count": 1, "entries": [make_notification(self.user.id, n)]}
+            for n in numbers
+        ])
+
+    def reconnect(self, query):
+        async def scenario():
+            communicator = await connect(self.user, query)
+            frames = []
+            while not await communicator.receive_nothing(timeout=0.05):
+                frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return communicator.greeting, frames
+
+        return async_to_sync(scenario)()
+
+    def test_frames_carry_sequence_ids(self):
+        async def scenario():
+            communicator = await connect(self.user)
+            await sync_to_async(self.publish)(1, 2)
+            frames = [await communicator.receive_json_from(), await communicator.receive_json_from()]
+            await communicator.disconnect()
+            return communicator.greeting, frames
+
+        greeting, frames = async_to_sync(scenario)()
+        self.assertEqual(greeting["seq"], 0)
+        self.assertEqual([frame["seq"] for frame in frames], [1, 2])
+
+    def test_replays_only_the_gap(self):
+        self.publish(1, 2, 3, 4)
+
+        greeting, frames = self.reconnect("?last_seen=2")
+
+        self.assertEqual(greeting["seq"], 4)
+        self.assertEqual([frame["seq"] for frame in frames], [3, 4])
+        self.assertEqual(frames[0]["entries"][0]["message"], "event 3")
+
+    def test_up_to_date_client_gets_nothing(self):
+        self.publish(1, 2)
+
+        _, frames = self.reconnect("?last_seen=2")
+
+        self.assertEqual(frames, [])
+
+    def test_out_of_order_live_frames_are_all_sent(self):
+        self.publish(1, 2)
+
+        async def scenario():
+            communicator = await connect(self.user, "?last_seen=1")
+            replayed = await communicator.receive_json_from()
+            # Two publishers got seqs 3 and 4 but 4 reached the layer first;
+            # a late copy of the replayed seq 2 is still skipped
+            layer = get_channel_layer()
+            for seq in (4, 3, 2):
+                await layer.group_send(subscriptions.subscription_group(self.user.id, ""), {
+                    "type": "send_batch", "seq": seq, "count": 1,
+                    "entries": [make_notification(self.user.id, seq)],
+                })
+            frames = []
+            while not await communicator.receive_nothing(timeout=0.05):
+                frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return replayed, frames
+
+        replayed, frames = async_to_sync(scenario)()
+        self.assertEqual(replayed["seq"], 2)
+        self.assertEqual([frame["seq"] for frame in frames], [4, 3])
+
+    def test_reset_when_gap_was_trimmed(self):
+        self.publish(*range(1, 9))
+
+        _, frames = self.reconnect("?last_seen=1")
+
+        self.assertEqual(frames[0], {"type": "reset", "seq": 8})
+        self.assertEqual([frame["seq"] for frame in frames[1:]], [4, 5, 6, 7, 8])
+
+
+@override_settings(**LOCAL_NOTIFICATIONS)
+class NotificationSubscriptionTestCase(TestCase):
+    def setUp(self):
+        replay._buffers.clear()
+        subscriptions._registries.clear()
+        self.user = User.objects.create_user(username="staff", password="Passcode123")
+        self.frame = {
+            "user_id": self.user.id,
+            "count": 5,
+            "entries": [
+                make_notification(self.user.id, 1, action="SUBMIT", object_type="CLIENTSUBMISSION", form_id=3),
+                make_notification(self.user.id, 2, action="UPDATE", object_type="FORMS", form_id=4),
+            ],
+            # Three older SUBMITs on form 3 were dropped from the entries
+            "topics": [["SUBMIT", "CLIENTSUBMISSION", 3, 4], ["UPDATE", "FORMS", 4, 1]],
+        }
+
+    def test_sockets_only_receive_their_topics(self):
+        async def scenario():
+            everything = await connect(self.user)
+            submits = await connect(self.user, "?topics=action:submit,form:3")
+            await sync_to_async(send_notification_batches)([self.frame])
+            frames = await everything.receive_json_from(), await submits.receive_json_from()
+            await everything.disconnect()
+            await submits.disconnect()
+            return frames
+
+        everything, submits = async_to_sync(scenario)()
+        self.assertEqual(everything["count"], 5)
+        self.assertEqual(len(everything["entries"]), 2)
+        self.assertEqual(submits["count"], 4)
+        self.assertEqual([entry["message"] for entry in submits["entries"]], ["event 1"])
+
+    def test_nothing_is_sent_without_a_matching_subscription(self):
+        async def scenario():
+            communicator = await connect(self.user, "?topics=object_type:systemlogs")
+            layer = get_channel_layer()
+            with mock.patch.object(layer, "group_send", wraps=layer.group_send) as group_send:
+                await sync_to_async(send_notification_batches)([self.frame])
+            quiet = await communicator.receive_nothing(timeout=0.05)
+            await communicator.disconnect()
+            return group_send.call_count, quiet
+
+        sends, quiet = async_to_sync(scenario)()
+        self.assertEqual(sends, 0)
+        self.assertTrue(quiet)
+
+    def test_subscribe_message_changes_topics(self):
+        async def scenario():
+            communicator = await connect(self.user)
+            await communicator.send_json_to({"action": "subscribe", "topics": ["form:4"]})
+            reply = await communicator.receive_json_from()
+            await sync_to_async(send_notification_batches)([self.frame])
+            frame = await communicator.receive_json_from()
+            await communicator.send_json_to({"action": "subscribe", "topics": ["colour:red"]})
+            error = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return reply, frame, error
+
+        reply, frame, error = async_to_sync(scenario)()
+        self.assertEqual(reply, {"type": "subscribed", "topics": ["form:4"]})
+        self.assertEqual(frame["count"], 1)
+        self.assertEqual(frame["entries"][0]["action"], "UPDATE")
+        self.assertEqual(error["type"], "error")
+        registry = subscriptions.get_subscription_registry()
+        self.assertEqual(async_to_sync(registry.active)(self.user.id), [])
+
+    def test_unknown_topic_is_rejected_on_connect(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), f"/ws/notifications/{self.user.id}/?topics=colour:red")
+            communicator.scope["user"] = self.user
+            return await communicator.connect()
+
+        connected, code = async_to_sync(scenario)()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4400)
+
+
+@override_settings(NOTIFICATION_COMPRESS_MIN_BYTES=512, **LOCAL_NOTIFICATIONS)
+class NotificationEncodingTestCase(TestCase):
+    def setUp(self):
+        replay._buffers.clear()
+        subscriptions._registries.clear()
+        self.user = User.objects.create_user(username="mobile", password="Passcode123")
+
+    def receive_frames(self, entries, **communicator_kwargs):
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                NotificationConsumer.as_asgi(), f"/ws/notifications/{self.user.id}/", **communicator_kwargs
+            )
+            communicator.scope["user"] = self.user
+            connected, subprotocol = await communicator.connect()
+            greeting = await communicator.receive_output()
+            await sync_to_async(send_notification_batches)([{
+                "user_id": self.user.id,
+                "count": entries,
+                "entries": [make_notification(self.user.id, n, action="SUBMIT") for n in range(entries)],
+            }])
+            frame = await communicator.receive_output()
+            await communicator.disconnect()
+            return subprotocol, greeting, frame
+
+        return async_to_sync(scenario)()
+
+    def test_json_stays_the_default(self):
+        subprotocol, greeting, frame = self.receive_frames(1)
+
+        self.assertIsNone(subprotocol)
+        self.assertEqual(json.loads(greeting["text"])["encoding"], "json")
+        self.assertEqual(json.loads(frame["text"])["entries"][0]["message"], "event 0")
+
+    def test_msgpack_negotiated_by_subprotocol(self):
+        subprotocol, greeting, frame = self.receive_frames(1, subprotocols=["notifications.msgpack"])
+
+        self.assertEqual(subprotocol, "notifications.msgpack")
+        self.assertEqual(decode_msgpack(greeting["bytes"])["entry_fields"][:3], ["title", "message", "timestamp"])
+        self.assertEqual(frame["bytes"][0], RAW)
+        payload = decode_msgpack(frame["bytes"])
+        self.assertEqual(payload["entries"][0]["message"], "event 0")
+        self.assertEqual(payload["entries"][0]["action"], "SUBMIT")
+
+    def test_large_batches_are_compressed(self):
+        _, _, frame = self.receive_frames(30, subprotocols=["notifications.msgpack"])
+
+        self.assertEqual(frame["bytes"][0], DEFLATED)
+        payload = decode_msgpack(frame["bytes"])
+        self.assertEqual(payload["count"], 30)
+        self.assertEqual([entry["message"] for entry in payload["entries"]], [f"event {n}" for n in range(30)])
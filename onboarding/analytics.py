@@ -0,0 +1,175 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Trim, TruncDate
+from django.utils import timezone
+
+from .models import ClientSubmission, ClientSubmissionData, FieldCompletionCounter, FormVersion, SubmissionCounter
+
+
+def submission_buckets(submission):
+    """``(form_id, scope, key)`` of every SubmissionCounter a submission counts towards."""
+    return [
+        (submission.form_id, "form", ""),
+        (submission.form_id, "version", str(submission.form_version_id)),
+        (submission.form_id, "day", timezone.localdate(submission.created_at).isoformat()),
+        (submission.form_id, "user", str(submission.created_by_id)),
+    ]
+
+
+def bucket_key(values):
+    """SubmissionCounter.key for the grouping values of a rebuild query."""
+    if not values:
+        return ""
+    value = values[0]
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def increment(model, key_fields, column, increments):
+    """Add ``increments`` (``{key tuple: amount}``) to ``column`` of ``model`` rows.
+
+    Missing rows are inserted at zero first, then every group of keys that
+    differ only in their last field and share an amount gets one UPDATE
+    ``column = column + amount``, so concurrent writers never lose counts.
+    """
+    increments = {key: amount for key, amount in increments.items() if amount}
+    if not increments:
+        return
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key))) for key in increments], ignore_conflicts=True
+    )
+    groups = defaultdict(list)
+    for key, amount in increments.items():
+        groups[amount, key[:-1]].append(key[-1])
+    for (amount, prefix), values in groups.items():
+        model.objects.filter(
+            **dict(zip(key_fields[:-1], prefix)), **{f"{key_fields[-1]}__in": values}
+        ).update(**{column: F(column) + amount})
+
+
+def count_submissions(submissions, answers, sign=1):
+    """Update the analytics counters for new (or, with ``sign=-1``, deleted) submissions.
+
+    ``answers`` are the ClientSubmissionData rows of ``submissions``. Call it
+    in the transaction that writes them so the counters commit with them.
+    """
+    versions = {submission.pk: submission.form_version_id for submission in submissions}
+    counters = Counter(bucket for submission in submissions for bucket in submission_buckets(submission))
+    filled = Counter(
+        (versions[answer.submission_id], answer.field_id)
+        for answer in answers
+        if answer.value and answer.value.strip()
+    )
+    increment(SubmissionCounter, ("form_id", "scope", "key"), "count",
+              {key: sign * amount for key, amount in counters.items()})
+    increment(FieldCompletionCounter, ("form_version_id", "field_id"), "filled",
+              {key: sign * amount for key, amount in filled.items()})
+
+
+def rebuild_counters(form_ids=None, batch_size=500):
+    """Recompute the counters of ``form_ids`` (or every form) from the submissions.
+
+    Runs in one transaction; submissions written meanwhile may be counted
+    twice or not at all, so run it while the forms are quiet.
+    """
+    submissions = ClientSubmission.objects.all()
+    answers = ClientSubmissionData.objects.alias(trimmed=Trim("value")).exclude(trimmed="")
+    counters = SubmissionCounter.objects.all()
+    completions = FieldCompletionCounter.objects.all()
+    if form_ids is not None:
+        submissions = submissions.filter(form_id__in=form_ids)
+        answers = answers.filter(submission__form_id__in=form_ids)
+        counters = counters.filter(form_id__in=form_ids)
+        completions = completions.filter(form_version__form_id__in=form_ids)
+
+    breakdowns = [
+        ("form", submissions.values_list("form_id")),
+        ("version", submissions.values_list("form_id", "form_version_id")),
+        ("day", submissions.annotate(day=TruncDate("created_at")).values_list("form_id", "day")),
+        ("user", submissions.values_list("form_id", "created_by_id")),
+    ]
+
+    with transaction.atomic():
+        counters.delete()
+        completions.delete()
+        for scope, groups in breakdowns:
+            rows = groups.annotate(total=Count("id")).order_by()
+            SubmissionCounter.objects.bulk_create(
+                (
+                    SubmissionCounter(form_id=row[0], scope=scope, key=bucket_key(row[1:-1]), count=row[-1])
+                    for row in rows.iterator()
+                ),
+                batch_size=batch_size,
+            )
+        filled = Counter({
+            (version_id, field_id): total
+            for version_id, field_id, total in answers.values_list("submission__form_version_id", "field_id")
+            .annotate(total=Count("id")).order_by().iterator()
+        })
+        # Document submissions have no answer rows to aggregate in SQL
+        documents = submissions.filter(answers__isnull=False).values_list("form_version_id", "answers")
+        for version_id, document in documents.iterator():
+            for field_id, value in document.items():
+                if value and str(value).strip():
+                    filled[version_id, int(field_id)] += 1
+        FieldCompletionCounter.objects.bulk_create(
+            (
+                FieldCompletionCounter(form_version_id=version_id, field_id=field_id, filled=total)
+                for (version_id, field_id), total in filled.items()
+            ),
+            batch_size=batch_size,
+        )
+
+
+def form_stats(form, version=None, days=30, top_users=10):
+    """Dashboard analytics of ``form`` from the counter tables, in a handful of queries.
+
+    Field completion rates are given for ``version`` when one is passed.
+    """
+    counters = SubmissionCounter.objects.filter(form=form)
+    by_scope = defaultdict(dict)
+    since = (timezone.localdate() - timedelta(days=days - 1)).isoformat()
+    for scope, key, count in counters.filter(scope__in=("form", "version")).values_list("scope", "key", "count"):
+        by_scope[scope][key] = count
+    version_numbers = dict(FormVersion.objects.filter(form=form).values_list("id", "version"))
+
+    stats = {
+        "form": form.pk,
+        "submissions": by_scope["form"].get("", 0),
+        "versions": sorted(
+            (
+                {"version": version_numbers[int(key)], "submissions": count}
+                for key, count in by_scope["version"].items()
+                if int(key) in version_numbers
+            ),
+            key=lambda item: -item["version"],
+        ),
+        "days": [
+            {"day": key, "submissions": count}
+            for key, count in counters.filter(scope="day", key__gte=since).order_by("key").values_list("key", "count")
+        ],
+        "top_users": [
+            {"user": int(key), "submissions": count}
+            for key, count in counters.filter(scope="user").order_by("-count", "key").values_list("key", "count")[:top_users]
+        ],
+        "fields": None,
+    }
+    if version is not None:
+        submitted = by_scope["version"].get(str(version.pk), 0)
+        filled = dict(version.completion_counters.values_list("field_id", "filled"))
+        stats["fields"] = {
+            "version": version.version,
+            "submissions": submitted,
+            "fields": [
+                {
+                    "field": link.field_id,
+                    "name": link.field.name,
+                    "filled": filled.get(link.field_id, 0),
+                    "completion_rate": round(filled.get(link.field_id, 0) / submitted, 4) if submitted else None,
+                }
+                for link in version.field_links.select_related("field").order_by("position")
+            ],
+        }
+    return stats
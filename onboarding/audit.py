@@ -0,0 +1,179 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+
+from .models import SystemLogs
+from notifications.dispatch import coalescer
+
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    """Per-process queue of SystemLogs entries written in batches.
+
+    Entries are flushed with one ``bulk_create`` by a background thread when
+    AUDIT_LOG_BATCH_SIZE of them are pending or every AUDIT_LOG_FLUSH_INTERVAL
+    seconds, whichever comes first, and each flush hands its notifications to
+    the per-user coalescer. With the interval set to 0 there is no thread and
+    full batches are flushed by the caller. Pending entries are flushed on
+    interpreter shutdown.
+
+    A batch rejected for one of its rows (IntegrityError, DataError) is
+    inserted entry by entry and only the rejected entries are logged and
+    dropped. Any other failure, such as the database being unreachable,
+    keeps the batch queued and retries with exponential backoff up to
+    AUDIT_LOG_MAX_BACKOFF seconds. At most AUDIT_LOG_MAX_PENDING entries are
+    held; past that the oldest are dropped with a critical log.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._failures = 0
+        self._retry_at = 0
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+            dropped = self._trim()
+            full = len(self._entries) >= settings.AUDIT_LOG_BATCH_SIZE
+        self._report_dropped(dropped)
+        if self._ensure_flusher():
+            if full:
+                self._wakeup.set()
+        elif full:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._entries)
+
+    def flush(self, force=False):
+        """Write the pending entries, unless backing off after a failure (and not ``force``)."""
+        if not force and time.monotonic() < self._retry_at:
+            return
+        with self._lock:
+            batch, self._entries = self._entries, []
+        if batch:
+            self._write(batch)
+
+    def shutdown(self):
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush(force=True)
+
+    def _write(self, batch):
+        unwritten = []
+        try:
+            SystemLogs.objects.bulk_create(batch)
+        except (IntegrityError, DataError):
+            logger.exception("Failed to write %d audit log entries, writing them one by one", len(batch))
+            batch, unwritten = self._write_each(batch)
+        except Exception:
+            logger.exception("Failed to write %d audit log entries, will retry", len(batch))
+            batch, unwritten = [], batch
+        if unwritten:
+            self._requeue(unwritten)
+        else:
+            self._failures, self._retry_at = 0, 0
+        if not batch:
+            return
+        coalescer.add_many([
+            {
+                "user_id": log.user_id,
+                "title": "New Log Entry",
+                "message": log.message,
+                "timestamp": str(log.created_at),
+                "action": log.action,
+                "object_type": log.object_type,
+                "object_id": log.object_id,
+                "form_id": getattr(log, "form_id", None),
+            }
+            for log in batch
+        ])
+
+    def _write_each(self, batch):
+        """Insert ``batch`` entry by entry.
+
+        Returns ``(written, unwritten)``: entries rejected for their own data
+        are logged and dropped, and if the database fails otherwise the rest
+        of the batch is returned to be retried.
+        """
+        written = []
+        for index, entry in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    SystemLogs.objects.bulk_create([entry])
+            except (IntegrityError, DataError):
+                logger.exception(
+                    "Dropping audit log entry %s %s %s of user %s",
+                    entry.action, entry.object_type, entry.object_id, entry.user_id,
+                )
+            except Exception:
+                logger.exception("Failed to write audit log entries, will retry")
+                return written, batch[index:]
+            else:
+                written.append(entry)
+        return written, []
+
+    def _requeue(self, batch):
+        """Put ``batch`` back at the front of the queue and back off."""
+        self._failures += 1
+        delay = min(settings.AUDIT_LOG_FLUSH_INTERVAL * 2 ** self._failures, settings.AUDIT_LOG_MAX_BACKOFF)
+        self._retry_at = time.monotonic() + delay
+        with self._lock:
+            self._entries[:0] = batch
+            dropped = self._trim()
+        self._report_dropped(dropped)
+
+    def _trim(self):
+        """Drop the oldest entries past AUDIT_LOG_MAX_PENDING; call with the lock held."""
+        overflow = len(self._entries) - settings.AUDIT_LOG_MAX_PENDING
+        if overflow <= 0:
+            return 0
+        del self._entries[:overflow]
+        return overflow
+
+    def _report_dropped(self, dropped):
+        if dropped:
+            logger.critical(
+                "Audit log buffer full (%d entries): dropped the %d oldest entries",
+                settings.AUDIT_LOG_MAX_PENDING, dropped,
+            )
+
+    def _ensure_flusher(self):
+        """Start the background flusher if enabled; return whether it runs."""
+        if self._stopped or settings.AUDIT_LOG_FLUSH_INTERVAL <= 0:
+            return False
+        with self._lock:
+            # A flusher that died is replaced rather than leaving entries queued
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-log-flusher", daemon=True)
+                self._thread.start()
+        return True
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(settings.AUDIT_LOG_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.exception("Audit log flush failed")
+
+
+audit_buffer = AuditBuffer()
+atexit.register(audit_buffer.shutdown)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+
+from backend.db_router import primary_reads, reads_from_replica
+
+from .models import FormVersion
+from .versioning import resolve_schema
+
+
+def compute_etag(data):
+    """Strong ETag over the canonical JSON form of ``data``."""
+    encoded = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return f'"{hashlib.sha256(encoded).hexdigest()[:32]}"'
+
+
+def etag_matches(request, etag):
+    """True when the request's If-None-Match covers ``etag``."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class LocalLRU:
+    """Small thread-safe in-process LRU used as the first cache tier."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SchemaCache:
+    """Two-tier cache for form schemas served to the onboarding pages.
+
+    Version payloads are keyed by (form id, version, token), where the token
+    is the version's schema hash and creation time. It changes whenever a
+    version is edited, or deleted and recreated, so an entry never goes
+    stale. Entries are kept in a local LRU in front of the shared Django
+    cache and never expire. Anything that can change (the token a version
+    number currently has, the active version number and the form detail
+    payload) lives only in the shared tier, so one invalidation reaches
+    every process.
+    """
+
+    def __init__(self):
+        self.local = LocalLRU(settings.FORM_SCHEMA_LRU_SIZE)
+
+    @property
+    def shared(self):
+        return caches[settings.FORM_SCHEMA_CACHE_ALIAS]
+
+    @staticmethod
+    def version_key(form_id, version_number, token):
+        return f"form-schema:{form_id}:{version_number}:{token}"
+
+    @staticmethod
+    def token_key(form_id, version_number):
+        return f"form-version-token:{form_id}:{version_number}"
+
+    @staticmethod
+    def version_token(version):
+        return f"{version.schema_hash}:{version.created_at.timestamp()}"
+
+    @staticmethod
+    def active_key(form_id):
+        return f"form-active:{form_id}"
+
+    @staticmethod
+    def detail_key(form_id):
+        return f"form-detail:{form_id}"
+
+    def get_entry(self, key):
+        entry = self.local.get(key)
+        if entry is None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.set(key, entry)
+        return entry
+
+    def get_version(self, form_id, version_number):
+        """Entry of a version by number, under the token it has now."""
+        token = self.shared.get(self.token_key(form_id, version_number))
+        if token is None:
+            return None
+        return self.get_entry(self.version_key(form_id, version_number, token))
+
+    def set_version(self, version):
+        """Cache ``version``'s payload under its token and return the entry.
+
+        The schema is stored fully resolved, so a diff version is rebuilt
+        from its base at most once per cache lifetime.
+        """
+        data = {
+            "version": version.version,
+            "created_at": version.created_at,
+            "schema": resolve_schema(version),
+        }
+        entry = {"data": data, "etag": compute_etag(data)}
+        token = self.version_token(version)
+        key = self.version_key(version.form_id, version.version, token)
+        self.shared.set_many({key: entry, self.token_key(version.form_id, version.version): token}, timeout=None)
+        self.local.set(key, entry)
+        return entry
+
+    def get_schema(self, version):
+        """Full schema of ``version``; treat it as read-only, it is shared."""
+        entry = self.get_entry(self.version_key(version.form_id, version.version, self.version_token(version)))
+        if entry is None:
+            if reads_from_replica():
+                # Cache what the primary has, not what a lagging replica returned
+                with primary_reads():
+                    version = FormVersion.objects.select_related("base").get(pk=version.pk)
+            entry = self.set_version(version)
+        return entry["data"]["schema"]
+
+    def get_active_version(self, form_id):
+        """Active version number of a form, loaded from the DB on a miss."""
+        key = self.active_key(form_id)
+        number = self.shared.get(key)
+        if number is None:
+            with primary_reads():
+                number = (
+                    FormVersion.objects.filter(form_id=form_id, is_active=True)
+                    .order_by("-version").values_list("version", flat=True).first()
+                ) or 0
+            self.shared.set(key, number, timeout=settings.FORM_SCHEMA_CACHE_TIMEOUT)
+        return number
+
+    def get_detail(self, form_id):
+        return self.shared.get(self.detail_key(form_id))
+
+    def set_detail(self, form_id, data):
+        entry = {"data": data, "etag": compute_etag(data)}
+        self.shared.set(self.detail_key(form_id), entry, timeout=settings.FORM_SCHEMA_CACHE_TIMEOUT)
+        return entry
+
+    def invalidate_form(self, form_id):
+        """Drop the mutable entries of a form, e.g. after a new version is activated."""
+        self.shared.delete_many([self.active_key(form_id), self.detail_key(form_id)])
+
+    def forget_form(self, form_id, version_numbers):
+        """Drop the shared entries of edited or deleted versions of a form.
+
+        Other processes may still hold the old payloads in their local tier,
+        but only under the old tokens, which nothing looks up anymore.
+        """
+        token_keys = [self.token_key(form_id, number) for number in version_numbers]
+        tokens = self.shared.get_many(token_keys)
+        keys = [
+            self.version_key(form_id, number, tokens[token_key])
+            for number, token_key in zip(version_numbers, token_keys)
+            if token_key in tokens
+        ]
+        for key in keys:
+            self.local.delete(key)
+        self.shared.delete_many(keys + token_keys + [self.active_key(form_id), self.detail_key(form_id)])
+
+
+schema_cache = SchemaCache()
@@ -0,0 +1,97 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ClientSubmission, ClientSubmissionData
+from .storage import document_items
+
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class Echo:
+    """File-like object whose ``write`` hands the value back, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_columns(form_version):
+    """Return ``[(field_id, column_name), ...]`` for every field of the version.
+
+    Duplicate labels get the field id appended so every column is unique.
+    """
+    columns, seen = [], set()
+    for field_id, name in form_version.field_links.order_by("position").values_list("field_id", "field__name"):
+        column = name or f"field_{field_id}"
+        if column in seen:
+            column = f"{column} ({field_id})"
+        seen.add(column)
+        columns.append((field_id, column))
+    return columns
+
+
+def iter_submission_rows(form_version, chunk_size=None):
+    """Yield ``(submission_id, created_at, created_by_id, {field_id: value})``.
+
+    Submissions and their answers are read with two server-side cursors, both
+    ordered by submission id, and merged as they stream, so memory does not
+    grow with the number of rows exported. Document submissions carry their
+    answers themselves.
+    """
+    chunk_size = chunk_size or settings.SUBMISSION_EXPORT_CHUNK_SIZE
+    submissions = (
+        ClientSubmission.objects.filter(form_version=form_version)
+        .order_by("id")
+        .values_list("id", "created_at", "created_by_id", "answers")
+        .iterator(chunk_size=chunk_size)
+    )
+    answers = (
+        ClientSubmissionData.objects.filter(submission__form_version=form_version)
+        .order_by("submission_id")
+        .values_list("submission_id", "field_id", "value")
+        .iterator(chunk_size=chunk_size)
+    )
+
+    pending = next(answers, None)
+    for submission_id, created_at, created_by_id, document in submissions:
+        if document is not None:
+            # Document layout: no answer rows to merge
+            yield submission_id, created_at, created_by_id, dict(document_items(document))
+            continue
+        values = {}
+        while pending is not None and pending[0] <= submission_id:
+            if pending[0] == submission_id:
+                values[pending[1]] = pending[2]
+            pending = next(answers, None)
+        yield submission_id, created_at, created_by_id, values
+
+
+def stream_csv(form_version):
+    columns = export_columns(form_version)
+    writer = csv.writer(Echo())
+    yield writer.writerow(["submission_id", "created_at", "created_by"] + [name for _, name in columns])
+    for submission_id, created_at, created_by_id, values in iter_submission_rows(form_version):
+        yield writer.writerow(
+            [submission_id, created_at.isoformat(), created_by_id]
+            + [values.get(field_id, "") for field_id, _ in columns]
+        )
+
+
+def stream_ndjson(form_version):
+    columns = export_columns(form_version)
+    for submission_id, created_at, created_by_id, values in iter_submission_rows(form_version):
+        row = {"submission_id": submission_id, "created_at": created_at, "created_by": created_by_id}
+        row.update((name, values.get(field_id)) for field_id, name in columns)
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def stream_export(form_version, output):
+    if output == "ndjson":
+        return stream_ndjson(form_version)
+    return stream_csv(form_version)
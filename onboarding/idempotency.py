@@ -0,0 +1,157 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .cache import LocalLRU
+from .models import IdempotencyKey
+from .versioning import canonical_json
+
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+
+# (user id, key) -> (fingerprint, status code, data, expires_at) of finished
+# requests, so hot retries are answered without a query
+_responses = LocalLRU(settings.IDEMPOTENCY_CACHE_SIZE)
+
+
+def fingerprint(request):
+    """Hash of what makes a retry the same request: method, path and body."""
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    return hashlib.sha256(canonical_json([request.method, request.path, data]).encode()).hexdigest()
+
+
+def replay(status_code, data):
+    return Response(data, status=status_code, headers={REPLAYED_HEADER: "true"})
+
+
+def in_progress():
+    return Response(
+        {"error": "A request with this Idempotency-Key is still in progress."},
+        status=409,
+        headers={"Retry-After": "1"},
+    )
+
+
+def mismatch():
+    return Response({"error": "This Idempotency-Key was already used with a different request."}, status=422)
+
+
+def claim(user, key, request_fingerprint, now):
+    """Take ``key`` for this request.
+
+    Returns ``(record, None)`` when the caller holds the key and must run the
+    request, or ``(None, response)`` with the response to send instead. The
+    unique (user, key) constraint is the lock, so of simultaneous retries
+    only one runs. Expired keys and locks older than IDEMPOTENCY_LOCK_TIMEOUT
+    are taken over with a compare-and-set on ``locked_at`` and
+    ``status_code``. A finished request stores its response in the
+    transaction that creates its submission, so a lock still without one
+    has no submission behind it and can safely run again.
+    """
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=request_fingerprint, locked_at=now, expires_at=expires_at
+            )
+        return record, None
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        # Released by a failed request in the meantime
+        return None, in_progress()
+
+    abandoned = record.status_code is None and record.locked_at <= now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    if record.expires_at <= now or abandoned:
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, locked_at=record.locked_at, status_code__isnull=record.status_code is None
+        ).update(
+            fingerprint=request_fingerprint, status_code=None, response=None, locked_at=now, expires_at=expires_at
+        )
+        if not taken:
+            return None, in_progress()
+        record.fingerprint, record.status_code, record.response = request_fingerprint, None, None
+        record.locked_at, record.expires_at = now, expires_at
+        return record, None
+
+    if record.status_code is None:
+        return None, in_progress()
+    if record.fingerprint != request_fingerprint:
+        return None, mismatch()
+    return None, replay(record.status_code, record.response)
+
+
+def idempotent_response(request, key, handler):
+    """Run ``handler`` at most once per (user, key) and replay its response to retries.
+
+    ``handler`` runs in a transaction that also stores its response on the
+    key, so the submission and the stored response commit together. If it
+    raises (DRF validation errors included, so 4xx errors raised by the view
+    are not stored) or returns a 5xx, it is rolled back and the key
+    released so the client can retry with the same key. If the lock was
+    taken over meanwhile by a retry, this request is rolled back instead.
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        return Response({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters."}, status=400)
+
+    request_fingerprint = fingerprint(request)
+    now = timezone.now()
+    cache_key = (request.user.pk, key)
+    cached = _responses.get(cache_key)
+    if cached is not None and cached[3] > now:
+        if cached[0] != request_fingerprint:
+            return mismatch()
+        return replay(cached[1], cached[2])
+
+    record, response = claim(request.user, key, request_fingerprint, now)
+    if response is not None:
+        return response
+
+    try:
+        with transaction.atomic():
+            response = handler()
+            if response.status_code >= 500:
+                transaction.set_rollback(True)
+            else:
+                stored = IdempotencyKey.objects.filter(
+                    pk=record.pk, locked_at=record.locked_at, status_code__isnull=True
+                ).update(status_code=response.status_code, response=response.data)
+                if not stored:
+                    # A retry took the lock over; it answers for the key now
+                    transaction.set_rollback(True)
+                    return in_progress()
+    except Exception:
+        release(record)
+        raise
+    if response.status_code >= 500:
+        release(record)
+        return response
+
+    _responses.set(cache_key, (request_fingerprint, response.status_code, response.data, record.expires_at))
+    return response
+
+
+def release(record):
+    """Give up a lock this request still holds."""
+    IdempotencyKey.objects.filter(pk=record.pk, locked_at=record.locked_at, status_code__isnull=True).delete()
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches; returns how many were deleted."""
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
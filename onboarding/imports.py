@@ -0,0 +1,177 @@
+import csv
+import json
+
+from django.conf import settings
+from django.db import transaction
+
+from .analytics import count_submissions
+from .models import ClientSubmission, ClientSubmissionData
+from .search import index_answers
+from .storage import build_answers, document_of, typed_document_of, use_documents
+from .validation import get_validator
+
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+CSV_CONTENT_TYPES = ("text/csv",)
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def iter_text_lines(stream):
+    """Decode a binary line stream lazily, dropping a leading UTF-8 BOM.
+
+    Raises ImportFormatError, with the line number, for a line that is not
+    UTF-8.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            raise ImportFormatError(f"Line {line_number} is not valid UTF-8: {exc.reason}.") from exc
+        if line_number == 1:
+            text = text.lstrip("\ufeff")
+        yield text
+
+
+def iter_ndjson_rows(lines):
+    """Yield ``(row_number, answers)`` for every non-blank NDJSON line.
+
+    Each line is an object mapping field id to value. Lines that do not parse
+    are yielded with ``answers`` set to the error message.
+    """
+    for row_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            answers = json.loads(line)
+        except ValueError as exc:
+            yield row_number, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(answers, dict):
+            yield row_number, "Each line must be a JSON object keyed by field id."
+            continue
+        yield row_number, answers
+
+
+def iter_csv_rows(lines):
+    """Yield ``(row_number, answers)`` for a CSV whose header row holds field ids."""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        return
+    for row_number, row in enumerate(reader, start=1):
+        if not any(row):
+            continue
+        if len(row) != len(header):
+            yield row_number, f"Expected {len(header)} columns, got {len(row)}."
+            continue
+        yield row_number, dict(zip(header, row))
+
+
+def get_row_reader(content_type):
+    if content_type in NDJSON_CONTENT_TYPES:
+        return iter_ndjson_rows
+    if content_type in CSV_CONTENT_TYPES:
+        return iter_csv_rows
+    raise ImportFormatError(
+        f"Unsupported content type '{content_type}'. "
+        f"Use one of: {', '.join(NDJSON_CONTENT_TYPES + CSV_CONTENT_TYPES)}."
+    )
+
+
+class SubmissionImporter:
+    """Validate rows with the FormVersion's compiled validator and write them in chunks.
+
+    Only the current chunk and the (capped) error report are held in memory,
+    so uploads of any size can be streamed through ``run``.
+    """
+
+    def __init__(self, form_version, created_by, chunk_size=None):
+        self.form_version = form_version
+        self.created_by = created_by
+        self.chunk_size = chunk_size or settings.SUBMISSION_IMPORT_CHUNK_SIZE
+        self.max_errors = settings.SUBMISSION_IMPORT_MAX_ERRORS
+        self.validator = get_validator(form_version)
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def clean_row(self, answers):
+        """Return ``(submission_data, errors)`` for one row's answers."""
+        values, errors = {}, {}
+        for key, value in answers.items():
+            try:
+                field_id = int(key)
+            except (TypeError, ValueError):
+                field_id = key
+            if isinstance(value, (dict, list)):
+                errors[str(key)] = ["Value must be a scalar."]
+                continue
+            values[field_id] = None if value is None else str(value)
+
+        for field_id, messages in self.validator.validate(values).items():
+            errors.setdefault(str(field_id), messages)
+
+        submission_data = [
+            {"field_id": field_id, "value": value}
+            for field_id, value in values.items()
+            if value not in (None, "")
+        ]
+        return submission_data, errors
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def write_chunk(self, chunk):
+        document = use_documents()
+        with transaction.atomic():
+            submissions = ClientSubmission.objects.bulk_create([
+                ClientSubmission(
+                    form_id=self.form_version.form_id,
+                    form_version=self.form_version,
+                    created_by=self.created_by,
+                    answers=document_of(submission_data) if document else None,
+                    typed_answers=typed_document_of(submission_data, self.validator.field_types) if document else None,
+                )
+                for submission_data in chunk
+            ])
+            answers = [
+                answer
+                for submission, submission_data in zip(submissions, chunk)
+                for answer in build_answers(submission, submission_data, self.validator.field_types)
+            ]
+            if not document:
+                ClientSubmissionData.objects.bulk_create(answers)
+            count_submissions(submissions, answers)
+            index_answers(answers)
+        self.created += len(chunk)
+
+    def run(self, rows):
+        chunk = []
+        for row_number, answers in rows:
+            if isinstance(answers, str):
+                self.add_error(row_number, {"non_field_errors": [answers]})
+                continue
+            submission_data, errors = self.clean_row(answers)
+            if errors:
+                self.add_error(row_number, errors)
+                continue
+            chunk.append(submission_data)
+            if len(chunk) >= self.chunk_size:
+                self.write_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.write_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
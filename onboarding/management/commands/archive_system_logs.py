@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from onboarding.retention import archive_month, months_to_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move SystemLogs older than the retention window into monthly gzipped "
+        "NDJSON archives and prune them from the hot table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-months", type=int, default=None,
+            help="Full months to keep hot (default: SYSTEM_LOGS_RETENTION_MONTHS)."
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only list the months that would be archived.")
+
+    def handle(self, *args, **options):
+        keep_months = options["keep_months"]
+        if keep_months is None:
+            keep_months = settings.SYSTEM_LOGS_RETENTION_MONTHS
+
+        months = months_to_archive(keep_months)
+        if not months:
+            self.stdout.write("Nothing to archive.")
+            return
+
+        for month in months:
+            if options["dry_run"]:
+                self.stdout.write(f"Would archive {month:%Y-%m}")
+                continue
+            record = archive_month(month)
+            if record:
+                self.stdout.write(self.style.SUCCESS(f"Archived {record.row_count} rows for {month:%Y-%m} to {record.path}"))
@@ -0,0 +1,114 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from onboarding.models import Forms, FormVersion, FormField
+from onboarding.services import publish_form_version
+from onboarding.versioning import canonical_json
+
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+def make_schema(field_count, per_section=20):
+    """Build a synthetic schema with ``field_count`` fields split into sections."""
+    fields = [
+        {"label": f"Field {i}", "type": "string", "required": i % 3 == 0}
+        for i in range(field_count)
+    ]
+    return [
+        {"title": f"Section {n}", "fields": fields[i:i + per_section]}
+        for n, i in enumerate(range(0, field_count, per_section))
+    ]
+
+
+def legacy_publish(form):
+    """The previous write path: one INSERT per field."""
+    version = FormVersion.objects.create(form=form, version=1, schema=form.schema, is_active=True)
+    for section in form.schema:
+        for field in section.get("fields", []):
+            FormField.objects.create(
+                form_version=version,
+                name=field.get("label"),
+                field_type=field.get("type"),
+                required=field.get("required", False)
+            )
+    return version
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure form version save latency against field count. "
+        "Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fields", type=int, nargs="+", default=[10, 50, 200, 500])
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--compare", action="store_true", help="Also time the per-row legacy path.")
+        parser.add_argument(
+            "--edits", type=int, default=0,
+            help="Also publish this many one-label edits per form and report storage.",
+        )
+
+    def handle(self, *args, **options):
+        paths = [("bulk", publish_form_version)]
+        if options["compare"]:
+            paths.append(("per-row", legacy_publish))
+
+        self.stdout.write(f"{'path':<8} {'fields':>6} {'queries':>8} {'avg ms':>9} {'min ms':>9}")
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username="bench-form-save")
+                for field_count in options["fields"]:
+                    schema = make_schema(field_count)
+                    for label, publish in paths:
+                        timings, queries = [], 0
+                        for _ in range(options["repeat"]):
+                            form = Forms.objects.create(name="Bench", schema=schema, created_by=user)
+                            with CaptureQueriesContext(connection) as ctx:
+                                start = time.perf_counter()
+                                publish(form)
+                                timings.append((time.perf_counter() - start) * 1000)
+                            queries = len(ctx.captured_queries)
+                        self.stdout.write(
+                            f"{label:<8} {field_count:>6} {queries:>8} "
+                            f"{sum(timings) / len(timings):>9.2f} {min(timings):>9.2f}"
+                        )
+                if options["edits"]:
+                    self.report_edits(user, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def report_edits(self, user, options):
+        """Publish one-label edits and compare storage with full copies."""
+        self.stdout.write(
+            f"\n{'fields':>6} {'edits':>6} {'avg ms':>9} {'stored KB':>10} "
+            f"{'full KB':>9} {'field rows':>11} {'full rows':>10}"
+        )
+        for field_count in options["fields"]:
+            form = Forms.objects.create(name="Bench", schema=make_schema(field_count), created_by=user)
+            publish_form_version(form)
+            timings = []
+            for n in range(options["edits"]):
+                form.schema[0]["fields"][n % min(field_count, 20)]["label"] = f"Edited {n}"
+                start = time.perf_counter()
+                publish_form_version(form)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            versions = list(FormVersion.objects.filter(form=form))
+            stored = sum(len(canonical_json(v.schema if v.schema is not None else v.schema_diff)) for v in versions)
+            full = len(versions) * len(canonical_json(form.schema))
+            rows = FormField.objects.filter(form_version__form=form).count()
+            self.stdout.write(
+                f"{field_count:>6} {options['edits']:>6} {sum(timings) / len(timings):>9.2f} "
+                f"{stored / 1024:>10.1f} {full / 1024:>9.1f} {rows:>11} {len(versions) * field_count:>10}"
+            )
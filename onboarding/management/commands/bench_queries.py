@@ -0,0 +1,148 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from onboarding.models import Forms, FormVersion, ClientSubmission, SystemLogs
+
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def keep_created_at(*models):
+    """Let bulk_create store explicit ``created_at`` values despite auto_now_add."""
+    fields = [model._meta.get_field("created_at") for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def hot_queries(form_id, user_id):
+    """The lookups the API runs on every request, as ``(label, queryset)``."""
+    return [
+        ("latest form version", FormVersion.objects.filter(form_id=form_id).order_by("-version")[:1]),
+        ("active form version", FormVersion.objects.filter(form_id=form_id, is_active=True)[:1]),
+        ("forms page with versions", Forms.objects.with_version_numbers()[:50]),
+        ("system logs page", SystemLogs.objects.order_by("-created_at")[:50]),
+        ("system logs by user", SystemLogs.objects.filter(user_id=user_id).order_by("-created_at")[:50]),
+        ("system logs by object", SystemLogs.objects.filter(object_type="FORMS", object_id=str(form_id))[:50]),
+        ("submissions page", ClientSubmission.objects.order_by("-created_at", "-id")[:50]),
+        ("submissions by form", ClientSubmission.objects.filter(form_id=form_id).order_by("-created_at")[:50]),
+        ("submissions by user", ClientSubmission.objects.filter(created_by_id=user_id).order_by("-created_at")[:50]),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed realistic volumes and report query plans and latencies for the "
+        "hot lookup paths. With --compare the new indexes are dropped and the "
+        "queries re-run. Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--forms", type=int, default=200)
+        parser.add_argument("--versions", type=int, default=20, help="Versions per form.")
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--submissions", type=int, default=50000)
+        parser.add_argument("--logs", type=int, default=100000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--compare", action="store_true", help="Re-run without the hot path indexes.")
+        parser.add_argument("--no-plans", action="store_true", help="Only print latencies.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        try:
+            with transaction.atomic():
+                form_id, user_id = self.seed(options, rng)
+                self.report("with indexes", form_id, user_id, options)
+                if options["compare"]:
+                    self.drop_indexes()
+                    self.report("without indexes", form_id, user_id, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def seed(self, options, rng):
+        self.stdout.write("Seeding...")
+        now = timezone.now()
+        users = User.objects.bulk_create([
+            User(username=f"bench-user-{i}") for i in range(options["users"])
+        ])
+        forms = Forms.objects.bulk_create([
+            Forms(name=f"Bench form {i}", schema=[], created_by=rng.choice(users), category="bench")
+            for i in range(options["forms"])
+        ])
+        versions = FormVersion.objects.bulk_create([
+            FormVersion(form=form, version=n, schema=[], is_active=n == options["versions"])
+            for form in forms
+            for n in range(1, options["versions"] + 1)
+        ])
+        active = [version for version in versions if version.is_active]
+
+        def spread(instances, count):
+            # Spread rows over time so ordering by created_at behaves like
+            # production data instead of one identical timestamp.
+            for instance in instances:
+                instance.created_at = now - timedelta(seconds=rng.randrange(count * 10))
+            return instances
+
+        submissions = []
+        for _ in range(options["submissions"]):
+            version = rng.choice(active)
+            submissions.append(ClientSubmission(form_id=version.form_id, form_version=version, created_by=rng.choice(users)))
+        logs = [
+            SystemLogs(
+                user=rng.choice(users),
+                action=rng.choice(["CREATE", "UPDATE", "SUBMIT"]),
+                object_type=rng.choice(["FORMS", "CLIENTSUBMISSION"]),
+                object_id=str(rng.choice(forms).id),
+                message="bench"
+            )
+            for _ in range(options["logs"])
+        ]
+        with keep_created_at(ClientSubmission, SystemLogs):
+            ClientSubmission.objects.bulk_create(spread(submissions, options["submissions"]), batch_size=5000)
+            SystemLogs.objects.bulk_create(spread(logs, options["logs"]), batch_size=5000)
+
+        if connection.vendor in ("postgresql", "sqlite"):
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        return rng.choice(forms).id, rng.choice(users).id
+
+    def drop_indexes(self):
+        names = [index.name for model in (Forms, FormVersion, ClientSubmission, SystemLogs) for index in model._meta.indexes]
+        names.append("unique_active_form_version")
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+
+    def report(self, label, form_id, user_id, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {label} =="))
+        for name, queryset in hot_queries(form_id, user_id):
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f"{name:<26} median {statistics.median(timings):8.3f} ms   "
+                f"max {max(timings):8.3f} ms"
+            )
+            if not options["no_plans"]:
+                for line in queryset.explain().splitlines():
+                    self.stdout.write(f"    {line}")
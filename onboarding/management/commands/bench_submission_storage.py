@@ -0,0 +1,112 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from onboarding.management.commands.bench_form_save import make_schema
+from onboarding.models import ClientSubmission, ClientSubmissionData, Forms
+from onboarding.serializers import ClientSubmissionSerializer
+from onboarding.services import create_submission, publish_form_version
+
+
+User = get_user_model()
+
+LAYOUTS = ("rows", "document")
+TABLES = (ClientSubmission._meta.db_table, ClientSubmissionData._meta.db_table)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def storage_bytes():
+    """Bytes used by the submission tables and their indexes, or None if unknown."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT SUM(pg_total_relation_size(name::regclass)) FROM unnest(%s) AS name", [list(TABLES)]
+            )
+            return int(cursor.fetchone()[0])
+        if connection.vendor == "sqlite":
+            placeholders = ", ".join(["%s"] * len(TABLES))
+            try:
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                    f"(SELECT name FROM sqlite_master WHERE tbl_name IN ({placeholders}))",
+                    TABLES,
+                )
+            except Exception:
+                # SQLite built without the dbstat table
+                return None
+            return int(cursor.fetchone()[0] or 0)
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the row and document submission layouts: write latency and "
+        "queries per submission, read latency of one submission and of a "
+        "50-submission page through ClientSubmissionSerializer, and storage "
+        "growth of the submission tables. Runs inside a transaction that is "
+        "rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--submissions", type=int, default=1000)
+        parser.add_argument("--fields", type=int, default=150)
+        parser.add_argument("--reads", type=int, default=200, help="Single-submission reads to time.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'layout':<9} {'write ms':>9} {'queries':>8} {'read ms':>8} {'page ms':>8} "
+            f"{'rows':>9} {'KB':>9} {'B/subm':>8}"
+        )
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username="bench-submission-storage")
+                for layout in LAYOUTS:
+                    with override_settings(SUBMISSION_STORAGE=layout):
+                        self.bench(layout, user, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def bench(self, layout, user, options):
+        form = Forms.objects.create(name="Bench", schema=make_schema(options["fields"]), created_by=user)
+        version = publish_form_version(form)
+        field_ids = list(version.field_links.order_by("position").values_list("field_id", flat=True))
+        before_bytes, before_rows = storage_bytes(), ClientSubmissionData.objects.count()
+
+        timings = []
+        for n in range(options["submissions"]):
+            answers = [{"field_id": field_id, "value": f"answer {n}-{i}"} for i, field_id in enumerate(field_ids)]
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                create_submission(answers, form=form, form_version=version, created_by=user)
+                timings.append((time.perf_counter() - start) * 1000)
+
+        after_bytes = storage_bytes()
+        rows = ClientSubmission.objects.filter(form=form).count() + ClientSubmissionData.objects.count() - before_rows
+        submissions = ClientSubmission.objects.filter(form=form).order_by("-id")
+        ids = list(submissions.values_list("id", flat=True)[:options["reads"]])
+
+        start = time.perf_counter()
+        for submission_id in ids:
+            ClientSubmissionSerializer(submissions.get(pk=submission_id)).data
+        read_ms = (time.perf_counter() - start) * 1000 / max(len(ids), 1)
+
+        start = time.perf_counter()
+        ClientSubmissionSerializer(submissions.prefetch_related("submission_data")[:50], many=True).data
+        page_ms = (time.perf_counter() - start) * 1000
+
+        if after_bytes is None:
+            kb, per_submission = "n/a", "n/a"
+        else:
+            grown = after_bytes - before_bytes
+            kb, per_submission = f"{grown / 1024:.0f}", f"{grown / options['submissions']:.0f}"
+        self.stdout.write(
+            f"{layout:<9} {sum(timings) / len(timings):>9.2f} {len(ctx.captured_queries):>8} "
+            f"{read_ms:>8.2f} {page_ms:>8.2f} {rows:>9} {kb:>9} {per_submission:>8}"
+        )
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from onboarding.validation import compile_schema
+
+
+FIELD_KINDS = [
+    ({"type": "string", "maxLength": 200}, "Jane Doe"),
+    ({"type": "number", "min": 0}, "1250.50"),
+    ({"type": "date"}, "1990-04-12"),
+    ({"type": "email"}, "jane.doe@example.com"),
+    ({"type": "select", "options": ["basic", "pro", "enterprise"]}, "pro"),
+]
+
+
+def make_form(field_count):
+    """Synthetic ``(fields, answers)`` cycling through every supported type."""
+    fields, answers = [], {}
+    for field_id in range(1, field_count + 1):
+        spec, value = FIELD_KINDS[field_id % len(FIELD_KINDS)]
+        fields.append((field_id, {**spec, "required": field_id % 2 == 0}))
+        answers[field_id] = value
+    return fields, answers
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark compiled submission validation throughput by form size."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fields", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--seconds", type=float, default=1.0, help="Time budget per form size.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'fields':>6} {'compile ms':>11} {'validations/s':>14} {'fields/s':>12}")
+        for field_count in options["fields"]:
+            fields, answers = make_form(field_count)
+
+            start = time.perf_counter()
+            validator = compile_schema(fields)
+            compile_ms = (time.perf_counter() - start) * 1000
+            assert not validator.validate(answers)
+
+            runs, start = 0, time.perf_counter()
+            deadline = start + options["seconds"]
+            while time.perf_counter() < deadline:
+                validator.validate(answers)
+                runs += 1
+            rate = runs / (time.perf_counter() - start)
+
+            self.stdout.write(f"{field_count:>6} {compile_ms:>11.3f} {rate:>14,.0f} {rate * field_count:>12,.0f}")
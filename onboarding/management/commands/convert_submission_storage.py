@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from onboarding.models import ClientSubmission
+from onboarding.storage import convert_to_documents, convert_to_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing submissions between the row and document storage "
+        "layouts (see SUBMISSION_STORAGE), one transaction per batch. Output "
+        "of the API and exports is the same for both; the search index and "
+        "analytics counters are kept as they are."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=["rows", "document"], required=True, dest="layout")
+        parser.add_argument("--form", type=int, help="Only convert submissions of this form.")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        to_documents = options["layout"] == "document"
+        # Only submissions still in the other layout
+        submissions = ClientSubmission.objects.filter(answers__isnull=to_documents).select_related("form_version")
+        if options["form"]:
+            submissions = submissions.filter(form_id=options["form"])
+        convert = convert_to_documents if to_documents else convert_to_rows
+
+        last_id, converted = 0, 0
+        while True:
+            batch = list(submissions.filter(id__gt=last_id).order_by("id")[:options["batch_size"]])
+            if not batch:
+                break
+            converted += convert(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"Converted {converted} submissions, up to id {last_id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {converted} submissions stored as {options['layout']}."))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from onboarding.models import ClientSubmission, ClientSubmissionData, FormVersion
+from onboarding.search import index_answers, mark_searchable_fields
+from onboarding.storage import answer_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill the submission search index with answers to searchable "
+        "fields, in either storage layout; answers already indexed are "
+        "skipped. Works through submissions in id order, one transaction per "
+        "batch, and prints the last id of each batch so an interrupted run "
+        "can continue with --after-id. Fields are first marked searchable "
+        "from their versions' schemas, for forms published before the flag "
+        "was read."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--after-id", type=int, default=0, help="Start after this ClientSubmission id.")
+        parser.add_argument("--form", type=int, help="Only index submissions of this form.")
+
+    def handle(self, *args, **options):
+        versions = FormVersion.objects.select_related("base").order_by("id")
+        if options["form"]:
+            versions = versions.filter(form_id=options["form"])
+        marked = mark_searchable_fields(versions.iterator(chunk_size=100))
+        self.stdout.write(f"Marked {marked} fields searchable")
+
+        submissions = ClientSubmission.objects.prefetch_related(
+            Prefetch("submission_data", queryset=ClientSubmissionData.objects.filter(field__searchable=True))
+        )
+        if options["form"]:
+            submissions = submissions.filter(form_id=options["form"])
+
+        last_id, indexed = options["after_id"], 0
+        while True:
+            batch = list(submissions.filter(id__gt=last_id).order_by("id")[:options["batch_size"]])
+            if not batch:
+                break
+            with transaction.atomic():
+                indexed += index_answers([answer for submission in batch for answer in answer_rows(submission)])
+            last_id = batch[-1].id
+            self.stdout.write(f"Indexed {indexed} answers, up to submission {last_id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {indexed} answers indexed."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from onboarding.analytics import rebuild_counters
+from onboarding.models import FieldCompletionCounter, SubmissionCounter
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the submission analytics counters (per form, version, day "
+        "and user, and field completion) from ClientSubmission rows. Use it to "
+        "backfill existing data or to repair drift; run it while the forms "
+        "are not taking submissions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--form", type=int, action="append", dest="forms", help="Only rebuild this form (repeatable).")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        rebuild_counters(options["forms"], batch_size=options["batch_size"])
+
+        counters = SubmissionCounter.objects.all()
+        completions = FieldCompletionCounter.objects.all()
+        if options["forms"]:
+            counters = counters.filter(form_id__in=options["forms"])
+            completions = completions.filter(form_version__form_id__in=options["forms"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {counters.count()} submission counters and {completions.count()} field completion counters."
+        ))
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+def deactivate_duplicate_active_versions(apps, schema_editor):
+    """Keep only the highest active version per form before adding the constraint."""
+    FormVersion = apps.get_model('onboarding', 'FormVersion')
+    seen = set()
+    stale = []
+    for pk, form_id in FormVersion.objects.filter(is_active=True).order_by('form_id', '-version').values_list('pk', 'form_id'):
+        if form_id in seen:
+            stale.append(pk)
+        seen.add(form_id)
+    FormVersion.objects.filter(pk__in=stale).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clientsubmission',
+            index=models.Index(fields=['-created_at', '-id'], name='submission_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientsubmission',
+            index=models.Index(fields=['form', '-created_at'], name='submission_form_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientsubmission',
+            index=models.Index(fields=['created_by', '-created_at'], name='submission_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forms',
+            index=models.Index(fields=['-created_at'], name='forms_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlogs',
+            index=models.Index(fields=['-created_at'], name='systemlogs_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlogs',
+            index=models.Index(fields=['user', '-created_at'], name='systemlogs_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlogs',
+            index=models.Index(fields=['object_type', 'object_id'], name='systemlogs_object_idx'),
+        ),
+        migrations.RunPython(deactivate_duplicate_active_versions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='formversion',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('form',), name='unique_active_form_version'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:00
+
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+
+def link_existing_fields(apps, schema_editor):
+    """Give every existing FormField its schema position and content hash."""
+    FormVersion = apps.get_model('onboarding', 'FormVersion')
+    FormField = apps.get_model('onboarding', 'FormField')
+    FormVersionField = apps.get_model('onboarding', 'FormVersionField')
+    for version in FormVersion.objects.order_by('pk').iterator():
+        fields = list(FormField.objects.filter(form_version=version).order_by('pk'))
+        specs = [
+            field
+            for section in (version.schema if isinstance(version.schema, list) else [])
+            if isinstance(section, dict)
+            for field in section.get('fields', [])
+        ]
+        if len(specs) == len(fields):
+            for field, spec in zip(fields, specs):
+                encoded = json.dumps(spec, sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+                field.content_hash = hashlib.sha256(encoded.encode()).hexdigest()
+            FormField.objects.bulk_update(fields, ['content_hash'], batch_size=500)
+        FormVersionField.objects.bulk_create([
+            FormVersionField(version=version, field=field, position=position)
+            for position, field in enumerate(fields)
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0003_systemlogarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formfield',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='formversion',
+            name='base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='derived', to='onboarding.formversion'),
+        ),
+        migrations.AddField(
+            model_name='formversion',
+            name='schema_diff',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='formfield',
+            name='form_version',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='introduced_fields', to='onboarding.formversion'),
+        ),
+        migrations.AlterField(
+            model_name='formversion',
+            name='schema',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='FormVersionField',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='version_links', to='onboarding.formfield')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='field_links', to='onboarding.formversion')),
+            ],
+            options={
+                'ordering': ['version', 'position'],
+            },
+        ),
+        migrations.AddField(
+            model_name='formversion',
+            name='fields',
+            field=models.ManyToManyField(blank=True, related_name='versions', through='onboarding.FormVersionField', to='onboarding.formfield'),
+        ),
+        migrations.AddConstraint(
+            model_name='formversionfield',
+            constraint=models.UniqueConstraint(fields=('version', 'position'), name='unique_version_field_position'),
+        ),
+        migrations.RunPython(link_existing_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:03
+
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+
+# Copied from onboarding.versioning as of this migration
+def schema_hash(schema):
+    encoded = json.dumps(schema, sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def apply_diff(base, diff):
+    if 'schema' in diff:
+        return diff['schema']
+    base_fields = [field for section in base for field in section.get('fields', [])]
+    schema = []
+    for item in diff['sections']:
+        if isinstance(item, int):
+            schema.append(base[item])
+            continue
+        section = dict(item['section'])
+        if 'fields' in item:
+            section['fields'] = [
+                base_fields[field] if isinstance(field, int) else field['field'] for field in item['fields']
+            ]
+        schema.append(section)
+    return schema
+
+
+def backfill_version_summaries(apps, schema_editor):
+    FormVersion = apps.get_model('onboarding', 'FormVersion')
+    versions = FormVersion.objects.select_related('base').annotate(links=models.Count('field_links'))
+    batch = []
+    for version in versions.iterator(chunk_size=500):
+        schema = version.schema
+        if schema is None and version.schema_diff is not None:
+            schema = apply_diff(version.base.schema, version.schema_diff)
+        version.schema_hash = schema_hash(schema)
+        version.field_count = version.links
+        batch.append(version)
+        if len(batch) >= 500:
+            FormVersion.objects.bulk_update(batch, ['schema_hash', 'field_count'])
+            batch = []
+    FormVersion.objects.bulk_update(batch, ['schema_hash', 'field_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0004_form_version_diffs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formversion',
+            name='field_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='formversion',
+            name='schema_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(backfill_version_summaries, migrations.RunPython.noop),
+    ]
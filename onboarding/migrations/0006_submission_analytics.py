@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0005_version_schema_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FieldCompletionCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filled', models.IntegerField(default=0)),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completion_counters', to='onboarding.formfield')),
+                ('form_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completion_counters', to='onboarding.formversion')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('form_version', 'field'), name='unique_field_completion_counter')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SubmissionCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('form', 'Form'), ('version', 'Version'), ('day', 'Day'), ('user', 'User')], max_length=10)),
+                ('key', models.CharField(blank=True, default='', max_length=40)),
+                ('count', models.IntegerField(default=0)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_counters', to='onboarding.forms')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('form', 'scope', 'key'), name='unique_submission_counter')],
+            },
+        ),
+    ]
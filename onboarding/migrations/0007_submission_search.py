@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0006_submission_analytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formfield',
+            name='searchable',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SubmissionSearchEntry',
+            fields=[
+                ('data', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='onboarding.clientsubmissiondata')),
+                ('normalized', models.CharField(max_length=255)),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='onboarding.formfield')),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='onboarding.forms')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='onboarding.clientsubmission')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['normalized'], name='search_normalized_idx'), models.Index(fields=['form', 'normalized'], name='search_form_normalized_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:14
+
+from datetime import date
+from decimal import Context, Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+
+# Copied from onboarding.validation as of this migration
+TYPED_COLUMNS = {
+    "number": "value_number",
+    "integer": "value_number",
+    "date": "value_date",
+    "boolean": "value_boolean",
+    "checkbox": "value_boolean",
+}
+NUMBER_PLACES = Decimal(1).scaleb(-10)
+NUMBER_LIMIT = Decimal(10) ** 20
+NUMBER_CONTEXT = Context(prec=30)
+
+
+def parse_typed(column, value):
+    value = str(value).strip()
+    try:
+        if column == "value_number":
+            number = Decimal(value)
+            if not number.is_finite() or abs(number) >= NUMBER_LIMIT:
+                return None
+            return number.quantize(NUMBER_PLACES, context=NUMBER_CONTEXT)
+        if column == "value_date":
+            return date.fromisoformat(value)
+    except (InvalidOperation, ValueError):
+        return None
+    lowered = value.lower()
+    if lowered in {"true", "1", "yes", "on"}:
+        return True
+    if lowered in {"false", "0", "no", "off"}:
+        return False
+    return None
+
+
+def typed_columns(field_type, value):
+    column = TYPED_COLUMNS.get(field_type)
+    if column is None:
+        return {}
+    return {column: parse_typed(column, value) if value is not None else None}
+
+
+def backfill_typed_values(apps, schema_editor):
+    ClientSubmissionData = apps.get_model('onboarding', 'ClientSubmissionData')
+    answers = (
+        ClientSubmissionData.objects.filter(field__field_type__in=TYPED_COLUMNS)
+        .select_related('field').only('id', 'value', 'field__field_type')
+    )
+    batch = []
+    for answer in answers.iterator(chunk_size=1000):
+        for column, value in typed_columns(answer.field.field_type, answer.value).items():
+            setattr(answer, column, value)
+        batch.append(answer)
+        if len(batch) >= 1000:
+            ClientSubmissionData.objects.bulk_update(batch, ['value_number', 'value_date', 'value_boolean'])
+            batch = []
+    ClientSubmissionData.objects.bulk_update(batch, ['value_number', 'value_date', 'value_boolean'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0007_submission_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientsubmissiondata',
+            name='value_boolean',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='clientsubmissiondata',
+            name='value_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='clientsubmissiondata',
+            name='value_number',
+            field=models.DecimalField(blank=True, decimal_places=10, max_digits=30, null=True),
+        ),
+        # Before the indexes, so the backfill doesn't maintain them row by row
+        migrations.RunPython(backfill_typed_values, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='clientsubmissiondata',
+            index=models.Index(fields=['field', 'value_number'], name='data_field_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientsubmissiondata',
+            index=models.Index(fields=['field', 'value_date'], name='data_field_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientsubmissiondata',
+            index=models.Index(fields=['field', 'value_boolean'], name='data_field_boolean_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:41
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copied from onboarding.search as of this migration
+SEPARATORS = re.compile(r"[\s\-()]+")
+
+
+def normalize_value(value):
+    return SEPARATORS.sub("", unicodedata.normalize("NFKC", str(value)).casefold())[:255]
+
+
+def reindex_search_entries(apps, schema_editor):
+    """Search entries are derived data; rebuild them under the new key."""
+    ClientSubmissionData = apps.get_model('onboarding', 'ClientSubmissionData')
+    SubmissionSearchEntry = apps.get_model('onboarding', 'SubmissionSearchEntry')
+    answers = (
+        ClientSubmissionData.objects.filter(field__searchable=True)
+        .values_list('submission_id', 'submission__form_id', 'field_id', 'value')
+    )
+    batch = []
+    for submission_id, form_id, field_id, value in answers.iterator(chunk_size=1000):
+        normalized = normalize_value(value)
+        if normalized:
+            batch.append(SubmissionSearchEntry(
+                submission_id=submission_id, form_id=form_id, field_id=field_id, value=value, normalized=normalized
+            ))
+        if len(batch) >= 1000:
+            SubmissionSearchEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    SubmissionSearchEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0008_typed_submission_values'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientsubmission',
+            name='answers',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='clientsubmission',
+            index=models.Index(condition=models.Q(('answers__isnull', False)), fields=['form'], name='submission_document_form_idx'),
+        ),
+        # Entries were keyed by their ClientSubmissionData row, which document
+        # submissions don't have; recreate them keyed by (submission, field)
+        migrations.DeleteModel(
+            name='SubmissionSearchEntry',
+        ),
+        migrations.CreateModel(
+            name='SubmissionSearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.TextField()),
+                ('normalized', models.CharField(max_length=255)),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='onboarding.formfield')),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='onboarding.forms')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='onboarding.clientsubmission')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['normalized'], name='search_normalized_idx'),
+                    models.Index(fields=['form', 'normalized'], name='search_form_normalized_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('submission', 'field'), name='unique_search_entry'),
+                ],
+            },
+        ),
+        migrations.RunPython(reindex_search_entries, migrations.RunPython.noop),
+    ]
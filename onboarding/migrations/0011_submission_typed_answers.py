@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:34
+
+from datetime import date
+from decimal import Context, Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+
+# Copied from onboarding.validation.parse_typed as of this migration
+TYPED_TYPES = {"number", "integer", "date", "boolean", "checkbox"}
+NUMBER_PLACES = Decimal(1).scaleb(-10)
+NUMBER_LIMIT = Decimal(10) ** 20
+NUMBER_CONTEXT = Context(prec=30)
+
+
+def typed_text(field_type, value):
+    value = str(value).strip()
+    try:
+        if field_type in ("number", "integer"):
+            number = Decimal(value)
+            if not number.is_finite() or abs(number) >= NUMBER_LIMIT:
+                return None
+            return str(number.quantize(NUMBER_PLACES, context=NUMBER_CONTEXT))
+        if field_type == "date":
+            return date.fromisoformat(value).isoformat()
+    except (InvalidOperation, ValueError):
+        return None
+    lowered = value.lower()
+    if lowered in {"true", "1", "yes", "on"}:
+        return "true"
+    if lowered in {"false", "0", "no", "off"}:
+        return "false"
+    return None
+
+
+def backfill_typed_answers(apps, schema_editor):
+    ClientSubmission = apps.get_model('onboarding', 'ClientSubmission')
+    FormField = apps.get_model('onboarding', 'FormField')
+    submissions = ClientSubmission.objects.filter(answers__isnull=False).only('id', 'answers')
+    batch = []
+    for submission in submissions.iterator(chunk_size=1000):
+        batch.append(submission)
+        if len(batch) >= 1000:
+            fill_typed_answers(FormField, batch)
+            ClientSubmission.objects.bulk_update(batch, ['typed_answers'])
+            batch = []
+    fill_typed_answers(FormField, batch)
+    ClientSubmission.objects.bulk_update(batch, ['typed_answers'])
+
+
+def fill_typed_answers(FormField, submissions):
+    field_ids = {int(field_id) for submission in submissions for field_id in submission.answers}
+    field_types = dict(
+        FormField.objects.filter(id__in=field_ids, field_type__in=TYPED_TYPES).values_list('id', 'field_type')
+    )
+    for submission in submissions:
+        submission.typed_answers = {}
+        for field_id, value in submission.answers.items():
+            field_type = field_types.get(int(field_id))
+            text = typed_text(field_type, value) if field_type and value is not None else None
+            if text is not None:
+                submission.typed_answers[field_id] = text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0010_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientsubmission',
+            name='typed_answers',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_typed_answers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0011_submission_typed_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemlogarchive',
+            name='index',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
@@ -17,6 +18,22 @@ class User(AbstractUser):
             self.role = 'admin'
         super().save(*args, **kwargs)
 
+class FormsQuerySet(models.QuerySet):
+    def with_version_numbers(self):
+        """Annotate ``latest_version_number`` and ``active_version_number``.
+
+        Both come from correlated subqueries so listing forms needs no
+        per-row version lookups.
+        """
+        versions = FormVersion.objects.filter(form=models.OuterRef('pk'))
+        return self.annotate(
+            latest_version_number=models.Subquery(versions.order_by('-version').values('version')[:1]),
+            active_version_number=models.Subquery(
+                versions.filter(is_active=True).order_by('-created_at').values('version')[:1]
+            ),
+        )
+
+
 class Forms(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -30,26 +47,59 @@ class Forms(models.Model):
         help_text="List of emails to notify on submission"
     )
 
+    objects = FormsQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='forms_created_idx'),
+        ]
       
 
     def __str__(self):
-        latest_version = self.versions.order_by('-version').first()
-        version_num = latest_version.version if latest_version else 'No version'
+        if hasattr(self, 'latest_version_number'):
+            version_num = self.latest_version_number
+        else:
+            latest_version = self.versions.order_by('-version').first()
+            version_num = latest_version.version if latest_version else None
+        version_num = version_num if version_num is not None else 'No version'
         return f"{self.name} - Version: {version_num}"
     
 
 class FormVersion(models.Model):
+    """A published form schema.
+
+    Snapshots hold the full ``schema``. Other versions leave it null and
+    store ``schema_diff`` against ``base``, the latest snapshot when they were
+    published; see ``onboarding.versioning``. ``fields`` may share FormField
+    rows with earlier versions when a field did not change.
+    """
     form = models.ForeignKey(Forms, related_name='versions', on_delete=models.CASCADE)
     version = models.IntegerField()
-    schema = models.JSONField()
+    schema = models.JSONField(null=True, blank=True)
+    base = models.ForeignKey(
+        'self', null=True, blank=True, related_name='derived', on_delete=models.RESTRICT
+    )
+    schema_diff = models.JSONField(null=True, blank=True)
+    # Computed once at publish time so version history never loads schemas
+    schema_hash = models.CharField(max_length=64, blank=True, default='')
+    field_count = models.PositiveIntegerField(default=0)
+    fields = models.ManyToManyField(
+        'FormField', through='FormVersionField', related_name='versions', blank=True
+    )
     is_active = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         constraints = [
-            models.UniqueConstraint(fields=['form', 'version'], name='unique_form_version')
+            # Also serves "versions of a form ordered by -version" lookups
+            models.UniqueConstraint(fields=['form', 'version'], name='unique_form_version'),
+            # At most one active version per form; doubles as the active lookup index
+            models.UniqueConstraint(
+                fields=['form'],
+                condition=models.Q(is_active=True),
+                name='unique_active_form_version'
+            ),
         ]
 
 
@@ -58,31 +108,164 @@ class ClientSubmission(models.Model):
     form_version = models.ForeignKey(FormVersion, related_name='submissions', on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    # Document layout: {"<field id>": "<value>"}. Null when the answers are
+    # ClientSubmissionData rows; see onboarding.storage
+    answers = models.JSONField(null=True, blank=True)
+    # The answers of a document submission that parse for their field type,
+    # as text: {"<field id>": "1500.0000000000" | "2000-01-01" | "true"}
+    typed_answers = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='submission_created_idx'),
+            models.Index(fields=['form', '-created_at'], name='submission_form_created_idx'),
+            models.Index(fields=['created_by', '-created_at'], name='submission_user_created_idx'),
+            # Finds a form's document submissions without scanning its rows
+            models.Index(
+                fields=['form'], condition=models.Q(answers__isnull=False), name='submission_document_form_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Submission {self.id} for {self.form}"
     
 
 class FormField(models.Model):
-    form_version = models.ForeignKey(FormVersion, related_name="fields", on_delete=models.CASCADE)
+    # The version that introduced the field; later versions link to it
+    # through FormVersionField while the field stays unchanged
+    form_version = models.ForeignKey(FormVersion, related_name="introduced_fields", on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     field_type = models.CharField(max_length=50)  # 'string', 'date', 'number', etc.
     required = models.BooleanField(default=False)
-
-    
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    # "searchable": true in the schema; answers are indexed in SubmissionSearchEntry
+    searchable = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.name} ({self.field_type})"
 
 
+class FormVersionField(models.Model):
+    """A field of a form version, at its position in the flattened schema."""
+    version = models.ForeignKey(FormVersion, related_name="field_links", on_delete=models.CASCADE)
+    field = models.ForeignKey(FormField, related_name="version_links", on_delete=models.CASCADE)
+    position = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["version", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["version", "position"], name="unique_version_field_position"),
+        ]
+
+
 class ClientSubmissionData(models.Model):
     submission = models.ForeignKey(ClientSubmission, related_name="submission_data", on_delete=models.CASCADE)
     field = models.ForeignKey(FormField, on_delete=models.CASCADE)
     value = models.TextField()
+    # The answer parsed for the field's type (see validation.TYPED_COLUMNS),
+    # so filters and aggregates need no casts and can use the indexes below
+    value_number = models.DecimalField(max_digits=30, decimal_places=10, null=True, blank=True)
+    value_date = models.DateField(null=True, blank=True)
+    value_boolean = models.BooleanField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["field", "value_number"], name="data_field_number_idx"),
+            models.Index(fields=["field", "value_date"], name="data_field_date_idx"),
+            models.Index(fields=["field", "value_boolean"], name="data_field_boolean_idx"),
+        ]
 
     def __str__(self):
         return f"{self.field.name}: {self.value}"
 
+class SubmissionCounter(models.Model):
+    """Running submission count of a form, kept up to date by ``onboarding.analytics``.
+
+    ``scope`` picks the breakdown and ``key`` the bucket within it: "" for
+    the form total, the FormVersion id, the ISO day, or the user id.
+    """
+    SCOPE_CHOICES = (
+        ('form', 'Form'),
+        ('version', 'Version'),
+        ('day', 'Day'),
+        ('user', 'User'),
+    )
+
+    form = models.ForeignKey(Forms, related_name='submission_counters', on_delete=models.CASCADE)
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=40, blank=True, default='')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['form', 'scope', 'key'], name='unique_submission_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.form_id} {self.scope}:{self.key} = {self.count}"
+
+
+class FieldCompletionCounter(models.Model):
+    """Submissions of a form version that answered ``field`` with a non-blank value."""
+    form_version = models.ForeignKey(FormVersion, related_name='completion_counters', on_delete=models.CASCADE)
+    field = models.ForeignKey(FormField, related_name='completion_counters', on_delete=models.CASCADE)
+    filled = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['form_version', 'field'], name='unique_field_completion_counter'),
+        ]
+
+
+class SubmissionSearchEntry(models.Model):
+    """Normalised answer to a searchable field, see ``onboarding.search``.
+
+    Keyed by submission and field rather than ClientSubmissionData so that
+    document submissions are indexed too; ``value`` is the raw answer.
+    """
+    submission = models.ForeignKey(ClientSubmission, related_name='search_entries', on_delete=models.CASCADE)
+    form = models.ForeignKey(Forms, related_name='search_entries', on_delete=models.CASCADE)
+    field = models.ForeignKey(FormField, related_name='search_entries', on_delete=models.CASCADE)
+    value = models.TextField()
+    normalized = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['submission', 'field'], name='unique_search_entry'),
+        ]
+        indexes = [
+            # Exact lookups and prefix ranges, across forms or within one
+            models.Index(fields=['normalized'], name='search_normalized_idx'),
+            models.Index(fields=['form', 'normalized'], name='search_form_normalized_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """A client's Idempotency-Key and the response it produced, see ``onboarding.idempotency``.
+
+    ``status_code`` stays null while the first request holding the key runs;
+    ``locked_at`` lets another request take over a lock that was abandoned.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='idempotency_keys', on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="Hash of the request the key was first used with")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} ({self.status_code or 'in progress'})"
+
+
 class NotificationSettings(models.Model):
     form = models.ForeignKey(Forms,related_name='notifications', on_delete=models.CASCADE)
     type = models.CharField(max_length=100, choices=(('email', 'Email'), ('sms', 'SMS'), ('whatsapp', 'Whatsapp')))
@@ -123,6 +306,28 @@ class SystemLogs(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["-created_at"], name="systemlogs_created_idx"),
+            models.Index(fields=["user", "-created_at"], name="systemlogs_user_created_idx"),
+            models.Index(fields=["object_type", "object_id"], name="systemlogs_object_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.action} - {self.object_type} - {self.object_id}"
+
+
+class SystemLogArchive(models.Model):
+    """One month of SystemLogs moved out of the hot table into a gzipped NDJSON file."""
+    month = models.DateField(unique=True, help_text="First day of the archived month")
+    path = models.CharField(max_length=500)
+    row_count = models.IntegerField()
+    # [[created_at, id, byte offset]] of the first row of each gzip member,
+    # newest first; empty for archives written before members were indexed
+    index = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-month"]
+
+    def __str__(self):
+        return f"System logs {self.month:%Y-%m} ({self.row_count} rows)"
@@ -0,0 +1,21 @@
+from rest_framework.pagination import CursorPagination
+
+
+class SubmissionCursorPagination(CursorPagination):
+    """Keyset pagination over (created_at, id), newest first.
+
+    Page cost stays constant however deep the client scrolls, unlike
+    offset pagination on a table with millions of rows.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-created_at', '-id')
+
+
+class FormVersionCursorPagination(CursorPagination):
+    """Version history of one form, newest version first."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-version',)
@@ -0,0 +1,193 @@
+import base64
+import gzip
+import heapq
+import io
+import json
+import os
+from datetime import date, datetime, time, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import SystemLogs, SystemLogArchive
+from .serializers import SystemLogsSerializer
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """UTC datetimes ``[start, end)`` covering ``month``."""
+    start = datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+    end = datetime.combine(add_months(month, 1), time.min, tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def archive_path(month):
+    return Path(settings.SYSTEM_LOGS_ARCHIVE_DIR) / f"system_logs_{month:%Y_%m}.ndjson.gz"
+
+
+def serialize_log(log):
+    """Archive representation: the API fields plus ``user_id``."""
+    return {**SystemLogsSerializer(log).data, "user_id": log.user_id}
+
+
+def archive_sort_key(row):
+    return parse_datetime(row["created_at"]), row["id"]
+
+
+def read_archive(path, offset=0):
+    """Rows of an archive file, starting at the gzip member at byte ``offset``."""
+    with open(path, "rb") as raw:
+        raw.seek(offset)
+        with gzip.GzipFile(fileobj=raw, mode="rb") as archive:
+            for line in io.TextIOWrapper(archive, encoding="utf-8"):
+                yield json.loads(line)
+
+
+def write_archive(path, rows):
+    """Write ``rows`` as gzip members of SYSTEM_LOGS_ARCHIVE_BLOCK_ROWS rows each.
+
+    Returns ``(row_count, index)`` where ``index`` lists ``[created_at, id,
+    byte offset]`` of the first row of every member, so readers can seek to
+    the member holding a cursor instead of decompressing the month from the
+    start. The concatenated members still read as one gzip file.
+    """
+    block_rows = settings.SYSTEM_LOGS_ARCHIVE_BLOCK_ROWS
+    row_count, index, block = 0, [], None
+    with open(path, "wb") as raw:
+        for row in rows:
+            if row_count % block_rows == 0:
+                if block is not None:
+                    block.close()
+                index.append([row["created_at"], row["id"], raw.tell()])
+                block = gzip.GzipFile(fileobj=raw, mode="wb")
+            block.write((json.dumps(row) + "\n").encode("utf-8"))
+            row_count += 1
+        if block is not None:
+            block.close()
+    return row_count, index
+
+
+def archive_offset(index, cursor):
+    """Byte offset of the archive member holding the first row after ``cursor``.
+
+    ``index`` is newest first; the member wanted is the last one starting at
+    or above the cursor. Archives written without an index are read whole.
+    """
+    lo, hi = 0, len(index)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if (parse_datetime(index[mid][0]), index[mid][1]) >= cursor:
+            lo = mid + 1
+        else:
+            hi = mid
+    return index[lo - 1][2] if lo else 0
+
+
+def archive_month(month):
+    """Move every hot SystemLogs row of ``month`` into its archive file.
+
+    Rows are streamed to disk newest first, the order the read API serves
+    them in. If the month was archived before, its file is merged with the
+    new rows.
+    """
+    start, end = month_bounds(month)
+    hot = SystemLogs.objects.filter(created_at__gte=start, created_at__lt=end)
+    if not hot.exists():
+        return None
+
+    path = archive_path(month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = (serialize_log(log) for log in hot.order_by("-created_at", "-id").iterator(chunk_size=2000))
+    existing = SystemLogArchive.objects.filter(month=month).first()
+    if existing:
+        rows = heapq.merge(rows, read_archive(existing.path), key=archive_sort_key, reverse=True)
+
+    tmp_path = path.with_suffix(".tmp")
+    row_count, index = write_archive(tmp_path, rows)
+    os.replace(tmp_path, path)
+
+    with transaction.atomic():
+        record, _ = SystemLogArchive.objects.update_or_create(
+            month=month, defaults={"path": str(path), "row_count": row_count, "index": index}
+        )
+        hot.delete()
+    return record
+
+
+def months_to_archive(keep_months):
+    """Months with hot rows older than the last ``keep_months`` months."""
+    cutoff, _ = month_bounds(add_months(month_start(timezone.now()), -keep_months))
+    months = (
+        SystemLogs.objects.filter(created_at__lt=cutoff)
+        .annotate(month=TruncMonth("created_at", tzinfo=dt_timezone.utc))
+        .values_list("month", flat=True)
+        .distinct()
+    )
+    return sorted({month_start(value) for value in months})
+
+
+def encode_cursor(row):
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` from a cursor; raises ValueError if malformed."""
+    try:
+        created_at, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(created_at)
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if created_at is None or not isinstance(log_id, int):
+        raise ValueError("Invalid cursor")
+    return created_at, log_id
+
+
+def read_logs(limit, cursor=None):
+    """One keyset page over hot and archived logs, newest first.
+
+    Returns ``(rows, next_cursor)``. Archived months are always older than
+    the hot table, so the hot table is read first and archives continue from
+    where it runs out, newest month first. Within the cursor's month, reading
+    starts at the archive member holding the cursor, so a page decodes at
+    most SYSTEM_LOGS_ARCHIVE_BLOCK_ROWS rows it doesn't return.
+    """
+    hot = SystemLogs.objects.order_by("-created_at", "-id")
+    if cursor:
+        created_at, log_id = cursor
+        hot = hot.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=log_id))
+    rows = SystemLogsSerializer(hot[:limit + 1], many=True).data
+
+    if len(rows) <= limit:
+        archives = SystemLogArchive.objects.order_by("-month")
+        if cursor:
+            archives = archives.filter(month__lte=month_start(cursor[0]))
+        for archive in archives:
+            offset = archive_offset(archive.index, cursor) if cursor else 0
+            for row in read_archive(archive.path, offset):
+                if cursor and archive_sort_key(row) >= cursor:
+                    continue
+                row.pop("user_id", None)
+                rows.append(row)
+                if len(rows) > limit:
+                    break
+            if len(rows) > limit:
+                break
+
+    rows = list(rows)
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
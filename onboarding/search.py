@@ -0,0 +1,84 @@
+import re
+import unicodedata
+
+from .models import FormField, SubmissionSearchEntry
+from .validation import schema_fields
+from .versioning import resolve_schema
+
+
+MAX_LENGTH = SubmissionSearchEntry._meta.get_field("normalized").max_length
+
+# Dropped so "0712 345-678" and "0712345678" match
+SEPARATORS = re.compile(r"[\s\-()]+")
+
+
+def normalize_value(value):
+    """Lookup form of an answer or a query: NFKC, case-folded, without spaces, dashes or brackets."""
+    return SEPARATORS.sub("", unicodedata.normalize("NFKC", str(value)).casefold())[:MAX_LENGTH]
+
+
+def mark_searchable_fields(versions):
+    """Set ``FormField.searchable`` from the schemas of ``versions``.
+
+    For fields written before the flag was read from schemas; fields are
+    matched to the schema by their link position. Returns how many were marked.
+    """
+    field_ids = []
+    for version in versions:
+        flags = [bool(field.get("searchable", False)) for field in schema_fields(resolve_schema(version))]
+        for field_id, position in version.field_links.values_list("field_id", "position"):
+            if position < len(flags) and flags[position]:
+                field_ids.append(field_id)
+    return FormField.objects.filter(id__in=field_ids, searchable=False).update(searchable=True)
+
+
+def search_entries(answers):
+    """Unsaved SubmissionSearchEntry rows for the answers to searchable fields.
+
+    ``answers`` are ClientSubmissionData rows of saved submissions, saved
+    or not (document layout), with their submission loaded; one query finds
+    which of their fields are searchable.
+    """
+    field_ids = {answer.field_id for answer in answers}
+    if not field_ids:
+        return []
+    searchable = set(FormField.objects.filter(id__in=field_ids, searchable=True).values_list("id", flat=True))
+    entries = []
+    for answer in answers:
+        normalized = normalize_value(answer.value) if answer.field_id in searchable else ""
+        if normalized:
+            entries.append(SubmissionSearchEntry(
+                submission_id=answer.submission_id,
+                form_id=answer.submission.form_id,
+                field_id=answer.field_id,
+                value=answer.value,
+                normalized=normalized,
+            ))
+    return entries
+
+
+def index_answers(answers):
+    """Add the searchable ``answers`` to the index; already indexed answers are skipped."""
+    entries = search_entries(answers)
+    if entries:
+        SubmissionSearchEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def search_answers(query, prefix=False, form_id=None, field_id=None, limit=20):
+    """Index entries whose value equals (or starts with) ``query`` once normalised.
+
+    Prefix matches are a range on the normalised column, so both exact and
+    prefix lookups are served by ``search_normalized_idx``.
+    """
+    term = normalize_value(query)
+    entries = SubmissionSearchEntry.objects.select_related("field")
+    if form_id is not None:
+        entries = entries.filter(form_id=form_id)
+    if field_id is not None:
+        entries = entries.filter(field_id=field_id)
+    if prefix:
+        entries = entries.filter(normalized__gte=term, normalized__lt=term + "\U0010ffff", normalized__startswith=term)
+    else:
+        entries = entries.filter(normalized=term)
+    return list(entries.order_by("normalized", "-submission_id")[:limit])
@@ -2,6 +2,10 @@ from rest_framework import serializers
 from .models import Forms, FormVersion, ClientSubmission, NotificationSettings,ClientSubmissionData, SystemLogs,FormField
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .services import create_submission
+from .storage import answer_rows
+from .cache import schema_cache
+from .validation import get_validator, schema_errors
 
 User = get_user_model()
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -20,6 +24,27 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 
 
+class SparseFieldsetMixin:
+    """Limit output to the comma separated ``?fields=`` of a GET request."""
+
+    def get_requested_fields(self):
+        request = self.context.get("request")
+        if request is None or request.method != "GET":
+            return None
+        fields = request.query_params.get("fields")
+        if not fields:
+            return None
+        return {name.strip() for name in fields.split(",") if name.strip()}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.get_requested_fields()
+        if requested:
+            for name in set(fields) - requested:
+                fields.pop(name)
+        return fields
+
+
 class FormsSerializer(serializers.ModelSerializer):
     latest_version = serializers.SerializerMethodField()
     version = serializers.SerializerMethodField()
@@ -28,29 +53,62 @@ class FormsSerializer(serializers.ModelSerializer):
         model = Forms
         fields = '__all__'
         read_only_fields = ['created_at', 'created_by', 'is_active']
+
+    def validate_schema(self, value):
+        errors = schema_errors(value)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return value
     
+    # Querysets from Forms.objects.with_version_numbers() carry both numbers
+    # already; fall back to a lookup for instances loaded any other way.
     def get_latest_version(self, obj):
+        if hasattr(obj, "latest_version_number"):
+            return obj.latest_version_number
         version = obj.versions.order_by("-version").first()
         return version.version if version else None
     
     def get_version(self, obj):
+        if hasattr(obj, "active_version_number"):
+            return obj.active_version_number
         version = obj.versions.filter(is_active=True).order_by("-created_at").first()
         return version.version if version else None
 
 class FormVersionSerializer(serializers.ModelSerializer):
     class Meta:
         model = FormVersion
-        fields = '__all__'
+        exclude = ['fields', 'base', 'schema_diff']
+        read_only_fields = ['schema_hash', 'field_count']
+
+    def validate_schema(self, value):
+        errors = schema_errors(value)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return value
+
+    def to_representation(self, instance):
+        # Diff versions have no stored schema; always show the full one
+        data = super().to_representation(instance)
+        data['schema'] = schema_cache.get_schema(instance)
+        return data
+
+
+class SubmissionAnswersSerializer(serializers.ListSerializer):
+    def get_attribute(self, instance):
+        # Same output for both storage layouts: document answers are read
+        # as ClientSubmissionData rows by onboarding.storage.answer_rows
+        return answer_rows(instance)
 
 
 class ClientSubmissionDataSerializer(serializers.ModelSerializer):
-    field = serializers.SlugRelatedField(
-        slug_field="id",
-        queryset=FormField.objects.all()
-    )
+    # Plain id; the whole submission is checked at once against the compiled
+    # validator of its form version in ClientSubmissionSerializer.validate.
+    field = serializers.IntegerField(source="field_id")
+
     class Meta:
         model = ClientSubmissionData
         fields = ["field", "value"]
+        list_serializer_class = SubmissionAnswersSerializer
 
 
 class NotificationSettingsSerializer(serializers.ModelSerializer):
@@ -58,7 +116,7 @@ class NotificationSettingsSerializer(serializers.ModelSerializer):
         model = NotificationSettings
         fields = '__all__'
 
-class ClientSubmissionSerializer(serializers.ModelSerializer):
+class ClientSubmissionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     submission_data = ClientSubmissionDataSerializer(many=True)
 
     class Meta:
@@ -66,15 +124,31 @@ class ClientSubmissionSerializer(serializers.ModelSerializer):
         fields = ['id', 'form', 'form_version', 'submission_data', 'created_at', 'created_by']
        
 
+    def validate(self, attrs):
+        form = attrs.get("form")
+        form_version = attrs.get("form_version")
+        if form and form_version and form_version.form_id != form.id:
+            raise serializers.ValidationError({"form_version": "Version does not belong to this form."})
+
+        if form_version:
+            answers = {}
+            for data in attrs.get("submission_data", []):
+                if data["field_id"] in answers:
+                    raise serializers.ValidationError({"submission_data": {
+                        str(data["field_id"]): ["Field answered more than once."]
+                    }})
+                answers[data["field_id"]] = data["value"]
+            errors = get_validator(form_version).validate(answers)
+            if errors:
+                raise serializers.ValidationError({"submission_data": {
+                    str(field_id): messages for field_id, messages in errors.items()
+                }})
+
+        return attrs
+
     def create(self, validated_data):
-        
         submission_data = validated_data.pop('submission_data', [])
-        submission = ClientSubmission.objects.create(**validated_data)
-
-        for data in submission_data:
-            ClientSubmissionData.objects.create(submission=submission, **data)
-
-        return submission
+        return create_submission(submission_data, **validated_data)
     
     
 
@@ -0,0 +1,160 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from .models import FormVersion, FormField, FormVersionField, ClientSubmission, ClientSubmissionData
+from .analytics import count_submissions
+from .cache import schema_cache
+from .search import index_answers
+from .versioning import canonical_json, diff_schema, field_hash, resolve_schema, schema_hash
+from .storage import build_answers, document_of, typed_document_of, use_documents
+from .validation import get_validator, schema_fields
+
+
+def build_form_fields(version, schema):
+    """Compile a form schema into unsaved FormField rows for ``version``.
+
+    The schema is a list of sections, each with a ``fields`` list. Rows are
+    returned in schema order so they can be written with one bulk insert.
+    """
+    return [
+        FormField(
+            form_version=version,
+            name=field.get("label"),
+            field_type=field.get("type"),
+            required=field.get("required", False),
+            searchable=bool(field.get("searchable", False)),
+            content_hash=field_hash(field)
+        )
+        for section in schema
+        for field in section.get("fields", [])
+    ]
+
+
+def version_storage(previous, schema):
+    """How to store ``schema`` as the version after ``previous``.
+
+    Returns the ``schema`` / ``base`` / ``schema_diff`` values: a diff against
+    the latest snapshot, or a new snapshot for the first version, every
+    FORM_VERSION_SNAPSHOT_INTERVAL versions, and whenever the diff would not
+    be smaller than the schema itself.
+    """
+    snapshot = {"schema": schema, "base": None, "schema_diff": None}
+    if previous is None:
+        return snapshot
+    base = previous.base if previous.schema_diff is not None else previous
+    if previous.version - base.version + 1 >= settings.FORM_VERSION_SNAPSHOT_INTERVAL:
+        return snapshot
+    diff = diff_schema(base.schema, schema)
+    if "schema" in diff or len(canonical_json(diff)) >= len(canonical_json(schema)):
+        return snapshot
+    return {"schema": None, "base": base, "schema_diff": diff}
+
+
+def link_form_fields(version, schema, previous=None):
+    """Attach a FormField for every schema field to ``version``, in order.
+
+    Fields whose content hash matches a field of ``previous`` reuse that
+    row, so answers keep pointing at the same field id across versions; the
+    rest are written with one batched INSERT, and the links with another.
+    """
+    reusable = defaultdict(list)
+    if previous is not None:
+        for field_id, content_hash in (
+            previous.field_links.order_by("position").values_list("field_id", "field__content_hash")
+        ):
+            if content_hash:
+                reusable[content_hash].append(field_id)
+
+    links, created = [], []
+    for position, field in enumerate(build_form_fields(version, schema)):
+        candidates = reusable.get(field.content_hash)
+        if candidates:
+            links.append(FormVersionField(version=version, field_id=candidates.pop(0), position=position))
+        else:
+            created.append(field)
+            links.append(FormVersionField(version=version, field=field, position=position))
+    FormField.objects.bulk_create(created)
+    FormVersionField.objects.bulk_create(links)
+
+
+def publish_form_version(form):
+    """Publish ``form.schema`` as a new active FormVersion.
+
+    The version row, the deactivation of older versions and the field links
+    are written in a single transaction. The schema is stored as a diff
+    against the latest snapshot when that is smaller (see version_storage),
+    and unchanged fields are shared with the previous version.
+    """
+    with transaction.atomic():
+        last_version = (
+            FormVersion.objects.filter(form=form).select_related('base').order_by('-version').first()
+        )
+        version_number = (last_version.version + 1) if last_version else 1
+
+        if last_version:
+            FormVersion.objects.filter(form=form, is_active=True).update(is_active=False)
+
+        version = FormVersion.objects.create(
+            form=form,
+            version=version_number,
+            is_active=True,
+            schema_hash=schema_hash(form.schema),
+            field_count=len(schema_fields(form.schema)),
+            **version_storage(last_version, form.schema)
+        )
+        link_form_fields(version, form.schema, previous=last_version)
+        transaction.on_commit(lambda: schema_cache.invalidate_form(form.id))
+
+    return version
+
+
+def detach_version(version):
+    """Make other versions independent of ``version`` before it changes or goes.
+
+    Versions diffed against it become snapshots again, and fields it
+    introduced that later versions still use are handed to the newest of
+    them, so deleting ``version`` cannot take those fields with it.
+    """
+    derived = list(version.derived.select_related("base"))
+    for other in derived:
+        other.schema = resolve_schema(other)
+        other.base = other.schema_diff = None
+    FormVersion.objects.bulk_update(derived, ["schema", "base", "schema_diff"])
+
+    owners = (
+        FormVersionField.objects.filter(field__form_version=version).exclude(version=version)
+        .values("field_id").annotate(owner=Max("version_id")).values_list("field_id", "owner")
+    )
+    by_owner = defaultdict(list)
+    for field_id, owner in owners:
+        by_owner[owner].append(field_id)
+    for owner, field_ids in by_owner.items():
+        FormField.objects.filter(id__in=field_ids).update(form_version_id=owner)
+
+
+def create_submission(submission_data, **fields):
+    """Create a ClientSubmission and all of its answers in one transaction.
+
+    ``submission_data`` is a list of ``{"field_id": ..., "value": ...}`` dicts
+    already checked by the form version's compiled validator. They are
+    stored as rows or as one document depending on SUBMISSION_STORAGE; the
+    analytics counters and the search index are updated in the same
+    transaction either way.
+    """
+    document = use_documents()
+    submission = ClientSubmission(**fields)
+    field_types = get_validator(submission.form_version).field_types
+    if document:
+        submission.answers = document_of(submission_data)
+        submission.typed_answers = typed_document_of(submission_data, field_types)
+    with transaction.atomic():
+        submission.save()
+        answers = build_answers(submission, submission_data, field_types)
+        if not document:
+            ClientSubmissionData.objects.bulk_create(answers)
+        count_submissions([submission], answers)
+        index_answers(answers)
+
+    return submission
@@ -0,0 +1,180 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Case, DateField, DecimalField, F, Func, TextField, Value, When
+from django.db.models.functions import Cast
+from django.db.models.lookups import Exact
+
+from .models import ClientSubmission, ClientSubmissionData
+from .validation import TYPED_COLUMNS, get_validator, parse_typed, typed_columns
+
+
+def use_documents():
+    """Whether new submissions are written in the document layout (SUBMISSION_STORAGE)."""
+    return settings.SUBMISSION_STORAGE == "document"
+
+
+def build_answers(submission, submission_data, field_types):
+    """Unsaved ClientSubmissionData rows with their typed columns filled.
+
+    ``field_types`` maps field ids to types, e.g. ``CompiledValidator.field_types``.
+    Document submissions build them too, for the analytics counters and the
+    search index, but never save them.
+    """
+    return [
+        ClientSubmissionData(
+            submission=submission,
+            field_id=data["field_id"],
+            value=data["value"],
+            **typed_columns(field_types.get(data["field_id"]), data["value"])
+        )
+        for data in submission_data
+    ]
+
+
+def document_of(submission_data):
+    """``ClientSubmission.answers`` for ``[{"field_id": ..., "value": ...}, ...]``."""
+    return {str(data["field_id"]): data["value"] for data in submission_data}
+
+
+def typed_text(value):
+    """Text stored in ``typed_answers`` for a parsed typed value."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def typed_document_of(submission_data, field_types):
+    """``ClientSubmission.typed_answers``: the answers that parse for their field type.
+
+    Holds what ClientSubmissionData's typed columns would, so filters on
+    document submissions compare the same values as on rows and never cast
+    text that doesn't fit (e.g. "1e30" into DECIMAL(30, 10)).
+    """
+    typed = {}
+    for data in submission_data:
+        value = parse_typed(field_types.get(data["field_id"]), data["value"])
+        if value is not None:
+            typed[str(data["field_id"])] = typed_text(value)
+    return typed
+
+
+def document_items(document):
+    """``[(field_id, value)]`` of a document, by field id.
+
+    JSONB does not keep key order, so answers are always read back sorted.
+    """
+    return sorted(((int(field_id), value) for field_id, value in document.items()), key=lambda item: item[0])
+
+
+def answer_rows(submission):
+    """Answers of a submission in either layout, as ClientSubmissionData rows.
+
+    Row submissions use ``submission_data`` (prefetched or not); document
+    submissions get unsaved rows built from ``answers``, without a query.
+    """
+    if submission.answers is None:
+        return list(submission.submission_data.all())
+    return [
+        ClientSubmissionData(submission=submission, field_id=field_id, value=value)
+        for field_id, value in document_items(submission.answers)
+    ]
+
+
+class DocumentAnswer(Func):
+    """Text of ``ClientSubmission.<document>["<field id>"]``, NULL when unanswered.
+
+    ``document`` is ``answers`` or ``typed_answers``. ``KT()`` and ``has_key``
+    can't be used: Django reads numeric keys such as field ids as array
+    indexes.
+    """
+    output_field = TextField()
+
+    def __init__(self, field_id, document="answers"):
+        self.field_id = int(field_id)
+        super().__init__(F(document))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        template = f"JSON_EXTRACT(%(expressions)s, '$.\"{self.field_id}\"')"
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        template = f"JSON_UNQUOTE(JSON_EXTRACT(%(expressions)s, '$.\"{self.field_id}\"'))"
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        template = f"(%(expressions)s ->> '{self.field_id}')"
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+
+def document_answer(field_id, column=None):
+    """SQL expression for the answer to ``field_id`` of a document submission.
+
+    With a ClientSubmissionData typed ``column`` it reads ``typed_answers``,
+    which only holds values already parsed by ``parse_typed``, so the casts
+    can't fail and document submissions are filtered with the same lookups
+    and the same values as rows.
+    """
+    if column is None:
+        return DocumentAnswer(field_id)
+    answer = DocumentAnswer(field_id, "typed_answers")
+    if column == "value_number":
+        return Cast(answer, DecimalField(max_digits=30, decimal_places=10))
+    if column == "value_date":
+        return Cast(answer, DateField())
+    return Case(
+        When(Exact(answer, "true"), then=Value(True)),
+        When(Exact(answer, "false"), then=Value(False)),
+        output_field=BooleanField(),
+    )
+
+
+def convert_to_documents(submissions):
+    """Move the answer rows of row-layout ``submissions`` into their documents.
+
+    Search entries and analytics counters don't depend on the layout and
+    are left alone. Returns the number of submissions converted.
+    """
+    submissions = [submission for submission in submissions if submission.answers is None]
+    if not submissions:
+        return 0
+    ids = [submission.pk for submission in submissions]
+    documents, typed = defaultdict(dict), defaultdict(dict)
+    columns = sorted(set(TYPED_COLUMNS.values()))
+    with transaction.atomic():
+        rows = ClientSubmissionData.objects.filter(submission_id__in=ids).order_by("id")
+        for submission_id, field_id, value, *values in rows.values_list("submission_id", "field_id", "value", *columns):
+            documents[submission_id][str(field_id)] = value
+            for parsed in values:
+                if parsed is not None:
+                    typed[submission_id][str(field_id)] = typed_text(parsed)
+        for submission in submissions:
+            submission.answers = documents[submission.pk]
+            submission.typed_answers = typed[submission.pk]
+        ClientSubmission.objects.bulk_update(submissions, ["answers", "typed_answers"])
+        rows.delete()
+    return len(submissions)
+
+
+def convert_to_rows(submissions):
+    """Write the documents of document-layout ``submissions`` back as answer rows.
+
+    Load ``submissions`` with ``select_related("form_version")``; typed
+    columns are filled from each version's field types.
+    """
+    submissions = [submission for submission in submissions if submission.answers is not None]
+    if not submissions:
+        return 0
+    rows = []
+    for submission in submissions:
+        field_types = get_validator(submission.form_version).field_types
+        submission_data = [
+            {"field_id": field_id, "value": value} for field_id, value in document_items(submission.answers)
+        ]
+        rows.extend(build_answers(submission, submission_data, field_types))
+        submission.answers = submission.typed_answers = None
+    with transaction.atomic():
+        ClientSubmissionData.objects.bulk_create(rows)
+        ClientSubmission.objects.bulk_update(submissions, ["answers", "typed_answers"])
+    return len(submissions)
@@ -1,12 +1,47 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import math
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from onboarding.models import Forms, ClientSubmission
+from django.db import connection, connections, transaction, IntegrityError, OperationalError
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.apps import apps
+from onboarding.models import Forms, FormVersion, FormField, ClientSubmission, ClientSubmissionData, SystemLogs, SystemLogArchive, SubmissionCounter, FieldCompletionCounter, SubmissionSearchEntry, IdempotencyKey
+from onboarding.audit import AuditBuffer
+from onboarding.cache import SchemaCache, schema_cache
+from onboarding.serializers import ClientSubmissionSerializer, FormsSerializer
+from onboarding.validation import get_validator
+from onboarding.views import ClientSubmissionViewSet, log_action
+from onboarding.services import publish_form_version, create_submission, detach_version
+from onboarding.versioning import apply_diff, diff_schema, resolve_schema, schema_hash
+from onboarding.analytics import form_stats
+from onboarding.search import search_answers
+from onboarding.exports import iter_submission_rows
+from onboarding import idempotency, retention
+from backend.db_router import ReplicaRouter, RoutingState, _state as routing_state
 
 User = get_user_model()
 
+TEST_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "schema": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "schema"},
+}
+
 class OnboardingAPITestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -46,3 +81,1217 @@ class OnboardingAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class PublishFormVersionTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="author", password="Passcode123")
+
+    def make_form(self, field_count):
+        schema = [{"title": "Details", "fields": [
+            {"label": f"Field {i}", "type": "string", "required": i == 0}
+            for i in range(field_count)
+        ]}]
+        return Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+
+    def test_fields_written_in_constant_queries(self):
+        small, large = self.make_form(3), self.make_form(200)
+        with CaptureQueriesContext(connection) as small_ctx:
+            publish_form_version(small)
+        with CaptureQueriesContext(connection) as large_ctx:
+            version = publish_form_version(large)
+
+        # One INSERT per model, plus the batches the backend's bind variable
+        # limit (999 on older SQLite) forces on the FormField insert
+        fields = [f for f in FormField._meta.concrete_fields if not f.primary_key]
+        batches = math.ceil(200 / connection.ops.bulk_batch_size(fields, [FormField()] * 200))
+        self.assertEqual(len(large_ctx.captured_queries), len(small_ctx.captured_queries) + batches - 1)
+        self.assertEqual(version.fields.count(), 200)
+        self.assertTrue(version.fields.get(name="Field 0").required)
+
+    def test_new_version_replaces_active_version(self):
+        form = self.make_form(2)
+        first = publish_form_version(form)
+        second = publish_form_version(form)
+        first.refresh_from_db()
+
+        self.assertEqual(second.version, 2)
+        self.assertFalse(first.is_active)
+        self.assertTrue(second.is_active)
+
+    def test_only_one_active_version_per_form(self):
+        form = self.make_form(1)
+        publish_form_version(form)
+        with self.assertRaises(IntegrityError):
+            FormVersion.objects.create(form=form, version=2, schema=[], is_active=True)
+
+
+class ClientSubmissionWriteTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="client", password="Passcode123")
+        schema = [{"title": "Details", "fields": [
+            {"label": f"Field {i}", "type": "string"} for i in range(150)
+        ]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.field_ids = list(self.version.fields.order_by("id").values_list("id", flat=True))
+
+    def submit(self, field_ids):
+        serializer = ClientSubmissionSerializer(data={
+            "form": self.form.id,
+            "form_version": self.version.id,
+            "created_by": self.user.id,
+            "submission_data": [{"field": field_id, "value": "x"} for field_id in field_ids],
+        })
+        if serializer.is_valid():
+            serializer.save(created_by=self.user)
+        return serializer
+
+    def test_answers_written_in_constant_queries(self):
+        # The first submission compiles the version's validator
+        self.submit(self.field_ids[:1])
+        with CaptureQueriesContext(connection) as small_ctx:
+            self.submit(self.field_ids[:2])
+        with CaptureQueriesContext(connection) as large_ctx:
+            serializer = self.submit(self.field_ids)
+
+        self.assertEqual(len(small_ctx.captured_queries), len(large_ctx.captured_queries))
+        self.assertEqual(serializer.instance.submission_data.count(), 150)
+
+    def test_values_checked_against_field_types(self):
+        schema = [{"title": "Details", "fields": [
+            {"label": "Email", "type": "email", "required": True},
+            {"label": "Born", "type": "date"},
+            {"label": "Income", "type": "number", "min": 0},
+            {"label": "Plan", "type": "select", "options": ["basic", {"label": "Pro", "value": "pro"}]},
+        ]}]
+        form = Forms.objects.create(name="Typed", schema=schema, created_by=self.user)
+        version = publish_form_version(form)
+        email, born, income, plan = version.fields.order_by("id")
+        validator = get_validator(version)
+
+        self.assertEqual(validator.validate({email.id: "a@b.co", born.id: "1990-02-01", income.id: "10.5", plan.id: "pro"}), {})
+        errors = validator.validate({born.id: "01/02/1990", income.id: "-1", plan.id: "gold"})
+        self.assertEqual(set(errors), {email.id, born.id, income.id, plan.id})
+        self.assertEqual(errors[email.id], ["This field is required."])
+
+    def test_invalid_pattern_reported_not_raised(self):
+        schema = [{"title": "Details", "fields": [{"label": "Code", "type": "string", "pattern": "[A-Z"}]}]
+        serializer = FormsSerializer(data={"name": "Bad", "schema": schema})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("invalid pattern", serializer.errors["schema"][0])
+
+        # A schema saved before patterns were checked
+        form = Forms.objects.create(name="Legacy", schema=schema, created_by=self.user)
+        field = publish_form_version(form).fields.get()
+        with self.assertLogs("onboarding.validation", "WARNING"):
+            errors = get_validator(form.versions.get()).validate({field.id: "ABC"})
+        self.assertEqual(errors, {field.id: ["This field's pattern in the form schema is invalid."]})
+
+    @override_settings(CACHES=TEST_CACHES)
+    def test_edited_version_validates_with_its_new_schema(self):
+        schema = [{"title": "Details", "fields": [{"label": "Code", "type": "string"}]}]
+        form = Forms.objects.create(name="Codes", schema=schema, created_by=self.user)
+        version = publish_form_version(form)
+        field = version.fields.get()
+        self.assertEqual(get_validator(version).validate({field.id: "abc"}), {})
+
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser(username="staff", password="Passcode123"))
+        schema[0]["fields"][0]["pattern"] = "[A-Z]+"
+        with self.captureOnCommitCallbacks(execute=True), mock.patch("onboarding.views.audit_buffer"):
+            response = client.patch(f"/api/form-versions/{version.id}/", {"schema": schema}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        version.refresh_from_db()
+        self.assertEqual(version.schema_hash, schema_hash(schema))
+        self.assertEqual(
+            get_validator(version).validate({field.id: "abc"}), {field.id: ["Enter a value in the expected format."]}
+        )
+
+    def test_rejects_fields_from_other_versions(self):
+        other = publish_form_version(self.form).fields.first()
+        serializer = self.submit([self.field_ids[0], other.id])
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(list(serializer.errors["submission_data"]), [str(other.id)])
+        self.assertEqual(ClientSubmission.objects.count(), 0)
+
+
+@mock.patch("onboarding.views.audit_buffer")
+class SubmissionImportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="importer", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [
+            {"label": "Name", "type": "string", "required": True},
+            {"label": "Notes", "type": "string"},
+        ]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.name, self.notes = self.version.fields.order_by("id")
+
+    def post(self, body, content_type, **params):
+        params.setdefault("form_version", self.version.id)
+        query = "&".join(f"{key}={value}" for key, value in params.items())
+        return self.client.generic("POST", f"/api/submissions/import/?{query}", body, content_type=content_type)
+
+    def test_ndjson_import_reports_bad_rows(self, audit):
+        rows = [
+            {str(self.name.id): "Ada", str(self.notes.id): "vip"},
+            {str(self.notes.id): "missing name"},
+            {str(self.name.id): "Grace", "999999": "unknown"},
+            {str(self.name.id): "Linus"},
+        ]
+        body = "\n".join(json.dumps(row) for row in rows) + "\nnot json\n"
+        response = self.post(body, "application/x-ndjson", chunk_size=1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2, 3, 5])
+        self.assertIn(str(self.name.id), response.data["errors"][0]["errors"])
+        self.assertEqual(ClientSubmission.objects.filter(form_version=self.version).count(), 2)
+        self.assertEqual(ClientSubmissionData.objects.count(), 3)
+
+    def test_non_utf8_body_rejected_with_line_number(self, audit):
+        body = (json.dumps({str(self.name.id): "Ada"}) + "\n").encode() + '{"x": "Ren\u00e9e"}\n'.encode("latin-1")
+        response = self.post(body, "application/x-ndjson", chunk_size=1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Line 2 is not valid UTF-8", response.data["error"])
+        self.assertEqual(response.data["created"], 1)
+
+    def test_csv_import(self, audit):
+        body = f'{self.name.id},{self.notes.id}\r\nAda,"multi\nline"\r\nGrace,\r\n'
+        response = self.post(body, "text/csv; charset=utf-8")
+
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["failed"], 0)
+        self.assertTrue(ClientSubmissionData.objects.filter(field=self.notes, value="multi\nline").exists())
+
+    def test_rejects_unknown_content_type(self, audit):
+        response = self.post("{}", "application/xml")
+        self.assertEqual(response.status_code, 400)
+
+
+class SubmissionExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="compliance", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [
+            {"label": "Name", "type": "string"},
+            {"label": "Name", "type": "string"},
+        ]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.first, self.second = self.version.fields.order_by("id")
+        for values in (["Ada", "Lovelace"], ["Grace", None], [None, None]):
+            create_submission(
+                [{"field_id": field.id, "value": value} for field, value in zip((self.first, self.second), values) if value],
+                form=self.form, form_version=self.version, created_by=self.user
+            )
+
+    def export(self, **params):
+        query = "&".join(f"{key}={value}" for key, value in params.items())
+        response = self.client.get(f"/api/forms/{self.form.id}/export/?{query}")
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_csv_export_pivots_answers(self):
+        response, content = self.export(version=1)
+        rows = list(csv.reader(io.StringIO(content)))
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(rows[0][3:], ["Name", f"Name ({self.second.id})"])
+        self.assertEqual([row[3:] for row in rows[1:]], [["Ada", "Lovelace"], ["Grace", ""], ["", ""]])
+
+    def test_ndjson_export_runs_fixed_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response, content = self.export(output="ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1]["Name"], "Grace")
+        self.assertLessEqual(len(ctx.captured_queries), 6)
+
+    def test_unknown_version(self):
+        response = self.client.get(f"/api/forms/{self.form.id}/export/?version=9")
+        self.assertEqual(response.status_code, 404)
+
+
+@mock.patch("onboarding.views.audit_buffer")
+class FormsListQueryTestCase(TestCase):
+    # The single annotated page query; must not grow with the number of forms.
+    MAX_LIST_QUERIES = 1
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(username="staff", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+
+    def create_forms(self, count):
+        for i in range(count):
+            form = Forms.objects.create(name=f"Form {i}", schema=[], created_by=self.user)
+            publish_form_version(form)
+            publish_form_version(form)
+
+    def test_list_runs_constant_queries(self, audit):
+        self.create_forms(3)
+        with self.assertNumQueries(self.MAX_LIST_QUERIES):
+            response = self.client.get("/api/forms/")
+        self.create_forms(20)
+        with self.assertNumQueries(self.MAX_LIST_QUERIES):
+            response = self.client.get("/api/forms/")
+
+        self.assertEqual(len(response.data), 23)
+        self.assertEqual({(form["latest_version"], form["version"]) for form in response.data}, {(2, 2)})
+
+    def test_update_returns_new_version_number(self, audit):
+        self.create_forms(1)
+        form = Forms.objects.get()
+        response = self.client.patch(f"/api/forms/{form.id}/", {"name": "Renamed"}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["latest_version"], 3)
+        self.assertEqual(response.data["version"], 3)
+        self.assertEqual(str(Forms.objects.with_version_numbers().get()), "Renamed - Version: 3")
+
+
+class SubmissionListTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="ops", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [{"label": "Name", "type": "string"}]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.field = self.version.fields.get()
+
+    def create_submissions(self, count):
+        for i in range(count):
+            create_submission(
+                [{"field_id": self.field.id, "value": f"client {i}"}],
+                form=self.form, form_version=self.version, created_by=self.user
+            )
+
+    def test_list_is_paginated_with_constant_queries(self):
+        self.create_submissions(3)
+        with self.assertNumQueries(2):
+            self.client.get("/api/submissions/")
+        self.create_submissions(12)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/submissions/?page_size=10")
+
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertEqual(response.data["results"][0]["submission_data"], [{"field": self.field.id, "value": "client 11"}])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertIsNone(response.data["next"])
+
+    def test_sparse_fieldset_skips_nested_data(self):
+        self.create_submissions(3)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/submissions/?fields=id,created_at")
+
+        self.assertEqual(set(response.data["results"][0]), {"id", "created_at"})
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch("onboarding.views.audit_buffer")
+class SchemaCacheTestCase(TestCase):
+    def setUp(self):
+        schema_cache.shared.clear()
+        schema_cache.local.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(username="staff", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [{"label": "Name", "type": "string"}]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        publish_form_version(self.form)
+
+    def test_version_detail_revalidates_without_queries(self, audit):
+        url = f"/api/forms/{self.form.id}/version_detail/?version=1"
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertTrue(response.data["is_active"])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            publish_form_version(self.form)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data["is_active"])
+
+    def test_version_edit_reaches_every_process(self, audit):
+        # Two workers sharing the cache backend, each with its own local tier
+        worker, other = SchemaCache(), SchemaCache()
+        version = self.form.versions.get()
+        self.assertEqual(other.get_schema(version), self.form.schema)
+        old = other.get_version(self.form.id, 1)
+
+        schema = [{"title": "Details", "fields": [{"label": "Full name", "type": "string"}]}]
+        with mock.patch("onboarding.views.schema_cache", worker), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f"/api/form-versions/{version.id}/", {"schema": schema}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertIsNone(other.get_version(self.form.id, 1))
+        version.refresh_from_db()
+        self.assertEqual(other.get_schema(version), schema)
+        entry = other.get_version(self.form.id, 1)
+        self.assertEqual(entry["data"]["schema"], schema)
+        self.assertNotEqual(entry["etag"], old["etag"])
+
+    def test_retrieve_etag_changes_after_update(self, audit):
+        url = f"/api/forms/{self.form.id}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {"name": "Renamed"}, format="json")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["latest_version"], 2)
+
+
+@override_settings(AUDIT_LOG_BATCH_SIZE=3, AUDIT_LOG_FLUSH_INTERVAL=0)
+@mock.patch("onboarding.audit.coalescer")
+class AuditBufferTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="auditor", password="Passcode123")
+        self.form = Forms.objects.create(name="KYC", schema=[], created_by=self.user)
+        self.buffer = AuditBuffer()
+
+    def log(self, count):
+        with mock.patch("onboarding.views.audit_buffer", self.buffer):
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(count):
+                    log_action(self.user, "UPDATE", self.form, message=f"edit {i}")
+
+    def test_full_batch_written_with_one_insert(self, coalescer):
+        with CaptureQueriesContext(connection) as ctx:
+            self.log(4)
+
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(SystemLogs.objects.count(), 3)
+        self.assertEqual(self.buffer.pending(), 1)
+        coalescer.add_many.assert_called_once()
+        self.assertEqual([n["message"] for n in coalescer.add_many.call_args[0][0]], ["edit 0", "edit 1", "edit 2"])
+        notification = coalescer.add_many.call_args[0][0][0]
+        self.assertEqual(
+            (notification["action"], notification["object_type"], notification["form_id"]),
+            ("UPDATE", "FORMS", self.form.id),
+        )
+
+    def test_shutdown_flushes_pending_entries(self, coalescer):
+        self.log(2)
+        self.assertEqual(SystemLogs.objects.count(), 0)
+
+        self.buffer.shutdown()
+        self.assertEqual(SystemLogs.objects.count(), 2)
+
+    def test_rolled_back_request_logs_nothing(self, coalescer):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    log_action(self.user, "DELETE", self.form)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(callbacks, [])
+
+    def make_entries(self, *messages):
+        return [
+            SystemLogs(user=self.user, action="OTHER", object_type="FORMS", object_id="1", message=message)
+            for message in messages
+        ]
+
+    def test_bad_entry_dropped_rest_written(self, coalescer):
+        bulk_create = SystemLogs.objects.bulk_create
+
+        def reject_bad(entries, *args, **kwargs):
+            if any(entry.message == "bad" for entry in entries):
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            return bulk_create(entries, *args, **kwargs)
+
+        with mock.patch.object(SystemLogs.objects, "bulk_create", side_effect=reject_bad):
+            with self.assertLogs("onboarding.audit", "ERROR"):
+                for entry in self.make_entries("ok", "bad", "fine"):
+                    self.buffer.add(entry)
+
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(sorted(SystemLogs.objects.values_list("message", flat=True)), ["fine", "ok"])
+        self.assertEqual([n["message"] for n in coalescer.add_many.call_args[0][0]], ["ok", "fine"])
+
+    @override_settings(AUDIT_LOG_FLUSH_INTERVAL=1)
+    def test_outage_keeps_entries_and_backs_off(self, coalescer):
+        self.buffer._entries = self.make_entries("a", "b", "c")
+        outage = OperationalError("server closed the connection unexpectedly")
+
+        with mock.patch.object(SystemLogs.objects, "bulk_create", side_effect=outage) as bulk_create:
+            with self.assertLogs("onboarding.audit", "ERROR"):
+                for _ in range(5):
+                    self.buffer.flush()
+        bulk_create.assert_called_once()
+        self.assertEqual(self.buffer.pending(), 3)
+
+        self.buffer.flush(force=True)
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(SystemLogs.objects.count(), 3)
+
+    @override_settings(AUDIT_LOG_MAX_PENDING=2)
+    def test_full_buffer_drops_oldest_loudly(self, coalescer):
+        with self.assertLogs("onboarding.audit", "CRITICAL"):
+            for entry in self.make_entries("a", "b", "c"):
+                with mock.patch.object(self.buffer, "flush"):
+                    self.buffer.add(entry)
+
+        self.assertEqual([entry.message for entry in self.buffer._entries], ["b", "c"])
+
+    @override_settings(AUDIT_LOG_FLUSH_INTERVAL=0.01)
+    def test_background_flush_by_time(self, coalescer):
+        with mock.patch.object(self.buffer, "_write") as write:
+            self.buffer.add(SystemLogs(user=self.user, action="OTHER", object_type="FORMS", object_id="1"))
+            for _ in range(100):
+                if write.called:
+                    break
+                time.sleep(0.01)
+            self.buffer.shutdown()
+        write.assert_called_once()
+
+    @override_settings(AUDIT_LOG_FLUSH_INTERVAL=0.01)
+    def test_background_flusher_survives_errors(self, coalescer):
+        coalescer.add_many.side_effect = [RuntimeError("channel layer down"), None]
+        # The flusher thread can't see this test's uncommitted rows
+        with self.assertLogs("onboarding.audit", "ERROR"), mock.patch.object(SystemLogs.objects, "bulk_create"):
+            for calls, entry in enumerate(self.make_entries("first", "second"), 1):
+                self.buffer.add(entry)
+                for _ in range(100):
+                    if coalescer.add_many.call_count == calls:
+                        break
+                    time.sleep(0.01)
+            self.assertTrue(self.buffer._thread.is_alive())
+            self.buffer.shutdown()
+        self.assertEqual(coalescer.add_many.call_count, 2)
+
+
+class SystemLogsRetentionTestCase(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        override = override_settings(SYSTEM_LOGS_ARCHIVE_DIR=self.archive_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="auditor", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        now = timezone.now()
+        # Two logs in each of the current month and the five before it
+        for months_ago in range(6):
+            for day in (3, 10):
+                log = SystemLogs.objects.create(user=self.user, action="UPDATE", object_type="FORMS", object_id="1")
+                created_at = (now.replace(day=1) - timedelta(days=28 * months_ago)).replace(day=day)
+                SystemLogs.objects.filter(pk=log.pk).update(created_at=created_at)
+        self.expected = list(
+            SystemLogs.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+
+    def test_archive_moves_old_months_out_of_hot_table(self):
+        call_command("archive_system_logs", keep_months=2, stdout=io.StringIO())
+
+        self.assertEqual(SystemLogs.objects.count(), 6)
+        self.assertEqual(SystemLogArchive.objects.count(), 3)
+        archive = SystemLogArchive.objects.first()
+        with gzip.open(archive.path, "rt") as lines:
+            rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), archive.row_count)
+        self.assertEqual(rows[0]["user_id"], self.user.id)
+
+    def test_list_pages_through_hot_and_archived_logs(self):
+        call_command("archive_system_logs", keep_months=2, stdout=io.StringIO())
+
+        seen, url = [], "/api/system-logs/?page_size=5"
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data["results"]), 5)
+            seen.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+
+        self.assertEqual(seen, self.expected)
+
+    @override_settings(SYSTEM_LOGS_ARCHIVE_BLOCK_ROWS=1)
+    def test_archive_pages_seek_to_the_cursor(self):
+        call_command("archive_system_logs", keep_months=2, stdout=io.StringIO())
+        self.assertEqual([len(archive.index) for archive in SystemLogArchive.objects.all()], [2, 2, 2])
+
+        decoded, offsets = [], []
+        read_archive = retention.read_archive
+
+        def counting_read_archive(path, offset=0):
+            offsets.append(offset)
+            for row in read_archive(path, offset):
+                decoded.append(row["id"])
+                yield row
+
+        seen, url = [], "/api/system-logs/?page_size=1"
+        with mock.patch("onboarding.retention.read_archive", counting_read_archive):
+            while url:
+                decoded.clear()
+                response = self.client.get(url)
+                seen.extend(row["id"] for row in response.data["results"])
+                url = response.data["next"]
+                # The cursor's own row, the page and the look-ahead row
+                self.assertLessEqual(len(decoded), 3)
+
+        self.assertEqual(seen, self.expected)
+        self.assertTrue(any(offsets))
+
+    def test_rejects_malformed_cursor(self):
+        response = self.client.get("/api/system-logs/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES, FORM_VERSION_SNAPSHOT_INTERVAL=3)
+@mock.patch("onboarding.views.audit_buffer")
+class FormVersionDiffTestCase(TestCase):
+    def setUp(self):
+        schema_cache.shared.clear()
+        schema_cache.local.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(username="staff", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        self.schema = [
+            {"title": "Identity", "fields": [
+                {"label": f"Field {i}", "type": "string", "required": i == 0} for i in range(20)
+            ]},
+            {"title": "Address", "fields": [{"label": "City", "type": "string"}]},
+        ]
+        self.form = Forms.objects.create(name="KYC", schema=self.schema, created_by=self.user)
+        self.first = publish_form_version(self.form)
+
+    def edit(self, label):
+        schema = json.loads(json.dumps(self.form.schema))
+        schema[0]["fields"][1]["label"] = label
+        self.form.schema = schema
+        self.form.save()
+        return publish_form_version(self.form)
+
+    def test_diff_round_trips(self, audit):
+        changed = [
+            {"title": "Address", "fields": [{"label": "City", "type": "string"}, {"label": "Zip", "type": "string"}]},
+            {"note": "no fields"},
+            self.schema[0],
+        ]
+        for schema in (changed, self.schema, [], {"not": "sections"}):
+            self.assertEqual(apply_diff(self.schema, diff_schema(self.schema, schema)), schema)
+
+    def test_small_edit_is_stored_as_diff_and_shares_fields(self, audit):
+        second = self.edit("Middle name")
+
+        self.assertIsNone(second.schema)
+        self.assertEqual(second.base, self.first)
+        self.assertEqual(resolve_schema(second), self.form.schema)
+        first_ids = set(self.first.fields.values_list("id", flat=True))
+        second_ids = set(second.fields.values_list("id", flat=True))
+        self.assertEqual(len(first_ids & second_ids), 20)
+        self.assertEqual(second.fields.get(name="Middle name").form_version, second)
+
+        field_ids = [link.field_id for link in second.field_links.order_by("position")]
+        errors = get_validator(second).validate({field_id: "x" for field_id in field_ids[1:]})
+        self.assertEqual(errors, {field_ids[0]: ["This field is required."]})
+
+    def test_snapshot_taken_every_interval(self, audit):
+        versions = [self.edit(f"Edit {n}") for n in range(4)]
+
+        self.assertEqual([v.schema is None for v in versions], [True, True, False, True])
+        self.assertEqual(versions[3].base, versions[2])
+
+    def test_deleting_a_base_keeps_derived_versions_whole(self, audit):
+        second = self.edit("Middle name")
+        expected = resolve_schema(second)
+        field_count = second.fields.count()
+
+        response = self.client.delete(f"/api/form-versions/{self.first.id}/")
+
+        self.assertEqual(response.status_code, 204)
+        second.refresh_from_db()
+        self.assertEqual(second.schema, expected)
+        self.assertIsNone(second.schema_diff)
+        self.assertEqual(second.fields.count(), field_count)
+
+    def test_version_detail_returns_diff_between_versions(self, audit):
+        self.edit("Middle name")
+        self.edit("Second name")
+
+        response = self.client.get(f"/api/forms/{self.form.id}/version_detail/?version=3&diff_from=1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["diff_from"], 1)
+        self.assertEqual(apply_diff(self.schema, response.data["diff"]), self.form.schema)
+        self.assertLess(len(json.dumps(response.data["diff"])), len(json.dumps(self.form.schema)))
+
+    def test_versions_can_be_listed_as_diffs(self, audit):
+        self.edit("Middle name")
+
+        data = self.client.get(f"/api/forms/{self.form.id}/versions/?diff=true").data["results"]
+
+        self.assertEqual([item["version"] for item in data], [2, 1])
+        self.assertNotIn("schema", data[0])
+        self.assertEqual(apply_diff(data[1]["schema"], data[0]["diff"]), self.form.schema)
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch("onboarding.views.audit_buffer")
+class VersionHistoryTestCase(TestCase):
+    def setUp(self):
+        schema_cache.shared.clear()
+        schema_cache.local.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(username="staff", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        self.form = Forms.objects.create(name="KYC", schema=[], created_by=self.user)
+
+    def publish(self, count):
+        for n in range(count):
+            self.form.schema = [{"title": "Details", "fields": [
+                {"label": f"Field {i}", "type": "string"} for i in range(n + 1)
+            ]}]
+            publish_form_version(self.form)
+
+    def test_summary_computed_at_publish(self, audit):
+        self.publish(3)
+        version = self.form.versions.get(version=3)
+
+        self.assertEqual(version.field_count, 3)
+        self.assertEqual(len(version.schema_hash), 64)
+        self.assertNotEqual(version.schema_hash, self.form.versions.get(version=2).schema_hash)
+
+    def test_history_is_paginated_without_schemas(self, audit):
+        self.publish(5)
+        url = f"/api/forms/{self.form.id}/versions/?page_size=2"
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+
+        self.assertEqual([item["version"] for item in response.data["results"]], [5, 4])
+        self.assertEqual(response.data["results"][0]["field_count"], 5)
+        self.assertNotIn("schema", response.data["results"][0])
+        self.assertFalse(any('"onboarding_formversion"."schema"' in query["sql"] for query in ctx.captured_queries))
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual([item["version"] for item in response.data["results"]], [3, 2])
+
+    def test_schema_included_on_request(self, audit):
+        self.publish(2)
+
+        response = self.client.get(f"/api/forms/{self.form.id}/versions/?include=schema")
+
+        self.assertEqual(response.data["results"][0]["schema"], self.form.schema)
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=["replica"])
+@mock.patch("onboarding.views.audit_buffer")
+class ReplicaRoutingTestCase(TestCase):
+    # Separate SQLite test databases stand in for a primary and its replica;
+    # rows differ between them so responses show where each read went
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        schema_cache.shared.clear()
+        schema_cache.local.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(username="staff", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        self.form = Forms.objects.create(name="KYC", schema=[], created_by=self.user)
+        User.objects.db_manager("replica").create_superuser(id=self.user.id, username="staff", password="Passcode123")
+        Forms.objects.using("replica").create(id=self.form.id, name="KYC (replica)", schema=[], created_by_id=self.user.id)
+
+    def form_names(self):
+        return [form["name"] for form in self.client.get("/api/forms/").data]
+
+    def test_safe_reads_use_replica(self, audit):
+        response = self.client.get("/api/forms/")
+
+        self.assertEqual([form["name"] for form in response.data], ["KYC (replica)"])
+        self.assertNotIn(settings.DATABASE_REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_write_pins_client_to_primary(self, audit):
+        response = self.client.patch(f"/api/forms/{self.form.id}/", {"name": "Renamed"}, format="json")
+
+        self.assertIn(settings.DATABASE_REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.form_names(), ["Renamed"])
+        del self.client.cookies[settings.DATABASE_REPLICA_PIN_COOKIE]
+        self.assertEqual(self.form_names(), ["KYC (replica)"])
+
+    def test_reads_after_write_in_request_use_primary(self, audit):
+        state = RoutingState()
+        state.replica_reads = True
+        token = routing_state.set(state)
+        try:
+            self.assertEqual(Forms.objects.get(id=self.form.id).name, "KYC (replica)")
+            Forms.objects.filter(id=self.form.id).update(name="Renamed")
+            self.assertIsNone(ReplicaRouter().db_for_read(Forms))
+            self.assertEqual(Forms.objects.get(id=self.form.id).name, "Renamed")
+        finally:
+            routing_state.reset(token)
+
+    def test_shared_schema_cache_filled_from_primary(self, audit):
+        response = self.client.get(f"/api/forms/{self.form.id}/")
+
+        self.assertEqual(response.data["name"], "KYC")
+        self.assertEqual(schema_cache.get_detail(self.form.id)["data"]["name"], "KYC")
+        self.assertEqual(self.form_names(), ["KYC (replica)"])
+
+    def test_other_views_read_primary(self, audit):
+        with CaptureQueriesContext(connections["replica"]) as ctx:
+            response = self.client.get("/api/submissions/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ctx.captured_queries, [])
+
+
+@mock.patch("onboarding.views.audit_buffer")
+class SubmissionAnalyticsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(username="staff", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [
+            {"label": "Name", "type": "string"},
+            {"label": "Notes", "type": "string"},
+        ]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.name, self.notes = self.version.fields.order_by("id")
+
+    def submit(self, notes=""):
+        return create_submission(
+            [{"field_id": self.name.id, "value": "Ada"}, {"field_id": self.notes.id, "value": notes}],
+            form=self.form, form_version=self.version, created_by=self.user,
+        )
+
+    def counters(self):
+        return (
+            sorted(SubmissionCounter.objects.values_list("scope", "key", "count")),
+            sorted(FieldCompletionCounter.objects.values_list("field_id", "filled")),
+        )
+
+    def test_counters_follow_submissions(self, audit):
+        self.submit(notes="vip")
+        submission = self.submit(notes="  ")
+
+        stats = form_stats(self.form, self.version)
+        self.assertEqual(stats["submissions"], 2)
+        self.assertEqual(stats["versions"], [{"version": 1, "submissions": 2}])
+        self.assertEqual(stats["days"], [{"day": timezone.localdate().isoformat(), "submissions": 2}])
+        self.assertEqual(stats["top_users"], [{"user": self.user.id, "submissions": 2}])
+        self.assertEqual([(f["name"], f["filled"], f["completion_rate"]) for f in stats["fields"]["fields"]],
+                         [("Name", 2, 1.0), ("Notes", 1, 0.5)])
+
+        self.client.delete(f"/api/submissions/{submission.id}/")
+        self.assertEqual(form_stats(self.form)["submissions"], 1)
+        self.assertEqual(FieldCompletionCounter.objects.get(field=self.name).filled, 1)
+
+    def test_import_counts_every_chunk(self, audit):
+        body = "\n".join(json.dumps({str(self.name.id): "Ada", str(self.notes.id): n}) for n in ("a", "", "c"))
+        self.client.generic(
+            "POST", f"/api/submissions/import/?form_version={self.version.id}&chunk_size=2", body,
+            content_type="application/x-ndjson",
+        )
+
+        stats = form_stats(self.form, self.version)
+        self.assertEqual(stats["submissions"], 3)
+        self.assertEqual([f["filled"] for f in stats["fields"]["fields"]], [3, 2])
+
+    def test_rebuild_matches_incremental_counters(self, audit):
+        self.submit(notes="vip")
+        self.submit()
+        incremental = self.counters()
+        SubmissionCounter.objects.update(count=0)
+        FieldCompletionCounter.objects.all().delete()
+
+        call_command("rebuild_submission_analytics", stdout=io.StringIO())
+
+        self.assertEqual(self.counters(), incremental)
+
+    def test_stats_endpoint_reads_counters_only(self, audit):
+        for _ in range(3):
+            self.submit(notes="vip")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/api/forms/{self.form.id}/stats/?days=7")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["submissions"], 3)
+        self.assertEqual(response.data["fields"]["version"], 1)
+        self.assertFalse(any("onboarding_clientsubmission" in query["sql"] for query in ctx.captured_queries))
+
+
+@mock.patch("onboarding.views.audit_buffer")
+class SubmissionSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(username="support", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [
+            {"label": "National ID", "type": "string", "searchable": True},
+            {"label": "Phone", "type": "string", "searchable": True},
+            {"label": "Notes", "type": "string"},
+        ]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.national_id, self.phone, self.notes = self.version.fields.order_by("id")
+
+    def submit(self, national_id, phone, notes="0712345678"):
+        return create_submission(
+            [
+                {"field_id": self.national_id.id, "value": national_id},
+                {"field_id": self.phone.id, "value": phone},
+                {"field_id": self.notes.id, "value": notes},
+            ],
+            form=self.form, form_version=self.version, created_by=self.user,
+        )
+
+    def search(self, **params):
+        return self.client.get("/api/submissions/search/", params)
+
+    def test_exact_and_prefix_matches(self, audit):
+        first = self.submit("A1234567", "0712 345-678")
+        second = self.submit("A1239999", "+254 700 000000")
+
+        response = self.search(q="0712345678")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["results"],
+            [{"submission": first.id, "form": self.form.id, "field": self.phone.id,
+              "field_name": "Phone", "value": "0712 345-678"}],
+        )
+        self.assertEqual([r["submission"] for r in self.search(q="a123", match="prefix").data["results"]],
+                         [first.id, second.id])
+        self.assertEqual(self.search(q="a123").data["results"], [])
+        self.assertEqual(self.search(q="a1", match="prefix").status_code, 400)
+
+    def test_only_searchable_fields_are_indexed(self, audit):
+        self.submit("A1234567", "0700000000", notes="0799999999")
+
+        self.assertEqual(SubmissionSearchEntry.objects.count(), 2)
+        self.assertEqual(search_answers("0799999999"), [])
+
+    def test_prefix_lookup_uses_index(self, audit):
+        plan = SubmissionSearchEntry.objects.filter(
+            normalized__gte="a12", normalized__lt="a12\U0010ffff", normalized__startswith="a12"
+        ).explain()
+        self.assertIn("search_normalized_idx", plan)
+
+    def test_backfill_command_indexes_missing_answers(self, audit):
+        submission = self.submit("A1234567", "0712345678")
+        SubmissionSearchEntry.objects.all().delete()
+
+        out = io.StringIO()
+        call_command("index_submission_values", batch_size=1, stdout=out)
+
+        self.assertIn("Done: 2 answers indexed.", out.getvalue())
+        self.assertEqual([entry.submission_id for entry in search_answers("A1234567")], [submission.id])
+        call_command("index_submission_values", stdout=out)
+        self.assertEqual(SubmissionSearchEntry.objects.count(), 2)
+
+    def test_backfill_marks_fields_searchable_from_schema(self, audit):
+        # A form published before FormField.searchable was filled in
+        FormField.objects.update(searchable=False)
+        submission = self.submit("A1234567", "0712345678")
+        self.assertEqual(SubmissionSearchEntry.objects.count(), 0)
+
+        out = io.StringIO()
+        call_command("index_submission_values", stdout=out)
+
+        self.assertIn("Marked 2 fields searchable", out.getvalue())
+        self.assertEqual(
+            sorted(FormField.objects.filter(searchable=True).values_list("id", flat=True)),
+            [self.national_id.id, self.phone.id],
+        )
+        self.assertEqual([entry.submission_id for entry in search_answers("A1234567")], [submission.id])
+
+    def test_requires_view_permission(self, audit):
+        self.client.force_authenticate(user=User.objects.create_user(username="client", password="Passcode123"))
+        self.assertEqual(self.search(q="A1234567").status_code, 403)
+
+
+class TypedSubmissionValuesTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="ops", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [
+            {"label": "Income", "type": "number"},
+            {"label": "Born", "type": "date"},
+            {"label": "Consent", "type": "checkbox"},
+            {"label": "Name", "type": "string"},
+        ]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.income, self.born, self.consent, self.name = self.version.fields.order_by("id")
+
+    def submit(self, income, born, consent, name="Ada"):
+        return create_submission(
+            [
+                {"field_id": self.income.id, "value": income},
+                {"field_id": self.born.id, "value": born},
+                {"field_id": self.consent.id, "value": consent},
+                {"field_id": self.name.id, "value": name},
+            ],
+            form=self.form, form_version=self.version, created_by=self.user,
+        )
+
+    def filtered(self, **params):
+        response = self.client.get("/api/submissions/", params)
+        return response.status_code, [item["id"] for item in response.data.get("results", [])]
+
+    def test_typed_columns_filled_from_field_type(self):
+        submission = self.submit("1500.25", "1990-02-01", "Yes")
+        answers = {answer.field_id: answer for answer in submission.submission_data.all()}
+
+        self.assertEqual(answers[self.income.id].value_number, Decimal("1500.25"))
+        self.assertEqual(answers[self.born.id].value_date, date(1990, 2, 1))
+        self.assertIs(answers[self.consent.id].value_boolean, True)
+        name = answers[self.name.id]
+        self.assertEqual((name.value_number, name.value_date, name.value_boolean), (None, None, None))
+
+    def test_list_filters_on_typed_columns(self):
+        low = self.submit("500", "1990-01-01", "false")
+        middle = self.submit("1500", "1985-06-30", "true")
+        self.submit("7000", "2001-12-31", "true", name="Grace")
+
+        self.assertEqual(self.filtered(field=self.income.id, gte="1000", lt="5000"), (200, [middle.id]))
+        self.assertEqual(self.filtered(field=self.born.id, lt="1990-01-02"), (200, [middle.id, low.id]))
+        self.assertEqual(self.filtered(field=self.consent.id, eq="no"), (200, [low.id]))
+        self.assertEqual(len(self.filtered(field=self.name.id, eq="Ada")[1]), 2)
+        self.assertEqual(self.filtered(field=self.income.id, gte="lots")[0], 400)
+        self.assertEqual(self.filtered(field=self.name.id, gte="A")[0], 400)
+
+    def test_range_uses_typed_index(self):
+        plan = ClientSubmissionData.objects.filter(field=self.income, value_number__gte=1000).explain()
+        self.assertIn("data_field_number_idx", plan)
+
+    def test_migration_backfills_typed_columns(self):
+        self.submit("42", "2000-01-01", "on")
+        ClientSubmissionData.objects.update(value_number=None, value_date=None, value_boolean=None)
+
+        migration = importlib.import_module("onboarding.migrations.0008_typed_submission_values")
+        migration.backfill_typed_values(apps, None)
+
+        self.assertEqual(ClientSubmissionData.objects.get(field=self.income).value_number, Decimal(42))
+        self.assertEqual(ClientSubmissionData.objects.get(field=self.born).value_date, date(2000, 1, 1))
+        self.assertIs(ClientSubmissionData.objects.get(field=self.consent).value_boolean, True)
+
+
+@mock.patch("onboarding.views.audit_buffer")
+class SubmissionDocumentStorageTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(username="staff", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [
+            {"label": "Name", "type": "string", "searchable": True},
+            {"label": "Income", "type": "number"},
+            {"label": "Consent", "type": "boolean"},
+        ]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.name, self.income, self.consent = self.version.fields.order_by("id")
+
+    def submit(self, name, income, consent="yes"):
+        response = self.client.post("/api/submissions/", {
+            "form": self.form.id,
+            "form_version": self.version.id,
+            "created_by": self.user.id,
+            "submission_data": [
+                {"field": self.name.id, "value": name},
+                {"field": self.income.id, "value": income},
+                {"field": self.consent.id, "value": consent},
+            ],
+        }, format="json")
+        self.assertEqual(response.status_code, 201)
+        return ClientSubmission.objects.get(pk=response.data["id"])
+
+    def answers(self, submission):
+        return self.client.get(f"/api/submissions/{submission.id}/").data["submission_data"]
+
+    def filtered(self, **params):
+        return sorted(item["id"] for item in self.client.get("/api/submissions/", params).data["results"])
+
+    def test_document_output_matches_rows(self, audit):
+        rows = self.submit("Ada", "1500")
+        with override_settings(SUBMISSION_STORAGE="document"):
+            document = self.submit("Ada", "1500")
+
+        self.assertIsNone(rows.answers)
+        self.assertEqual(document.answers, {str(self.name.id): "Ada", str(self.income.id): "1500", str(self.consent.id): "yes"})
+        self.assertFalse(document.submission_data.exists())
+        self.assertEqual(self.answers(document), self.answers(rows))
+        listed = {item["id"]: item["submission_data"] for item in self.client.get("/api/submissions/").data["results"]}
+        self.assertEqual(listed[document.id], listed[rows.id])
+        exported = {row[0]: row[3] for row in iter_submission_rows(self.version)}
+        self.assertEqual(exported[document.id], exported[rows.id])
+
+    def test_convert_between_layouts(self, audit):
+        submission = self.submit("Ada", "1500")
+        before = self.answers(submission)
+
+        call_command("convert_submission_storage", "--to", "document", stdout=io.StringIO())
+        submission.refresh_from_db()
+        self.assertEqual(len(submission.answers), 3)
+        self.assertFalse(ClientSubmissionData.objects.exists())
+        self.assertEqual(self.answers(submission), before)
+
+        call_command("convert_submission_storage", "--to", "rows", stdout=io.StringIO())
+        submission.refresh_from_db()
+        self.assertIsNone(submission.answers)
+        self.assertEqual(ClientSubmissionData.objects.get(field=self.income).value_number, Decimal(1500))
+        self.assertEqual(self.answers(submission), before)
+
+    def test_out_of_range_numbers_never_match_in_either_layout(self, audit):
+        rows = self.submit("Grace", "1e30")
+        with override_settings(SUBMISSION_STORAGE="document"):
+            document = self.submit("Ada", "1e30")
+            self.submit("Linus", "1500")
+
+        self.assertIsNone(ClientSubmissionData.objects.get(submission=rows, field=self.income).value_number)
+        self.assertNotIn(str(self.income.id), document.typed_answers)
+        for lookup in ("gte", "lte"):
+            matched = self.filtered(field=self.income.id, **{lookup: "0"})
+            self.assertNotIn(rows.id, matched)
+            self.assertNotIn(document.id, matched)
+        self.assertEqual(len(self.filtered(field=self.income.id, gte="1000")), 1)
+
+        call_command("convert_submission_storage", "--to", "document", stdout=io.StringIO())
+        rows.refresh_from_db()
+        self.assertEqual(rows.typed_answers, {str(self.consent.id): "true"})
+
+    def test_filters_search_and_stats_cover_documents(self, audit):
+        rows = self.submit("Grace", "2000", consent="no")
+        with override_settings(SUBMISSION_STORAGE="document"):
+            low = self.submit("Ada", "500")
+            high = self.submit("Linus", "1500")
+
+        self.assertEqual(self.filtered(field=self.income.id, gte="1000"), sorted([rows.id, high.id]))
+        self.assertEqual(self.filtered(field=self.consent.id, eq="true"), sorted([low.id, high.id]))
+        self.assertEqual(self.filtered(field=self.name.id, eq="Ada"), [low.id])
+        self.assertEqual(high.typed_answers, {str(self.income.id): "1500.0000000000", str(self.consent.id): "true"})
+        self.assertEqual([entry.submission_id for entry in search_answers("linus")], [high.id])
+        stats = form_stats(self.form, self.version)
+        self.assertEqual(stats["submissions"], 3)
+        self.assertEqual([field["filled"] for field in stats["fields"]["fields"]], [3, 3, 3])
+
+
+@mock.patch("onboarding.views.audit_buffer")
+class IdempotentSubmissionTestCase(TestCase):
+    def setUp(self):
+        idempotency._responses.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="mobile", password="Passcode123")
+        self.client.force_authenticate(user=self.user)
+        schema = [{"title": "Details", "fields": [{"label": "Name", "type": "string", "required": True}]}]
+        self.form = Forms.objects.create(name="KYC", schema=schema, created_by=self.user)
+        self.version = publish_form_version(self.form)
+        self.field = self.version.fields.get()
+
+    def post(self, key, name="Ada"):
+        return self.client.post("/api/submissions/", {
+            "form": self.form.id,
+            "form_version": self.version.id,
+            "created_by": self.user.id,
+            "submission_data": [{"field": self.field.id, "value": name}],
+        }, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def hold_key(self, key, **fields):
+        now = timezone.now()
+        fields = {"fingerprint": "0" * 64, "locked_at": now, "expires_at": now + timedelta(days=1), **fields}
+        return IdempotencyKey.objects.create(user=self.user, key=key, **fields)
+
+    def test_retry_replays_first_response(self, audit):
+        first = self.post("retry-1")
+        with self.captureOnCommitCallbacks() as callbacks:
+            retry = self.post("retry-1")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(callbacks, [])
+        self.assertEqual(ClientSubmission.objects.count(), 1)
+
+        # Evicted from the local cache: replayed from the stored record
+        idempotency._responses.clear()
+        retry = self.post("retry-1")
+        self.assertEqual((retry.status_code, retry.data["id"]), (201, first.data["id"]))
+        self.assertEqual(ClientSubmission.objects.count(), 1)
+
+    def test_key_reused_with_other_body_is_rejected(self, audit):
+        self.post("retry-1")
+        idempotency._responses.clear()
+        self.assertEqual(self.post("retry-1", name="Grace").status_code, 422)
+        self.assertEqual(self.post("retry-2", name="Grace").status_code, 201)
+
+    def test_concurrent_retry_waits_for_first_request(self, audit):
+        self.hold_key("retry-1")
+
+        response = self.post("retry-1")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(ClientSubmission.objects.count(), 0)
+
+    def test_abandoned_and_expired_keys_are_taken_over(self, audit):
+        past = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT + 1)
+        self.hold_key("abandoned", locked_at=past)
+        self.hold_key("expired", status_code=201, response={"id": 0}, expires_at=past)
+
+        self.assertEqual(self.post("abandoned").status_code, 201)
+        self.assertEqual(self.post("expired", name="Grace").data["submission_data"][0]["value"], "Grace")
+        self.assertEqual(ClientSubmission.objects.count(), 2)
+
+    def test_request_whose_lock_was_taken_over_is_rolled_back(self, audit):
+        perform_create = ClientSubmissionViewSet.perform_create
+
+        def slow_create(view, serializer):
+            perform_create(view, serializer)
+            # A retry takes the lock over while this request is still running
+            IdempotencyKey.objects.update(locked_at=timezone.now() + timedelta(seconds=1))
+
+        with mock.patch.object(ClientSubmissionViewSet, "perform_create", slow_create):
+            response = self.post("retry-1")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ClientSubmission.objects.exists())
+        self.assertIsNone(IdempotencyKey.objects.get().status_code)
+
+    def test_finished_key_is_not_taken_over_as_abandoned(self, audit):
+        first = self.post("retry-1")
+        idempotency._responses.clear()
+        IdempotencyKey.objects.update(locked_at=timezone.now() - timedelta(days=1))
+
+        retry = self.post("retry-1")
+
+        self.assertEqual((retry.status_code, retry.data["id"]), (201, first.data["id"]))
+        self.assertEqual(ClientSubmission.objects.count(), 1)
+
+    def test_failed_request_releases_key(self, audit):
+        response = self.post("retry-1", name="")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post("retry-1").status_code, 201)
+
+    def test_purge_removes_expired_keys(self, audit):
+        self.hold_key("old", expires_at=timezone.now() - timedelta(seconds=1))
+        self.hold_key("fresh")
+
+        call_command("purge_idempotency_keys", stdout=io.StringIO())
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["fresh"])
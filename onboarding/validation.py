@@ -0,0 +1,264 @@
+import logging
+import re
+from datetime import date
+from decimal import Context, Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .cache import LocalLRU
+from .versioning import is_sectioned, resolve_schema
+
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = {"true", "1", "yes", "on"}
+FALSE_VALUES = {"false", "0", "no", "off"}
+
+
+def check_string(spec):
+    max_length = spec.get("maxLength") or spec.get("max_length")
+    pattern = spec.get("pattern")
+    try:
+        regex = re.compile(pattern) if pattern else None
+    except (re.error, TypeError):
+        # Schemas are checked when saved (schema_errors); older ones may not be
+        logger.warning("Invalid pattern %r in form schema field %r", pattern, spec.get("label"))
+        return lambda value: "This field's pattern in the form schema is invalid."
+
+    def check(value):
+        if max_length and len(value) > int(max_length):
+            return f"Ensure this value has at most {max_length} characters."
+        if regex and not regex.fullmatch(value):
+            return "Enter a value in the expected format."
+    return check
+
+
+def check_number(spec):
+    integer = spec.get("type") == "integer"
+    minimum, maximum = spec.get("min"), spec.get("max")
+    minimum = Decimal(str(minimum)) if minimum is not None else None
+    maximum = Decimal(str(maximum)) if maximum is not None else None
+
+    def check(value):
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            return "Enter a valid number."
+        if not number.is_finite():
+            return "Enter a valid number."
+        if integer and number != number.to_integral_value():
+            return "Enter a whole number."
+        if minimum is not None and number < minimum:
+            return f"Ensure this value is greater than or equal to {minimum}."
+        if maximum is not None and number > maximum:
+            return f"Ensure this value is less than or equal to {maximum}."
+    return check
+
+
+def check_date(spec):
+    def check(value):
+        try:
+            date.fromisoformat(value)
+        except ValueError:
+            return "Enter a valid date (YYYY-MM-DD)."
+    return check
+
+
+def check_email(spec):
+    def check(value):
+        try:
+            validate_email(value)
+        except ValidationError:
+            return "Enter a valid email address."
+    return check
+
+
+def check_select(spec):
+    choices = set()
+    for option in spec.get("options") or []:
+        if isinstance(option, dict):
+            option = option.get("value", option.get("label"))
+        choices.add(str(option))
+
+    def check(value):
+        if choices and value not in choices:
+            return f"'{value}' is not a valid choice."
+    return check
+
+
+def check_boolean(spec):
+    def check(value):
+        if value.lower() not in TRUE_VALUES | FALSE_VALUES:
+            return "Enter true or false."
+    return check
+
+
+CHECKS = {
+    "string": check_string,
+    "text": check_string,
+    "textarea": check_string,
+    "tel": check_string,
+    "phone": check_string,
+    "number": check_number,
+    "integer": check_number,
+    "date": check_date,
+    "email": check_email,
+    "select": check_select,
+    "radio": check_select,
+    "dropdown": check_select,
+    "boolean": check_boolean,
+    "checkbox": check_boolean,
+}
+
+
+# ClientSubmissionData column holding the parsed answer, per field type
+TYPED_COLUMNS = {
+    "number": "value_number",
+    "integer": "value_number",
+    "date": "value_date",
+    "boolean": "value_boolean",
+    "checkbox": "value_boolean",
+}
+
+# value_number is DECIMAL(30, 10)
+NUMBER_PLACES = Decimal(1).scaleb(-10)
+NUMBER_LIMIT = Decimal(10) ** 20
+NUMBER_CONTEXT = Context(prec=30)
+
+
+def parse_typed(field_type, value):
+    """Parsed ``value`` for the typed column of ``field_type``, or None.
+
+    None when the type has no typed column or the text doesn't parse (or a
+    number doesn't fit the column); the raw text is always kept in ``value``.
+    """
+    column = TYPED_COLUMNS.get(field_type)
+    if column is None or value is None:
+        return None
+    value = str(value).strip()
+    try:
+        if column == "value_number":
+            number = Decimal(value)
+            if not number.is_finite() or abs(number) >= NUMBER_LIMIT:
+                return None
+            return number.quantize(NUMBER_PLACES, context=NUMBER_CONTEXT)
+        if column == "value_date":
+            return date.fromisoformat(value)
+    except (InvalidOperation, ValueError):
+        return None
+    lowered = value.lower()
+    if lowered in TRUE_VALUES:
+        return True
+    if lowered in FALSE_VALUES:
+        return False
+    return None
+
+
+def typed_columns(field_type, value):
+    """``{column: parsed value}`` to store alongside the raw text of an answer."""
+    column = TYPED_COLUMNS.get(field_type)
+    return {column: parse_typed(field_type, value)} if column else {}
+
+
+class CompiledValidator:
+    """Checks a whole submission against one form version in a single pass.
+
+    Built once per version by ``compile_schema``; ``validate`` only runs the
+    prepared per-field checks.
+    """
+
+    def __init__(self, fields, field_types=None):
+        # [(field_id, required, check or None)]
+        self.fields = fields
+        self.field_ids = frozenset(field_id for field_id, _, _ in fields)
+        # {field_id: field type}, to fill the typed value columns
+        self.field_types = field_types or {}
+
+    def validate(self, answers):
+        """Validate ``{field_id: value}`` and return ``{field_id: [errors]}``.
+
+        Empty values count as unanswered. Unknown field ids are reported too.
+        """
+        errors = {}
+        for field_id in answers.keys() - self.field_ids:
+            errors[field_id] = ["Unknown field for this form version."]
+        for field_id, required, check in self.fields:
+            value = answers.get(field_id)
+            if value is None or value == "":
+                if required:
+                    errors[field_id] = ["This field is required."]
+                continue
+            if check is not None:
+                message = check(str(value))
+                if message:
+                    errors[field_id] = [message]
+        return errors
+
+
+def compile_schema(fields):
+    """Compile ``[(field_id, spec), ...]`` where ``spec`` is the schema field dict."""
+    compiled = []
+    for field_id, spec in fields:
+        factory = CHECKS.get(spec.get("type"))
+        compiled.append((field_id, bool(spec.get("required", False)), factory(spec) if factory else None))
+    return CompiledValidator(compiled, {field_id: spec.get("type") for field_id, spec in fields})
+
+
+def schema_fields(schema):
+    return [field for section in schema or [] for field in section.get("fields", [])]
+
+
+def schema_errors(schema):
+    """Problems in ``schema`` that would stop its submissions from validating.
+
+    Checked when a form or version is saved, so a bad ``pattern`` is
+    reported to its author instead of failing every submission.
+    """
+    if not is_sectioned(schema):
+        return []
+    errors = []
+    for field in schema_fields(schema):
+        pattern = field.get("pattern") if isinstance(field, dict) else None
+        if not pattern:
+            continue
+        try:
+            re.compile(pattern)
+        except (re.error, TypeError) as exc:
+            errors.append(f"Field '{field.get('label')}': invalid pattern ({exc}).")
+    return errors
+
+
+def compile_validator(form_version):
+    """Pair each FormField of the version with its schema entry and compile them.
+
+    Fields are linked at their position in the flattened schema, so the two
+    line up. If they do not, the FormField columns alone are used.
+    """
+    rows = list(
+        form_version.field_links.order_by("position")
+        .values_list("field_id", "field__field_type", "field__required")
+    )
+    specs = schema_fields(resolve_schema(form_version))
+    if len(specs) != len(rows):
+        specs = [{} for _ in rows]
+    return compile_schema([
+        (field_id, {**spec, "type": field_type, "required": required})
+        for (field_id, field_type, required), spec in zip(rows, specs)
+    ])
+
+
+_validators = LocalLRU(settings.FORM_VALIDATOR_CACHE_SIZE)
+
+
+def get_validator(form_version):
+    """Compiled validator for ``form_version``, compiled at most once per schema and process."""
+    # created_at guards against SQLite handing a deleted version's id to a new
+    # row; schema_hash changes when the version's schema is edited
+    key = (form_version.pk, form_version.created_at, form_version.schema_hash)
+    validator = _validators.get(key)
+    if validator is None:
+        validator = compile_validator(form_version)
+        _validators.set(key, validator)
+    return validator
@@ -0,0 +1,89 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), cls=DjangoJSONEncoder)
+
+
+def schema_hash(schema):
+    """Content hash of a whole schema, stored on its FormVersion."""
+    return hashlib.sha256(canonical_json(schema).encode()).hexdigest()
+
+
+def field_hash(field):
+    """Content hash of one schema field; equal fields can share a FormField row."""
+    return hashlib.sha256(canonical_json(field).encode()).hexdigest()
+
+
+def is_sectioned(schema):
+    return isinstance(schema, list) and all(
+        isinstance(section, dict) and isinstance(section.get("fields", []), list) for section in schema
+    )
+
+
+def diff_schema(base, schema):
+    """Structural diff that rebuilds ``schema`` from ``base``.
+
+    Sections are listed in ``schema`` order, each either the index of an
+    identical section of ``base`` or ``{"section": <keys other than fields>,
+    "fields": [...]}`` where every field is the index of an identical field
+    in ``base`` (flattened over all sections) or ``{"field": <new field>}``.
+    A section without a ``fields`` key has none in the diff either. Schemas
+    that are not lists of sections diff to ``{"schema": schema}``.
+    """
+    if not (is_sectioned(base) and is_sectioned(schema)):
+        return {"schema": schema}
+
+    sections = {}
+    for index, section in enumerate(base):
+        sections.setdefault(canonical_json(section), index)
+    fields = {}
+    for index, field in enumerate(field for section in base for field in section.get("fields", [])):
+        fields.setdefault(canonical_json(field), index)
+
+    diff = []
+    for section in schema:
+        index = sections.get(canonical_json(section))
+        if index is not None:
+            diff.append(index)
+            continue
+        item = {"section": {key: value for key, value in section.items() if key != "fields"}}
+        if "fields" in section:
+            item["fields"] = [
+                fields.get(canonical_json(field), {"field": field}) for field in section["fields"]
+            ]
+        diff.append(item)
+    return {"sections": diff}
+
+
+def apply_diff(base, diff):
+    """Inverse of ``diff_schema``: rebuild the schema from ``base`` and ``diff``."""
+    if "schema" in diff:
+        return diff["schema"]
+    base_fields = [field for section in base for field in section.get("fields", [])]
+    schema = []
+    for item in diff["sections"]:
+        if isinstance(item, int):
+            schema.append(base[item])
+            continue
+        section = dict(item["section"])
+        if "fields" in item:
+            section["fields"] = [
+                base_fields[field] if isinstance(field, int) else field["field"] for field in item["fields"]
+            ]
+        schema.append(section)
+    return schema
+
+
+def resolve_schema(version):
+    """Full schema of a FormVersion: its snapshot, or its base plus its diff.
+
+    Uncached; ``schema_cache.get_schema`` keeps the result of this per
+    version. Load versions with ``select_related("base")`` to avoid a query.
+    """
+    if version.schema is not None or version.schema_diff is None:
+        return version.schema
+    return apply_diff(version.base.schema, version.schema_diff)
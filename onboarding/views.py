@@ -1,13 +1,32 @@
 from django.shortcuts import render
 from rest_framework import viewsets,generics
-from .models import Forms, FormVersion, ClientSubmission, NotificationSettings,FormField,SystemLogs
+from .models import Forms, FormVersion, ClientSubmission, ClientSubmissionData, NotificationSettings,FormField,SystemLogs
 from .serializers import FormsSerializer, FormVersionSerializer, ClientSubmissionSerializer, NotificationSettingsSerializer,RegisterSerializer,SystemLogsSerializer,CustomTokenObtainPairSerializer
 from rest_framework.permissions import DjangoModelPermissions, IsAuthenticated, AllowAny
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .tasks import send_log_notification
+from .audit import audit_buffer
+from .services import publish_form_version, detach_version
+from .analytics import count_submissions, form_stats
+from .search import normalize_value, search_answers
+from .storage import answer_rows, document_answer
+from .idempotency import idempotent_response
+from .validation import TYPED_COLUMNS, parse_typed
+from rest_framework.exceptions import ValidationError
+from .versioning import diff_schema, schema_hash
+from .imports import SubmissionImporter, ImportFormatError, get_row_reader, iter_text_lines
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from .exports import EXPORT_FORMATS, stream_export
+from .pagination import SubmissionCursorPagination, FormVersionCursorPagination
+from .cache import schema_cache, etag_matches, compute_etag
+from .retention import read_logs, decode_cursor
+from rest_framework.utils.urls import replace_query_param
+from django.db import transaction
+from django.db.models import Q
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from backend.db_router import ReplicaReadsMixin, primary_reads
 
 
 
@@ -20,19 +39,28 @@ User = get_user_model()
 # Create your views here.
 
 def log_action(user, action, obj, message=""):
-    log = SystemLogs.objects.create(
+    log = SystemLogs(
         user=user,
         action=action,
         object_type=obj.__class__.__name__.upper(),
         object_id=str(obj.id),
         message=message or f"{action} {obj.__class__.__name__} {obj}"
     )
-    send_log_notification.delay(
-        user.id,
-        "New Log Entry",
-        log.message,
-        str(log.created_at)
-    )
+    # Not a column: carried to the notification so subscribers can filter by form
+    log.form_id = obj.id if isinstance(obj, Forms) else getattr(obj, "form_id", None)
+    # Written in batches by the audit buffer once the request's own
+    # transaction has committed; nothing is logged if it rolls back.
+    transaction.on_commit(lambda: audit_buffer.add(log))
+
+def etag_response(request, data, etag):
+    """Return 304 when the client already holds ``etag``, else the data with its ETag."""
+    if etag_matches(request, etag):
+        response = Response(status=304)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -40,123 +68,283 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-class FormsViewSet(viewsets.ModelViewSet):
+class FormsViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = Forms.objects.all()
     serializer_class = FormsSerializer
     permission_classes = [DjangoModelPermissions]
+
+    def get_queryset(self):
+        return super().get_queryset().with_version_numbers()
     
     def perform_create(self, serializer):
-        # Save the form
-        form = serializer.save(created_by=self.request.user)
-        
-        # Create initial version
-        version = FormVersion.objects.create(
-            form=form,
-            version=1,
-            schema=form.schema,
-            is_active=True
-        )
-        
-        # Create fields for this version only
-        for section in form.schema:
-            for field in section.get("fields", []):
-                FormField.objects.create(
-                    form_version=version,
-                    name=field.get("label"),
-                    field_type=field.get("type"),
-                    required=field.get("required", False)
-                )
+        with transaction.atomic():
+            # Save the form and its initial version with all fields
+            form = serializer.save(created_by=self.request.user)
+            version = publish_form_version(form)
         
+        form.latest_version_number = form.active_version_number = version.version
         log_action(self.request.user, "CREATE", form, message=f"Created form {form.name}")
     
     def perform_update(self, serializer):
-        # Save form update
-        form = serializer.save()
-        
-        # Get latest version number
-        last_version = FormVersion.objects.filter(form=form).order_by('-version').first()
-        new_version_number = (last_version.version + 1) if last_version else 1
+        with transaction.atomic():
+            # Save form update and snapshot it as the new active version
+            form = serializer.save()
+            version = publish_form_version(form)
         
-        # Deactivate old versions
-        FormVersion.objects.filter(form=form).update(is_active=False)
-        
-        # Create new version
-        version = FormVersion.objects.create(
-            form=form,
-            version=new_version_number,
-            schema=form.schema,
-            is_active=True
-        )
-        
-        # REMOVED THESE TWO LINES - they were causing the error:
-        # form.version = new_version_number
-        # form.save(update_fields=['version'])
-        
-        # Create fields for this new version only
-        for section in form.schema:
-            for field in section.get("fields", []):
-                FormField.objects.create(
-                    form_version=version,
-                    name=field.get("label"),
-                    field_type=field.get("type"),
-                    required=field.get("required", False)
-                )
-        
-        log_action(self.request.user, "UPDATE", form, message=f"Updated form {form.name} to version {new_version_number}")
+        # The instance was annotated before the new version existed
+        form.latest_version_number = form.active_version_number = version.version
+        log_action(self.request.user, "UPDATE", form, message=f"Updated form {form.name} to version {version.version}")
     
     def perform_destroy(self, instance):
         log_action(self.request.user, "DELETE", instance, message=f"Deleted form {instance.name}")
+        form_id = instance.id
+        version_numbers = list(instance.versions.values_list('version', flat=True))
         instance.delete()
+        transaction.on_commit(lambda: schema_cache.forget_form(form_id, version_numbers))
+
+    def retrieve(self, request, *args, **kwargs):
+        entry = schema_cache.get_detail(self.kwargs['pk'])
+        if entry is None:
+            # Every client is served this entry, so it comes from the primary
+            with primary_reads():
+                instance = self.get_object()
+                data = dict(self.get_serializer(instance).data)
+            entry = schema_cache.set_detail(self.kwargs['pk'], data)
+        return etag_response(request, entry['data'], entry['etag'])
     
     # Optional: Add these endpoints to view version history
     @action(detail=True, methods=['get'])
     def versions(self, request, pk=None):
-        """Get all versions of a specific form
-        GET /api/forms/{id}/versions/
+        """Version history of a form, newest first, one page at a time
+        GET /api/forms/{id}/versions/?page_size=20&cursor=...
+        Schemas are left out; each version has its schema_hash and
+        field_count. Fetch a schema with version_detail, or add
+        ?include=schema, or ?diff=true (each version as a diff against the
+        next older one on the page; the oldest on the page carries its schema).
         """
         form = self.get_object()
-        versions = form.versions.order_by('-version')
-        
-        data = [{
-            'version': v.version,
-            'is_active': v.is_active,
-            'created_at': v.created_at,
-            'schema': v.schema
-        } for v in versions]
-        
-        return Response(data)
+        as_diff = request.query_params.get('diff') in ('1', 'true')
+        with_schema = as_diff or request.query_params.get('include') == 'schema'
+        versions = form.versions.only('id', 'form_id', 'version', 'is_active', 'created_at', 'schema_hash', 'field_count')
+        if with_schema:
+            versions = form.versions.select_related('base')
+
+        paginator = FormVersionCursorPagination()
+        page = paginator.paginate_queryset(versions, request, view=self)
+        schemas = [schema_cache.get_schema(v) for v in page] if with_schema else []
+
+        data = []
+        for index, v in enumerate(page):
+            item = {
+                'version': v.version,
+                'is_active': v.is_active,
+                'created_at': v.created_at,
+                'schema_hash': v.schema_hash,
+                'field_count': v.field_count,
+            }
+            if as_diff and index + 1 < len(page):
+                item['diff_from'] = page[index + 1].version
+                item['diff'] = diff_schema(schemas[index + 1], schemas[index])
+            elif with_schema:
+                item['schema'] = schemas[index]
+            data.append(item)
+
+        return paginator.get_paginated_response(data)
     
     @action(detail=True, methods=['get'])
     def version_detail(self, request, pk=None):
         """Get a specific version
         GET /api/forms/{id}/version_detail/?version=2
+        GET /api/forms/{id}/version_detail/?version=5&diff_from=3  (the changes
+        from version 3 as a structural diff, see onboarding.versioning)
+        Supports If-None-Match; repeat loads are served from the schema cache.
         """
-        form = self.get_object()
         version_number = request.query_params.get('version')
         
         if not version_number:
             return Response({'error': 'version parameter required'}, status=400)
         
+        entry = self.get_version_entry(pk, version_number)
+        if entry is None:
+            return Response({'error': 'Version not found'}, status=404)
+
+        diff_from = request.query_params.get('diff_from')
+        if diff_from:
+            base = self.get_version_entry(pk, diff_from)
+            if base is None:
+                return Response({'error': 'Version not found'}, status=404)
+            data = {
+                'version': entry['data']['version'],
+                'diff_from': base['data']['version'],
+                'diff': diff_schema(base['data']['schema'], entry['data']['schema']),
+            }
+            return etag_response(request, data, compute_etag(data))
+
+        is_active = entry['data']['version'] == schema_cache.get_active_version(pk)
+        etag = entry['etag'][:-1] + ('-active"' if is_active else '"')
+        return etag_response(request, {**entry['data'], 'is_active': is_active}, etag)
+    
+    def get_version_entry(self, pk, version_number):
+        """Schema cache entry of one version of this form, or None if it doesn't exist."""
+        entry = schema_cache.get_version(pk, version_number)
+        if entry is None:
+            with primary_reads():
+                form = self.get_object()
+                try:
+                    version = form.versions.select_related('base').get(version=version_number)
+                except (FormVersion.DoesNotExist, ValueError):
+                    return None
+                entry = schema_cache.set_version(version)
+        return entry
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Submission analytics of a form, read from the counter tables
+        GET /api/forms/{id}/stats/?version=2&days=30
+        Totals per version, per day over the last ``days`` days, the top
+        submitters and field completion rates of ``version`` (default: the
+        active version).
+        """
+        form = self.get_object()
         try:
-            version = form.versions.get(version=version_number)
-            return Response({
-                'version': version.version,
-                'is_active': version.is_active,
-                'created_at': version.created_at,
-                'schema': version.schema
-            })
-        except FormVersion.DoesNotExist:
+            days = max(1, min(int(request.query_params.get('days', 30)), 366))
+            version_number = request.query_params.get('version')
+            versions = form.versions.filter(version=int(version_number)) if version_number else form.versions.filter(is_active=True)
+        except ValueError:
+            return Response({'error': 'version and days must be integers'}, status=400)
+        return Response(form_stats(form, versions.order_by('-version').first(), days=days))
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Stream every submission of a form version, one column per field
+        GET /api/forms/{id}/export/?version=2&output=csv|ndjson
+        """
+        form = self.get_object()
+        version_number = request.query_params.get('version')
+        output = request.query_params.get('output', 'csv')
+
+        if output not in EXPORT_FORMATS:
+            return Response({'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}"}, status=400)
+
+        try:
+            versions = form.versions.filter(version=version_number) if version_number else form.versions.filter(is_active=True)
+            version = versions.order_by('-version').first()
+        except ValueError:
+            version = None
+        if version is None:
             return Response({'error': 'Version not found'}, status=404)
-class FormVersionViewSet(viewsets.ModelViewSet):
-    queryset = FormVersion.objects.all()
+
+        response = StreamingHttpResponse(stream_export(version, output), content_type=EXPORT_FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="form-{form.id}-v{version.version}.{output}"'
+        return response
+class FormVersionViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
+    queryset = FormVersion.objects.select_related('base')
     serializer_class = FormVersionSerializer
     permission_classes = [DjangoModelPermissions]
 
+    # Versions are meant to be immutable; if one is edited here anyway,
+    # versions diffed against it are made snapshots first, and its cached
+    # schema, the active version and the form payload are dropped. Other
+    # processes miss their local copy since the version's token changes.
+    def perform_create(self, serializer):
+        version = serializer.save(schema_hash=schema_hash(serializer.validated_data.get('schema')))
+        transaction.on_commit(lambda: schema_cache.invalidate_form(version.form_id))
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            detach_version(serializer.instance)
+            if 'schema' in serializer.validated_data:
+                # A new schema_hash also retires the compiled validator of the old schema
+                version = serializer.save(
+                    base=None, schema_diff=None, schema_hash=schema_hash(serializer.validated_data['schema'])
+                )
+            else:
+                version = serializer.save()
+        transaction.on_commit(lambda: schema_cache.forget_form(version.form_id, [version.version]))
+
+    def perform_destroy(self, instance):
+        form_id, number = instance.form_id, instance.version
+        with transaction.atomic():
+            detach_version(instance)
+            instance.delete()
+        transaction.on_commit(lambda: schema_cache.forget_form(form_id, [number]))
+
 class ClientSubmissionViewSet(viewsets.ModelViewSet):
     queryset = ClientSubmission.objects.all()
     serializer_class = ClientSubmissionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = SubmissionCursorPagination
+    # Comparisons accepted by ?field=<id> answer filters
+    ANSWER_LOOKUPS = ('eq', 'gt', 'gte', 'lt', 'lte')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Answers only carry the field id, so prefetching the data rows is
+        # enough; skip even that when ?fields= leaves submission_data out.
+        requested = self.get_serializer().get_requested_fields()
+        if requested is None or 'submission_data' in requested:
+            queryset = queryset.prefetch_related('submission_data')
+        if self.action == 'list' and self.request.query_params.get('field'):
+            queryset = self.filter_by_answer(queryset)
+        return queryset
 
+    def filter_by_answer(self, queryset):
+        """Keep submissions whose answer to ?field=<id> matches eq/gt/gte/lt/lte
+        GET /api/submissions/?field=12&gte=1000&lt=5000
+        Number, date and boolean fields compare their typed column, a range
+        scan on its (field, value) index; other fields only support eq on
+        the raw text. Document submissions compare the same parsed values,
+        kept in typed_answers, without an index.
+        """
+        params = self.request.query_params
+        try:
+            field_id = int(params['field'])
+        except ValueError:
+            raise ValidationError({'field': 'Field not found.'})
+        field = FormField.objects.filter(pk=field_id).values_list('field_type', 'form_version__form_id').first()
+        if field is None:
+            raise ValidationError({'field': 'Field not found.'})
+        field_type, form_id = field
+
+        column = TYPED_COLUMNS.get(field_type)
+        lookups = {}
+        for lookup in self.ANSWER_LOOKUPS:
+            raw = params.get(lookup)
+            if raw is None:
+                continue
+            if column is None:
+                if lookup != 'eq':
+                    raise ValidationError({lookup: f"'{field_type}' fields only support eq."})
+                lookups[lookup] = raw
+                continue
+            value = parse_typed(field_type, raw)
+            if value is None:
+                raise ValidationError({lookup: f"Enter a valid {field_type} value."})
+            lookups[lookup] = value
+
+        def conditions(target):
+            return {target if lookup == 'eq' else f'{target}__{lookup}': value for lookup, value in lookups.items()}
+
+        rows = {'field_id': field_id, **conditions(column or 'value')}
+        if not ClientSubmission.objects.filter(form_id=form_id, answers__isnull=False).exists():
+            # One filter() call, so every condition applies to the same answer row
+            return queryset.filter(**{f'submission_data__{key}': value for key, value in rows.items()})
+        return queryset.alias(document_answer=document_answer(field_id, column)).filter(
+            Q(pk__in=ClientSubmissionData.objects.filter(**rows).values('submission_id'))
+            | Q(document_answer__isnull=False, **conditions('document_answer'))
+        )
+
+    def create(self, request, *args, **kwargs):
+        """Create a submission
+        POST /api/submissions/ with an optional Idempotency-Key header: a retry
+        with the same key and body gets the first response back (with
+        Idempotent-Replayed: true) instead of creating a duplicate.
+        """
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return super().create(request, *args, **kwargs)
+        create = super().create
+        return idempotent_response(request, key, lambda: create(request, *args, **kwargs))
 
     def perform_create(self, serializer):
         submission = serializer.save(created_by=self.request.user)
@@ -164,7 +352,84 @@ class ClientSubmissionViewSet(viewsets.ModelViewSet):
     
     def perform_destroy(self, instance):
         log_action(self.request.user, "NOTIFY", instance, message=f"Client Deleted: {instance.form.name}")
-        instance.delete()
+        with transaction.atomic():
+            count_submissions([instance], answer_rows(instance), sign=-1)
+            instance.delete()
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Find submissions by an answer to a searchable field
+        GET /api/submissions/search/?q=0712345678&match=exact|prefix&form=3&field=12&limit=20
+        Values and queries are compared case-folded without spaces, dashes or
+        brackets (see onboarding.search).
+        """
+        if not request.user.has_perm('onboarding.view_clientsubmission'):
+            return Response({'error': 'You do not have permission to search submissions.'}, status=403)
+
+        query = request.query_params.get('q', '')
+        prefix = request.query_params.get('match', 'exact') == 'prefix'
+        min_length = settings.SUBMISSION_SEARCH_MIN_PREFIX if prefix else 1
+        if len(normalize_value(query)) < min_length:
+            return Response({'error': f'q must have at least {min_length} characters'}, status=400)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), settings.SUBMISSION_SEARCH_MAX_RESULTS))
+            form_id = int(request.query_params['form']) if request.query_params.get('form') else None
+            field_id = int(request.query_params['field']) if request.query_params.get('field') else None
+        except ValueError:
+            return Response({'error': 'form, field and limit must be integers'}, status=400)
+
+        entries = search_answers(query, prefix=prefix, form_id=form_id, field_id=field_id, limit=limit)
+        return Response({'results': [
+            {
+                'submission': entry.submission_id,
+                'form': entry.form_id,
+                'field': entry.field_id,
+                'field_name': entry.field.name,
+                'value': entry.value,
+            }
+            for entry in entries
+        ]})
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """Import many submissions from a streamed NDJSON or CSV body
+        POST /api/submissions/import/?form_version=3&chunk_size=500
+        """
+        version_id = request.query_params.get('form_version')
+        if not version_id:
+            return Response({'error': 'form_version parameter required'}, status=400)
+
+        try:
+            form_version = FormVersion.objects.select_related('form').get(pk=version_id)
+        except (FormVersion.DoesNotExist, ValueError):
+            return Response({'error': 'Form version not found'}, status=404)
+
+        try:
+            read_rows = get_row_reader(request.content_type.split(';')[0].strip())
+            chunk_size = int(request.query_params.get('chunk_size', settings.SUBMISSION_IMPORT_CHUNK_SIZE))
+        except (ImportFormatError, ValueError) as exc:
+            return Response({'error': str(exc)}, status=400)
+
+        if request.stream is None:
+            return Response({'error': 'Request body is empty'}, status=400)
+
+        importer = SubmissionImporter(
+            form_version,
+            request.user,
+            chunk_size=max(1, min(chunk_size, settings.SUBMISSION_IMPORT_MAX_CHUNK_SIZE))
+        )
+        try:
+            report, error = importer.run(read_rows(iter_text_lines(request.stream))), None
+        except ImportFormatError as exc:
+            # Chunks before the bad line are already written
+            report, error = importer.report(), str(exc)
+
+        if report['created']:
+            form = form_version.form
+            log_action(request.user, "SUBMIT", form, message=f"Imported {report['created']} submissions for {form.name}")
+        if error:
+            return Response({'error': error, **report}, status=400)
+        return Response(report)
     
 
 class NotificationSettingsViewSet(viewsets.ModelViewSet):
@@ -177,8 +442,26 @@ class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
     permission_classes = [AllowAny]
 
-class SystemLogsViewSet(viewsets.ModelViewSet):
+class SystemLogsViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = SystemLogs.objects.all()
     serializer_class = SystemLogsSerializer
     permission_classes = [DjangoModelPermissions]   
 
+    def list(self, request, *args, **kwargs):
+        """Newest first across the hot table and archived months
+        GET /api/system-logs/?page_size=50&cursor=...
+        """
+        try:
+            cursor = request.query_params.get('cursor')
+            cursor = decode_cursor(cursor) if cursor else None
+            page_size = int(request.query_params.get('page_size', settings.SYSTEM_LOGS_PAGE_SIZE))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=400)
+
+        page_size = max(1, min(page_size, settings.SYSTEM_LOGS_MAX_PAGE_SIZE))
+        rows, next_cursor = read_logs(page_size, cursor)
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+        return Response({'next': next_url, 'results': rows})
+